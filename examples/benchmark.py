@@ -0,0 +1,204 @@
+#!/usr/bin/python
+import sys
+import time
+import json
+import getopt
+import itertools
+import platform
+import threading
+from steppermotor_precise import AutoDRV8825, AutoA4988, SimulatorBackend
+
+# these are the GPIO pins the driver ports are tied to:
+GPIOS = {
+    "enable":23,
+    "step":24,
+    "direction":25,
+    "m0":22,
+    "m1":17,
+    "m2":4
+}
+
+DRIVERS = {"DRV8825": AutoDRV8825, "A4988": AutoA4988}
+
+ABORT_DELAYS = [0.01, 0.05, 0.2]     # seconds after the start of a move to abort it
+
+def print_help():
+    print("benchmark.py -d <driver> -b <backend> -e <engine> -s <steps> -f <frequencies> -a <accel_microsteps> -r <repeat> -o <output>")
+    print("benchmark.py --driver <DRV8825|A4988> --backend <sim|pigpio> --engine <pwm|wave> --steps <int> --frequencies <int,...> --accel_microsteps <int,...> --repeat <int> --output <file>\n")
+    print("<backend> sim runs on the SimulatorBackend in virtual time, pigpio on the pigpio daemon")
+    print("<frequencies> and <accel_microsteps> are comma separated lists to sweep")
+    print("<output> is the JSON results file, - for stdout")
+
+def call_cost(function, repeat):
+    """Returns the mean and minimum wall time (us) of a call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"calls": repeat,
+            "mean_us": sum(times) / repeat * 1000000,
+            "min_us": min(times) * 1000000}
+
+def commands(motor):
+    """Returns the number of commands sent so far, all daemon commands for the
+    simulator and GPIO and PWM commands for pigpio."""
+    if isinstance(motor.gpio, SimulatorBackend):
+        return len(motor.gpio.events)
+    return motor.commands_sent
+
+def measure_move(motor, move):
+    """Runs a move and returns its commands, times and pulse error.
+    A move may consist of several step() calls, their reports are summed."""
+    tracker = motor.tracker
+    sent = commands(motor)
+    pulses = tracker.pulses
+    errors = tracker.errors
+    wall = time.perf_counter()
+    clock = motor.gpio.monotonic()
+    move()
+    wall = time.perf_counter() - wall
+    clock = motor.gpio.monotonic() - clock
+    pulses = tracker.pulses - pulses
+    errors = tracker.errors - errors
+    ideal = pulses / motor.frequency
+    return {"commands": commands(motor) - sent,
+            "pulses": pulses,
+            "counted": pulses + errors,
+            "pulse_error": errors,
+            "ideal_s": ideal,
+            "wall_s": wall,
+            "backend_s": clock,
+            "time_ratio": clock / ideal if ideal else None}
+
+def measure_abort(motor, mode, delay, move):
+    """Aborts a move after delay seconds from another thread (or at that virtual
+    time for the simulator), returns the time from the abort() call to the stop
+    of the pulse output and the reported versus counted pulses."""
+    tracker = motor.tracker
+    pulses = tracker.pulses
+    errors = tracker.errors
+    motor.last_abort = None
+    abort = lambda: motor.abort(mode, wait=False)
+    if isinstance(motor.gpio, SimulatorBackend):
+        motor.gpio.call_at(motor.gpio.monotonic() + delay, abort)
+    else:
+        threading.Timer(delay, abort).start()
+    move()
+    report = motor.last_abort or {}
+    pulses = tracker.pulses - pulses
+    return {"mode": mode,
+            "delay_s": delay,
+            "aborted": bool(report),
+            "latency_s": report.get("latency_s"),
+            "pulses": report.get("pulses"),
+            "counted": pulses + tracker.errors - errors}
+
+if __name__ == "__main__":
+
+    # default values
+    driver = "DRV8825"
+    backend = "sim"
+    engine = "pwm"
+    steps = 400
+    frequencies = [500, 1000, 2000, 4000, 8000]
+    accel_microsteps = [5, 20, 50]
+    repeat = 100
+    output = "benchmark.json"
+    motor = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],"hd:b:e:s:f:a:r:o:",
+                ["driver=","backend=","engine=","steps=","frequencies=",
+                 "accel_microsteps=","repeat=","output="])
+    except getopt.GetoptError:
+        print_help()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print_help()
+            sys.exit()
+        elif opt in ("-d", "--driver"):
+            driver = arg
+        elif opt in ("-b", "--backend"):
+            backend = arg
+        elif opt in ("-e", "--engine"):
+            engine = arg
+        elif opt in ("-s", "--steps"):
+            steps = int(arg)
+        elif opt in ("-f", "--frequencies"):
+            frequencies = [int(f) for f in arg.split(",")]
+        elif opt in ("-a", "--accel_microsteps"):
+            accel_microsteps = [int(a) for a in arg.split(",")]
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    results = {"driver": driver,
+               "backend": backend,
+               "engine": engine,
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "call_cost": {},
+               "step": [],
+               "auto_step": [],
+               "abort": []}
+
+    try:
+        gpio = SimulatorBackend(record_edges=False) if backend == "sim" else None
+        motor = DRIVERS[driver](GPIOS, frequencies[0], accel_microsteps=accel_microsteps[0],
+                                engine=engine, gpio=gpio)
+        motor.track_position()
+        motor.enable(wait=True)
+        sizes = sorted(motor.STEPSIZE)
+
+        # cost per call
+        cycle = itertools.cycle(sizes)
+        results["call_cost"]["set_stepsize"] = call_cost(
+            lambda: motor.set_stepsize(next(cycle)), repeat)
+        results["call_cost"]["set_direction"] = call_cost(
+            lambda: motor.set_direction(not motor.direction), repeat)
+        results["call_cost"]["pulse"] = call_cost(lambda: motor.pulse(1), repeat)
+        results["call_cost"]["step"] = call_cost(lambda: motor.step(1), repeat)
+        results["call_cost"]["auto_step"] = call_cost(
+            lambda: motor.auto_step(2 * sum(sizes) * accel_microsteps[0] + 1,
+                                    stepsize_min=sizes[0], stepsize_max=sizes[-1]), repeat)
+
+        # commands, time and pulse error of moves
+        for frequency in frequencies:
+            for size in sizes:
+                result = measure_move(motor, lambda: motor.step(steps * size, frequency=frequency,
+                                                                stepsize=size))
+                result.update({"frequency": frequency, "actual_frequency": motor.frequency,
+                               "stepsize": size})
+                results["step"].append(result)
+            for microsteps in accel_microsteps:
+                motor.ACCEL_MICROSTEPS = microsteps
+                result = measure_move(motor, lambda: motor.auto_step(
+                    steps, frequency=frequency, stepsize_min=sizes[0], stepsize_max=sizes[-1]))
+                result.update({"frequency": frequency, "actual_frequency": motor.frequency,
+                               "accel_microsteps": microsteps})
+                results["auto_step"].append(result)
+
+        # time from abort() to the stop, for a long move at the highest frequency
+        for mode in motor.ABORT_MODES:
+            for delay in ABORT_DELAYS:
+                result = measure_abort(motor, mode, delay, lambda: motor.auto_step(
+                    steps * 10, frequency=frequencies[-1], stepsize_min=sizes[0],
+                    stepsize_max=sizes[-1]))
+                result.update({"frequency": frequencies[-1], "actual_frequency": motor.frequency})
+                results["abort"].append(result)
+
+        motor.disable()
+    finally:
+        if motor:
+            motor.close()
+
+    if output == "-":
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Benchmark results written to " + output)
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+import sys
+import getopt
+from steppermotor_precise import AutoDRV8825, AutoA4988, SimulatorBackend, MotionServer
+
+# these are the GPIO pins the driver ports are tied to:
+GPIOS = {
+    "enable":23,
+    "step":24,
+    "direction":25,
+    "m0":22,
+    "m1":17,
+    "m2":4
+}
+
+DRIVERS = {"DRV8825": AutoDRV8825, "A4988": AutoA4988}
+
+def print_help():
+    print("motion-server.py -d <driver> -b <backend> -n <name> -p <path> -v <verbosity>")
+    print("motion-server.py --driver <DRV8825|A4988> --backend <sim|pigpio> --name <motor> --path <socket> --verbosity <int>\n")
+    print("<backend> sim runs on the SimulatorBackend in virtual time, pigpio on the pigpio daemon")
+    print("<path> is the Unix socket, defaults to STEPPERMOTOR_SOCKET or /tmp/steppermotor_precise.sock")
+    print("\nClients send batches of requests with MotionClient, e.g.:")
+    print("    async with MotionClient() as client:")
+    print("        moves = [client.send('motor', 'step', steps=10) for _ in range(100)]")
+    print("        await client.flush()")
+    print("        await asyncio.gather(*moves)")
+    print("        print(await client.call('motor', 'position'))")
+
+if __name__ == "__main__":
+
+    # default values
+    driver = "DRV8825"
+    backend = "pigpio"
+    name = "motor"
+    path = None
+    verbosity = 1
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hd:b:n:p:v:",
+                                   ["driver=", "backend=", "name=", "path=", "verbosity="])
+    except getopt.GetoptError:
+        print_help()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print_help()
+            sys.exit()
+        elif opt in ("-d", "--driver"):
+            driver = arg
+        elif opt in ("-b", "--backend"):
+            backend = arg
+        elif opt in ("-n", "--name"):
+            name = arg
+        elif opt in ("-p", "--path"):
+            path = arg
+        elif opt in ("-v", "--verbosity"):
+            verbosity = int(arg)
+
+    gpio = SimulatorBackend(record_edges=False) if backend == "sim" else None
+    server = MotionServer(path, verbosity=verbosity)
+    server.add_motor(name, DRIVERS[driver](GPIOS, 1000, accel_microsteps=50,
+                                           verbosity=verbosity, gpio=gpio))
+    server.run()
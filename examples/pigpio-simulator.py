@@ -1,6 +1,37 @@
 #!/usr/bin/python
 """ Dummy module for pigpio """
+import time
+
 OUTPUT = True
+RISING_EDGE = 0
+WAVE_MODE_ONE_SHOT = 0
+WAVE_MODE_ONE_SHOT_SYNC = 2
+NO_TX_WAVE = 9999
+
+class pulse:
+    """ Dummy class for simulating pigpio waveform pulses """
+
+    def __init__(self, gpio_on, gpio_off, delay):
+        self.gpio_on = gpio_on
+        self.gpio_off = gpio_off
+        self.delay = delay
+
+class _callback:
+    """ Dummy class for simulating a pigpio callback that tallies rising edges """
+
+    def __init__(self, pi, gpio):
+        self.pi = pi
+        self.gpio = gpio
+        self.count = pi.edges.get(gpio, 0)
+
+    def tally(self):
+        return self.pi.edges.get(self.gpio, 0) - self.count
+
+    def reset_tally(self):
+        self.count = self.pi.edges.get(self.gpio, 0)
+
+    def cancel(self):
+        pass
 
 class pi:
     """ Dummy class for simulating pigpio functions """
@@ -8,6 +39,12 @@ class pi:
 
     def __init__(self, *args):
         self.connected = True
+        self.waves = {}
+        self.levels = {}        # GPIO levels after the last waveform
+        self.edges = {}         # number of rising edges per GPIO sent by waveforms
+        self._wave = []
+        self._next_wid = 0
+        self._pwm = {}          # PWM frequency, duty cycle and start time per GPIO
         print("Warning: Loaded dummy pigpio module!")
 
     def stop(self):
@@ -16,11 +53,125 @@ class pi:
     def set_mode(self, *args):
         pass
 
-    def write(self, *args):
-        pass
+    def write(self, gpio, level):
+        self.levels[gpio] = int(level)
 
-    def set_PWM_dutycycle(self, *args):
-        pass
+    def set_bank_1(self, bits):
+        for g in range(32):
+            if bits >> g & 1:
+                self.levels[g] = 1
+        return 0
+
+    def clear_bank_1(self, bits):
+        for g in range(32):
+            if bits >> g & 1:
+                self.levels[g] = 0
+        return 0
+
+    def read_bank_1(self):
+        return sum(1 << g for g, level in self.levels.items() if level)
+
+    def set_PWM_dutycycle(self, pin, dutycycle):
+        """ Counts the PWM pulses sent since the duty cycle was set """
+        freq, duty, start = self._pwm.get(pin, (800, 0, 0))
+        now = time.monotonic()
+        if duty:
+            self.edges[pin] = self.edges.get(pin, 0) + int((now - start) * freq)
+        self._pwm[pin] = (freq, dutycycle, now)
+        return 0
 
     def set_PWM_frequency(self, pin, freq, *args):
+        _, duty, start = self._pwm.get(pin, (800, 0, 0))
+        self._pwm[pin] = (freq, duty, start)
         return freq
+
+    def hardware_PWM(self, pin, freq, duty):
+        """ Counts the hardware PWM pulses sent since the last change """
+        _, old_duty, start = self._pwm.get(pin, (0, 0, 0))
+        if old_duty:
+            self.set_PWM_dutycycle(pin, 0)
+        self._pwm[pin] = (freq, duty, time.monotonic())
+        return 0
+
+    def callback(self, gpio, edge=RISING_EDGE, func=None):
+        return _callback(self, gpio)
+
+    def wave_add_new(self):
+        self._wave = []
+        return 0
+
+    def wave_add_generic(self, pulses):
+        self._wave += pulses
+        return len(self._wave)
+
+    def wave_create(self):
+        wid = self._next_wid
+        self._next_wid += 1
+        self.waves[wid] = self._wave
+        self._wave = []
+        return wid
+
+    def wave_create_and_pad(self, percent):
+        return self.wave_create()
+
+    def wave_delete(self, wid):
+        del self.waves[wid]
+        return 0
+
+    def wave_chain(self, data):
+        """ Counts the rising edges that would be sent by the chain, supports loops """
+        def _parse(i):
+            body = []
+            while i < len(data):
+                if data[i] == 255 and data[i + 1] == 0:
+                    loop, i = _parse(i + 2)
+                    body.append(loop)
+                elif data[i] == 255 and data[i + 1] == 1:
+                    return (body, data[i + 2] + (data[i + 3] << 8)), i + 4
+                else:
+                    body.append(data[i])
+                    i += 1
+            return (body, 1), i
+
+        def _send(item):
+            if isinstance(item, int):
+                edges = {}
+                for p in self.waves[item]:
+                    for g in range(32):
+                        if p.gpio_on >> g & 1:
+                            if not self.levels.get(g):
+                                edges[g] = edges.get(g, 0) + 1
+                            self.levels[g] = 1
+                        elif p.gpio_off >> g & 1:
+                            self.levels[g] = 0
+                return edges
+            body, count = item
+            first = {}
+            for sub in body:
+                for g, n in _send(sub).items():
+                    first[g] = first.get(g, 0) + n
+            if count == 1:
+                return first
+            # levels repeat after the first pass, so count the second pass once
+            second = _send((body, 1))
+            return {g: first.get(g, 0) + second.get(g, 0) * (count - 1)
+                    for g in set(first) | set(second)}
+
+        for g, n in _send(_parse(0)[0]).items():
+            self.edges[g] = self.edges.get(g, 0) + n
+        return 0
+
+    def wave_send_using_mode(self, wid, mode):
+        return self.wave_chain([wid])
+
+    def wave_tx_at(self):
+        return NO_TX_WAVE
+
+    def wave_tx_busy(self):
+        return 0
+
+    def wave_tx_stop(self):
+        return 0
+
+    def wave_get_max_pulses(self):
+        return 12000
@@ -6,6 +6,10 @@ install_requires = [
     'pigpio>=1',
 ]
 
+extras_require = {
+    'numpy': ['numpy'],
+}
+
 tests_require = []
 
 with open("README.md", "r") as fh:
@@ -19,6 +23,7 @@ setup(
     license='GPL',
     url='https://github.com/jbaans/python-rpi-steppermotor-precise',
     packages=find_packages(),
+    extras_require=extras_require,
     description='Advanced stepper motor interface',
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -12,6 +12,8 @@ __status__ = "Development"
 
 import math
 from steppermotor_precise.BasicDriver import BasicDriver
+from steppermotor_precise import Estimator
+from steppermotor_precise.Tracer import Tracer
 
 class A4988(BasicDriver):
     """
@@ -35,8 +37,10 @@ class A4988(BasicDriver):
 
     # default settings:
     stepsize = 1
+    last_steps = 0      # steps made by the last (cancelled) asynchronous move
 
-    def __init__(self, GPIOS, frequency, stepsize=None, verbosity=0):
+    def __init__(self, GPIOS, frequency, stepsize=None, verbosity=0, engine=None,
+                 hardware_pwm=None, gpio=None):
         """Initialize the motor driver.
         Calls parent init function and sets microstep size.
 
@@ -45,8 +49,16 @@ class A4988(BasicDriver):
             frequency (int): PWM pulses per second.
             stepsize (int, optional): Microstep size. Defaults to None.
             verbosity (int, optional): Integer to set verbosity. Defaults to 0.
+            engine (str, optional): Pulse output engine, "pwm" or "wave". Defaults to None.
+            hardware_pwm (bool, optional): Use hardware PWM for the "pwm" engine.
+                                           Defaults to None to detect.
+            gpio (GPIOBackend, optional): GPIO backend. Defaults to None for PIGPIO.
         """
-        super().__init__(GPIOS, frequency, verbosity=verbosity)
+        super().__init__(GPIOS, frequency, verbosity=verbosity, engine=engine,
+                         hardware_pwm=hardware_pwm, gpio=gpio)
+
+        # precompute the mode GPIO bank bits of every step size
+        self._stepsize_bits = {size: self._stepsize_masks(size) for size in self.STEPSIZE}
 
         # set defaults
         self.set_stepsize(stepsize or self.stepsize)
@@ -55,23 +67,72 @@ class A4988(BasicDriver):
             print("Default duty cycle (actual = 0): " + str(self.DEFAULT_DUTYCYCLE))
 
 
-    def set_stepsize(self, size):
-        """Sets microstep size.
+    def set_stepsize(self, size, direction=None):
+        """Sets microstep size, and optionally direction, with a single
+        set and clear of the GPIO bank.
 
         Args:
             size (float): Microstep size. Any of 1, 1/2, 1/4, 1/8 or 1/16.
+            direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
         """
         if not size in self.STEPSIZE:
             raise Exception("Error: Invalid step size: " +str(size))
-        self.gpio.write(self.GPIOS['m0'], self.STEPSIZE[size][0])
-        self.gpio.write(self.GPIOS['m1'], self.STEPSIZE[size][1])
-        self.gpio.write(self.GPIOS['m2'], self.STEPSIZE[size][2])
+        on_mask, off_mask = self._stepsize_bits[size]
+        if direction is not None:
+            on_mask |= self._direction_bits[bool(direction)][0]
+            off_mask |= self._direction_bits[bool(direction)][1]
+            self.direction = direction
+        self._write_bank(on_mask, off_mask)
         self.stepsize = size
-        if self.verbosity >= 3:
-            print("Step size is set to " + str(size))
+        if self._trace:
+            self._trace(Tracer.STEPSIZE, size)
+
+
+    def _stepsize_masks(self, size):
+        """Returns the GPIO bits to set and clear for a microstep size.
+
+        Args:
+            size (float): Microstep size. Any of 1, 1/2, 1/4, 1/8 or 1/16.
+
+        Returns:
+            (int, int): bits of mode GPIOs to set and bits of mode GPIOs to clear
+        """
+        on_mask = 0
+        off_mask = 0
+        for pin, level in zip(('m0', 'm1', 'm2'), self.STEPSIZE[size]):
+            if level:
+                on_mask |= 1 << self.GPIOS[pin]
+            else:
+                off_mask |= 1 << self.GPIOS[pin]
+        return on_mask, off_mask
+
+
+    @classmethod
+    def estimate_step(cls, steps, frequency, stepsize=None, pwm_frequencies=None):
+        """Estimates step() moves without hardware, see Estimator.estimate_step().
+        Accepts NumPy arrays to estimate many moves at once.
+
+        Args:
+            steps (array): number of whole steps to make.
+            frequency (array): PWM frequency (Hz).
+            stepsize (array, optional): Microstep size. Defaults to None.
+            pwm_frequencies ([int], optional): software PWM frequency table the
+                                               frequency snaps to. Defaults to None for
+                                               PWM_FREQUENCIES, pass () for the exact
+                                               frequencies of the "wave" engine and
+                                               hardware PWM.
 
+        Returns:
+            dict: arrays of pulses, steps made, step error and duration (s)
+        """
+        if pwm_frequencies is None:
+            pwm_frequencies = cls.PWM_FREQUENCIES
+        return Estimator.estimate_step(steps, frequency, stepsize or cls.stepsize,
+                                       pwm_frequencies)
 
-    def enable(self, frequency=None, dutycycle=None, stepsize=None, direction=None):
+
+    def enable(self, frequency=None, dutycycle=None, stepsize=None, direction=None,
+               wait=False, idle_timeout=None):
         """Sets step size. Then enables motor driver chip by calling parent function.
 
         Args:
@@ -79,11 +140,15 @@ class A4988(BasicDriver):
             dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
             stepsize (float): Microstep size. Any of 1, 1/2, 1/4, 1/8 or 1/16.
             direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            wait (bool, optional): Wait until the chip has settled. Defaults to False.
+            idle_timeout (float, optional): Seconds without motion after which the
+                                            chip is disabled automatically. Defaults to None.
         """
         if stepsize:
             self.set_stepsize(stepsize)
 
-        super().enable(frequency=frequency, dutycycle=dutycycle, direction=direction)
+        super().enable(frequency=frequency, dutycycle=dutycycle, direction=direction,
+                       wait=wait, idle_timeout=idle_timeout)
 
 
     def step(self, steps, frequency=None, dutycycle=None, stepsize=None):
@@ -104,17 +169,71 @@ class A4988(BasicDriver):
         Returns:
             float: (estimation of) step size that was made
         """
-        if stepsize:
-            self.set_stepsize(stepsize)
-
         if steps < 0:
             direction = False
         else:
             direction = True
 
+        if stepsize:
+            self.set_stepsize(stepsize, direction=direction)
+
         # can only make whole positive number of pulses
         pulses = int(abs(steps) / self.stepsize)
         stepsmade = super().pulse(pulses, frequency=frequency, dutycycle=dutycycle,
                                   direction=direction) * self.stepsize
         # return the amount of steps made, with the sign of the requested direction
         return math.copysign(stepsmade, steps)
+
+
+    async def astep(self, steps, frequency=None, dutycycle=None, stepsize=None):
+        """Asynchronous version of step(), see apulse().
+        When cancelled, last_steps is set to the number of steps made.
+
+        Args:
+            steps (float)): number of whole steps to make.
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+            stepsize (float, optional): Microstep size. Any of 1, 1/2, 1/4, 1/8, 1/16
+                                        or None. Defaults to None.
+
+        Returns:
+            float: step size that was made
+        """
+        if steps < 0:
+            direction = False
+        else:
+            direction = True
+
+        if stepsize:
+            self.set_stepsize(stepsize, direction=direction)
+
+        # can only make whole positive number of pulses
+        pulses = int(abs(steps) / self.stepsize)
+        try:
+            await self.apulse(pulses, frequency=frequency, dutycycle=dutycycle,
+                              direction=direction)
+        finally:
+            self.last_steps = math.copysign(self.last_pulses * self.stepsize, steps)
+        return self.last_steps
+
+
+    def jog(self, frequency=None, direction=None, dutycycle=None, stepsize=None):
+        """Make steps without end at the specified frequency and microstep size,
+        until the motion is aborted with abort(), see BasicDriver.jog().
+
+        Args:
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+            direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+            stepsize (float, optional): Microstep size. Any of 1, 1/2, 1/4, 1/8,
+                                        1/16 or None. Defaults to None.
+
+        Returns:
+            float: number of whole steps that were made, negative for counterclockwise
+        """
+        if stepsize:
+            self.set_stepsize(stepsize, direction=direction)
+
+        stepsmade = super().jog(frequency=frequency, direction=direction,
+                                dutycycle=dutycycle) * self.stepsize
+        return stepsmade if self.direction else -stepsmade
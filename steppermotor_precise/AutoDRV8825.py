@@ -11,7 +11,15 @@ __email__ = "jbaans-at-gmail.com"
 __status__ = "Development"
 
 import math
+import asyncio
 from steppermotor_precise.DRV8825 import DRV8825
+from steppermotor_precise.Profile import ProfileCompiler
+from steppermotor_precise.MotionPlanner import MotionPlanner
+from steppermotor_precise.StagePlanner import StagePlanner
+from steppermotor_precise.MoveCache import MoveCache
+from steppermotor_precise.TorqueModel import TorqueModel
+from steppermotor_precise import Estimator
+from steppermotor_precise.Tracer import Tracer
 
 class AutoDRV8825(DRV8825):
     """
@@ -20,8 +28,13 @@ class AutoDRV8825(DRV8825):
     """
     # number of microsteps for each acceleration step
     ACCEL_MICROSTEPS = 50
+    # compiler and cache of acceleration profiles, shared by all instances
+    PROFILES = ProfileCompiler()
+    # optional TorqueModel of motor and load, used when no acceleration is given
+    torque_model = None
 
-    def __init__(self, GPIOS, frequency, stepsize=None, verbosity=0, accel_microsteps=None):
+    def __init__(self, GPIOS, frequency, stepsize=None, verbosity=0, accel_microsteps=None,
+                 engine=None, hardware_pwm=None, gpio=None):
         """Initialize the motor driver.
         Calls parent init function and sets number of acceleration microsteps per speed.
 
@@ -32,22 +45,130 @@ class AutoDRV8825(DRV8825):
             verbosity (int, optional): Integer to set verbosity. Defaults to 0.
             accel_microsteps (int, optional): Number of acceleration microsteps
                                               per speed. Defaults to None.
+            engine (str, optional): Pulse output engine, "pwm" or "wave". Defaults to None.
+            hardware_pwm (bool, optional): Use hardware PWM for the "pwm" engine.
+                                           Defaults to None to detect.
+            gpio (GPIOBackend, optional): GPIO backend. Defaults to None for PIGPIO.
         """
-        print("Initializing Stepper Motor...")
-        super().__init__(GPIOS, frequency, stepsize=stepsize, verbosity=verbosity)
+        if verbosity >= 1:
+            print("Initializing Stepper Motor...")
+        super().__init__(GPIOS, frequency, stepsize=stepsize, verbosity=verbosity,
+                         engine=engine, hardware_pwm=hardware_pwm, gpio=gpio)
 
         if accel_microsteps < 1:
             raise Exception("Error: Invalid number for acceleration microsteps: " + str(accel_microsteps))
         self.ACCEL_MICROSTEPS = accel_microsteps or self.ACCEL_MICROSTEPS
         if self.verbosity >= 1:
             print("Acceleration microsteps: " + str(self.ACCEL_MICROSTEPS))
-        print("Initialization done.")
+        self.planner = MotionPlanner(self.PROFILES)
+        if self.verbosity >= 1:
+            print("Initialization done.")
+
+
+    def close(self):
+        """Saves the compiled profiles to the move cache, when used,
+        and calls parent close function.
+        """
+        if self.PROFILES.store is not None:
+            self.PROFILES.store.save()
+        super().close()
+
+
+    def use_move_cache(self, filename=None):
+        """Keeps the compiled profiles of this driver class in a persistent
+        MoveCache file, so a restarted process loads them instead of compiling.
+        Entries are keyed by driver class, STEPSIZE table and move parameters,
+        and are dropped when the package version or the calibration changes.
+        New profiles are written by close() or MoveCache.save().
+
+        Args:
+            filename (str, optional): Name of the cache file. Defaults to None
+                                      for STEPPERMOTOR_MOVE_CACHE or MoveCache.FILENAME.
+
+        Returns:
+            MoveCache: the move cache of this driver class
+        """
+        namespace = type(self).__name__ + repr(sorted(self.STEPSIZE.items()))
+        if self.PROFILES.store is not None:
+            self.PROFILES.store.close()
+        self.PROFILES.store = MoveCache(filename, namespace=namespace,
+                                        stamp=MoveCache.make_stamp(self.calibration))
+        return self.PROFILES.store
+
+
+    def set_torque_model(self, model):
+        """Sets the torque model of the motor and its load. auto_step() and
+        queue_move() without an acceleration then run profiles that accelerate
+        as fast as the load allows at every speed.
+
+        Args:
+            model (TorqueModel): torque model, or None to use the ACCEL_MICROSTEPS stages.
+        """
+        self.torque_model = model
+        if self.verbosity >= 1 and model:
+            print("Maximum speed with load: " + str(round(model.max_speed(), 1)) + " steps/s")
+
+
+    def set_load(self, load_inertia, load_torque=0):
+        """Changes the load of the torque model, e.g. for another payload.
+        The following moves take the time the new load needs.
+
+        Args:
+            load_inertia (float): inertia of the load at the motor shaft (kg m^2).
+            load_torque (float, optional): torque the load needs (Nm). Defaults to 0.
+        """
+        if not self.torque_model:
+            raise Exception("Error: No torque model, see set_torque_model().")
+        self.set_torque_model(self.torque_model.with_load(load_inertia, load_torque))
+
+
+    @classmethod
+    def estimate_auto_step(cls, steps, frequency, stepsize_min=None, stepsize_max=None,
+                           accel_microsteps=None, stepsize=None, bands=(),
+                           pwm_frequencies=None):
+        """Estimates auto_step() moves without hardware, see Estimator.estimate_auto_step().
+        Accepts NumPy arrays to estimate many moves at once.
+
+        Args:
+            steps (array): number of whole steps to make.
+            frequency (array): PWM frequency (Hz).
+            stepsize_min (array, optional): Minimum microstep size. Defaults to None.
+            stepsize_max (array, optional): Maximum microstep size. Defaults to None.
+            accel_microsteps (array, optional): Number of acceleration microsteps
+                                                per speed. Defaults to None.
+            stepsize (array, optional): Microstep size before the move. Defaults to None.
+            bands ([(float, float)], optional): resonance bands, lower and upper speed
+                                                (whole steps/s), e.g. resonance_bands
+                                                of the motor. Defaults to ().
+            pwm_frequencies ([int], optional): software PWM frequency table the
+                                               frequency snaps to. Defaults to None for
+                                               PWM_FREQUENCIES, pass () for the exact
+                                               frequencies of the "wave" engine and
+                                               hardware PWM.
+
+        Returns:
+            dict: arrays of pulses per phase, steps made, step error and duration (s)
+        """
+        if accel_microsteps is None:
+            accel_microsteps = cls.ACCEL_MICROSTEPS
+        if pwm_frequencies is None:
+            pwm_frequencies = cls.PWM_FREQUENCIES
+        return Estimator.estimate_auto_step(cls.STEPSIZE, steps, frequency,
+                                            stepsize_min, stepsize_max, accel_microsteps,
+                                            stepsize or cls.stepsize, bands, pwm_frequencies)
 
 
     def auto_step(self, steps, frequency=None, dutycycle=None,
-                  stepsize_min=None, stepsize_max=None):
+                  stepsize_min=None, stepsize_max=None, acceleration=None,
+                  start_frequency=None):
         """Make the specified number of steps with automatic acceleration
         and deceleration, count steps while doing so.
+        Without acceleration, accelerates with ACCEL_MICROSTEPS pulses per
+        microstep size along the time-optimal stages of StagePlanner: short
+        moves reach fewer microstep sizes. With acceleration, runs a compiled
+        trapezoidal profile with per-pulse timing, see run_profile(). With a
+        torque model, the profile accelerates as fast as the load allows.
+        Neither cruises inside the resonance bands, see set_resonance_bands().
 
         Args:
             steps (float)): number of whole steps to make.
@@ -57,79 +178,400 @@ class AutoDRV8825(DRV8825):
                                   1/16, 1/32 or None. Defaults to None.
             stepsize_max (float): Maximum microstep size. Any of 1, 1/2, 1/4, 1/8,
                                   1/16, 1/32 or None. Defaults to None.
+            acceleration (float, optional): Acceleration in whole steps/s^2, or a TorqueModel.
+                                            Defaults to None for the torque model, if set.
+            start_frequency (int, optional): Pulse frequency (Hz) at the start and end
+                                             of an accelerated profile. Defaults to None.
 
         Returns:
             float: (estimation of) step size that was made
         """
-        def _accelerate(self, microsteps, stepsizes):
-            """Accelerate (decelerate) by making series of microsteps with
-            increasing (decreasing) stepsizes.
+        stepsizes = self._stepsizes(stepsize_min, stepsize_max)
 
-            Args:
-                microsteps (int): number of microsteps to make for every stepsize
-                stepsizes ([float]): ordered list of stepsizes to iterate
-
-            Returns:
-                float: (estimation of) step size that was made
-            """
+        acceleration = acceleration or self.torque_model
+        if acceleration:
+            frequency = frequency or self.frequency
+            start_frequency = self._start_frequency(start_frequency, frequency, acceleration,
+                                                    stepsizes)
+            profile = self.PROFILES.compile(steps, frequency, start_frequency,
+                                            acceleration, stepsizes, bands=self.resonance_bands)
             subtotal = 0
-            for stepsize in stepsizes:
-                steps = stepsize * microsteps
-                subtotal += self.step(steps, stepsize=stepsize)
+            self._motion_start()
+            if self.tracker:
+                self.tracker.begin_group()
+            try:
+                subtotal = self.run_profile(profile, dutycycle=dutycycle)
+                if self._abort.is_set() and self._abort_mode == "decel":
+                    subtotal += self._decelerate_profile(profile, self.last_pulses, frequency,
+                                                         start_frequency, acceleration,
+                                                         stepsizes)
+            finally:
+                if self.tracker:
+                    self.tracker.end_group(subtotal, self.stepsize)
+                self._motion_end()
             return subtotal
 
-        def _stationary(self, steps):
-            """Make the specified amount of whole steps
+        stages, frequency = self._stages(steps, stepsizes, frequency)
+        subtotal = 0
+        self._motion_start()
+        # the stages are reported to the position tracker as one move
+        if self.tracker:
+            self.tracker.begin_group()
+        try:
+            for stepsize, pulses in stages:
+                if self._abort.is_set():
+                    break
+                stage = math.copysign(pulses * stepsize, steps)
+                if self._trace:
+                    self._trace(Tracer.PHASE, stepsize, stage)
+                subtotal += self.step(stage, frequency=frequency, stepsize=stepsize)
+            if self._abort.is_set() and self._abort_mode == "decel":
+                subtotal += self._decelerate(steps - subtotal, stepsizes, frequency)
+        finally:
+            if self.tracker:
+                self.tracker.end_group(subtotal, self.stepsize)
+            self._motion_end()
 
-            Args:
-                steps (float)): number of whole steps to make.
+        return subtotal
 
-            Returns:
-                float: (estimation of) step size that was made.
-            """
-            if self.verbosity >= 3:
-                print("Requesting " + str(steps) + " more steps...")
-            return self.step(steps)
 
-        def _verbose(self, total):
-            """Be verbose about number of steps"""
-            if self.verbosity >= 3:
-                print("Total number of whole steps is now " + str(total))
+    def _decelerate(self, remaining, stepsizes, frequency):
+        """Ramps down after abort() in "decel" mode: ACCEL_MICROSTEPS pulses at
+        every allowed microstep size below the current one, largest first,
+        without passing the end of the move. Another abort() stops the ramp.
 
-        # determine allowed stepsizes
-        stepsizes = []
-        for stepsize in reversed(list(self.STEPSIZE.keys())):
-            if ((stepsize_min and stepsize >= stepsize_min) and
-                (stepsize_max and stepsize <= stepsize_max)):
-                stepsizes.append(stepsize)
+        Args:
+            remaining (float): number of whole steps left of the move.
+            stepsizes ([float]): allowed microstep sizes.
+            frequency (int): PWM frequency (Hz).
 
-        # accelerate in same direction as steps
-        accel_microsteps = int(math.copysign(self.ACCEL_MICROSTEPS, steps))
+        Returns:
+            float: number of whole steps that were made
+        """
+        self._abort.clear()
+        made = 0
+        for size in sorted((s for s in stepsizes if s < self.stepsize), reverse=True):
+            steps = min(self.ACCEL_MICROSTEPS * size, abs(remaining - made))
+            if self._abort.is_set() or steps < size:
+                break
+            if self._trace:
+                self._trace(Tracer.PHASE, size, math.copysign(steps, remaining))
+            made += self.step(math.copysign(steps, remaining), frequency=frequency, stepsize=size)
+        return made
+
+
+    def _decelerate_profile(self, profile, pulses, frequency, start_frequency,
+                            acceleration, stepsizes):
+        """Ramps down after abort() in "decel" mode stopped a compiled profile:
+        compiles a profile from the speed of the last pulse down to the start
+        frequency and outputs it, without passing the end of the move.
+        Another abort() stops the ramp.
+
+        Args:
+            profile (Profile): the profile that was stopped.
+            pulses (int): number of pulses of the profile that were output.
+            frequency (int): cruise pulse frequency (Hz).
+            start_frequency (int): pulse frequency (Hz) at the end of the move.
+            acceleration (float): Acceleration in whole steps/s^2, or a TorqueModel.
+            stepsizes ([float]): allowed microstep sizes.
 
-        # check acceleration/decelation length
-        acceleration_len = 0
-        for stepsize in stepsizes:
-            acceleration_len += stepsize * accel_microsteps
-        if abs(2 * acceleration_len) > abs(steps):
-            print("Acceleration is too long for the requested number of steps, aborting.")
+        Returns:
+            float: number of whole steps that were made
+        """
+        self._abort.clear()
+        speed = profile.speed(pulses)
+        remaining = abs(profile.stepsmade - profile.position(pulses)[0])
+        distance = self.PROFILES.stopping_distance(speed, start_frequency, acceleration,
+                                                   stepsizes, self.resonance_bands, remaining)
+        if not speed or distance < stepsizes[0]:
             return 0
+        tail = self.PROFILES.compile(math.copysign(distance, profile.steps), frequency,
+                                     start_frequency, acceleration, stepsizes,
+                                     entry_speed=speed, bands=self.resonance_bands)
+        if self._trace:
+            self._trace(Tracer.PHASE, tail.phases[0][0], tail.stepsmade)
+        made = self.run_profile(tail)
+        if self._abort_at is not None:
+            self._abort_stopped = self.gpio.monotonic()
+        return made
 
-        # accelerate
-        subtotal = 0
-        subtotal += _accelerate(self, accel_microsteps, stepsizes)
-        _verbose(self, subtotal)
 
-        remainder = steps - (2 * subtotal)
-        if remainder != 0:
-            subtotal += _stationary(self, remainder)
-            _verbose(self, subtotal)
+    def queue_move(self, steps, frequency=None, stepsize_min=None, stepsize_max=None,
+                   acceleration=None, start_frequency=None):
+        """Adds a move to the motion queue, see run_queue().
 
-        # decelerate with stepsizes reversed
-        subtotal += _accelerate(self, accel_microsteps, reversed(stepsizes))
-        _verbose(self, subtotal)
+        Args:
+            steps (float)): number of whole steps to make.
+            frequency (int, optional): Cruise pulse frequency (Hz). Defaults to None.
+            stepsize_min (float): Minimum microstep size. Any of 1, 1/2, 1/4, 1/8,
+                                  1/16, 1/32 or None. Defaults to None.
+            stepsize_max (float): Maximum microstep size. Any of 1, 1/2, 1/4, 1/8,
+                                  1/16, 1/32 or None. Defaults to None.
+            acceleration (float): Acceleration in whole steps/s^2, or a TorqueModel.
+                                  Defaults to None for the torque model, if set.
+            start_frequency (int, optional): Pulse frequency (Hz) at standstill. Defaults to None.
+        """
+        acceleration = acceleration or self.torque_model
+        if not acceleration:
+            raise Exception("Error: Queued moves require an acceleration.")
+        frequency = frequency or self.frequency
+        stepsizes = self._stepsizes(stepsize_min, stepsize_max)
+        self.planner.add(steps, frequency,
+                         self._start_frequency(start_frequency, frequency, acceleration, stepsizes),
+                         acceleration, stepsizes, bands=self.resonance_bands)
+
+
+    def run_queue(self, dutycycle=None):
+        """Plans the queued moves with look-ahead and outputs them as one
+        chain of pigpio waveforms. Consecutive moves in the same direction
+        blend without stopping, see MotionPlanner.
+
+        Args:
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            float: number of whole steps that were made, net over all moves
+        """
+        profiles = self.planner.plan()
+        if not profiles:
+            return 0
+        if dutycycle:
+            self.dutycycle = dutycycle
+
+        if self.tracker:
+            self.tracker.begin()
+        pulses = self.pulse_runs(self._profile_runs(*profiles))
+        # the profiles output up to the last pulse, less when aborted
+        stepsmade = 0
+        remaining = pulses
+        for profile in profiles:
+            made, stepsize = profile.position(remaining)
+            if stepsize is not None:
+                stepsmade += made
+                self.stepsize = stepsize
+                self.direction = profile.direction
+            remaining -= profile.pulses
+        if self.tracker:
+            self._track(pulses, stepsmade)
+        if self._trace:
+            self._trace(Tracer.QUEUE_RUN, len(profiles), pulses)
+        return stepsmade
 
-        remainder = steps - subtotal
-        subtotal += _stationary(self, remainder)
-        _verbose(self, subtotal)
 
+    def run_profile(self, profile, dutycycle=None):
+        """Output a compiled profile as one chain of pigpio waveforms.
+        The microstep mode GPIOs are switched within the waveform.
+
+        Args:
+            profile (Profile): compiled profile, see ProfileCompiler.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            float: number of whole steps that were made
+        """
+        if not profile.pulses:
+            return 0
+        if dutycycle:
+            self.dutycycle = dutycycle
+        if not (self.direction == profile.direction):
+            self.set_direction(profile.direction)
+
+        if self.tracker:
+            self.tracker.begin()
+        pulses = self.pulse_runs(self._profile_runs(profile))
+        self.last_pulses = pulses
+        stepsmade, stepsize = profile.position(pulses)
+        self.stepsize = stepsize or self.stepsize
+        if self.tracker:
+            self._track(pulses, stepsmade)
+        return stepsmade
+
+
+    async def arun_profile(self, profile, dutycycle=None):
+        """Asynchronous version of run_profile().
+        When cancelled, last_steps is set to the number of steps made.
+
+        Args:
+            profile (Profile): compiled profile, see ProfileCompiler.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            float: number of whole steps that were made
+        """
+        self.last_steps = 0
+        if not profile.pulses:
+            return 0
+        if dutycycle:
+            self.dutycycle = dutycycle
+        if not (self.direction == profile.direction):
+            self.set_direction(profile.direction)
+
+        runs = self._profile_runs(profile)
+        if self.tracker:
+            self.tracker.begin()
+        try:
+            await self.apulse_runs(runs)
+        finally:
+            self.last_steps, stepsize = profile.position(self.last_pulses)
+            self.stepsize = stepsize or self.stepsize
+            if self.tracker:
+                self._track(self.last_pulses, self.last_steps)
+        return self.last_steps
+
+
+    async def aauto_step(self, steps, frequency=None, dutycycle=None,
+                         stepsize_min=None, stepsize_max=None, acceleration=None,
+                         start_frequency=None):
+        """Asynchronous version of auto_step(), awaits every block of the move
+        without blocking the event loop.
+        When cancelled, the pulse output is stopped, last_steps is set to the
+        number of steps made and the cancellation is raised again.
+
+        Args:
+            steps (float)): number of whole steps to make.
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+            stepsize_min (float): Minimum microstep size. Any of 1, 1/2, 1/4, 1/8,
+                                  1/16, 1/32 or None. Defaults to None.
+            stepsize_max (float): Maximum microstep size. Any of 1, 1/2, 1/4, 1/8,
+                                  1/16, 1/32 or None. Defaults to None.
+            acceleration (float, optional): Acceleration in whole steps/s^2, or a TorqueModel.
+                                            Defaults to None for the torque model, if set.
+            start_frequency (int, optional): Pulse frequency (Hz) at the start and end
+                                             of an accelerated profile. Defaults to None.
+
+        Returns:
+            float: step size that was made
+        """
+        stepsizes = self._stepsizes(stepsize_min, stepsize_max)
+
+        acceleration = acceleration or self.torque_model
+        if acceleration:
+            frequency = frequency or self.frequency
+            start_frequency = self._start_frequency(start_frequency, frequency, acceleration,
+                                                    stepsizes)
+            profile = self.PROFILES.compile(steps, frequency, start_frequency,
+                                            acceleration, stepsizes, bands=self.resonance_bands)
+            return await self.arun_profile(profile, dutycycle=dutycycle)
+
+        stages, frequency = self._stages(steps, stepsizes, frequency)
+        subtotal = 0
+        await self._amotion_start()
+        if self.tracker:
+            self.tracker.begin_group()
+        try:
+            for stepsize, pulses in stages:
+                if self._abort.is_set():
+                    break
+                subtotal += await self.astep(math.copysign(pulses * stepsize, steps),
+                                             frequency=frequency, stepsize=stepsize)
+        except asyncio.CancelledError:
+            # the steps of the cancelled stage are in last_steps
+            subtotal += self.last_steps
+            self.last_steps = subtotal
+            raise
+        finally:
+            if self.tracker:
+                self.tracker.end_group(subtotal, self.stepsize)
+            self._motion_end()
+
+        self.last_steps = subtotal
         return subtotal
+
+
+    def _stages(self, steps, stepsizes, frequency=None):
+        """Returns the stages of an auto_step() move without acceleration profile.
+        The bands are checked at the frequency that is actually output, see
+        set_frequency(). When no allowed microstep size keeps the cruise speed
+        out of the resonance bands, the frequency is lowered to below the band.
+
+        Args:
+            steps (float): number of whole steps to make.
+            stepsizes ([float]): allowed microstep sizes, none to use the current size.
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+
+        Returns:
+            ([(float, int)], int): microstep size and number of pulses of every stage,
+                                   and the PWM frequency (Hz)
+        """
+        frequency = frequency or self.frequency
+        if not self.resonance_bands:
+            return StagePlanner.plan(steps, stepsizes or [self.stepsize],
+                                     self.ACCEL_MICROSTEPS), frequency
+        actual = self._actual_frequency(frequency)
+        stages = StagePlanner.plan(steps, stepsizes or [self.stepsize], self.ACCEL_MICROSTEPS,
+                                   actual, self.resonance_bands)
+        if stages:
+            size = max(size for size, _ in stages)
+            speed = self.PROFILES.allowed_speed(actual * size, self.resonance_bands)
+            if speed < actual * size:
+                frequency = self._frequency_below(speed / size)
+        return stages, frequency
+
+
+    def _start_frequency(self, start_frequency, frequency, acceleration, stepsizes):
+        """Returns the pulse frequency at the start and end of a profile:
+        the specified start frequency, the start speed of a torque model at
+        the finest microstep size, or else the cruise frequency.
+
+        Args:
+            start_frequency (int): Pulse frequency (Hz) or None.
+            frequency (int): Cruise pulse frequency (Hz).
+            acceleration (float): Acceleration in whole steps/s^2, or a TorqueModel.
+            stepsizes ([float]): allowed microstep sizes.
+
+        Returns:
+            int: start pulse frequency (Hz)
+        """
+        if start_frequency:
+            return start_frequency
+        if isinstance(acceleration, TorqueModel) and stepsizes:
+            finest = min(stepsizes)
+            return min(frequency, max(int(acceleration.starting_speed(finest) / finest), 1))
+        return frequency
+
+
+    def _stepsizes(self, stepsize_min, stepsize_max):
+        """Returns the allowed stepsizes, from small to large.
+
+        Args:
+            stepsize_min (float): Minimum microstep size or None.
+            stepsize_max (float): Maximum microstep size or None.
+
+        Returns:
+            [float]: allowed microstep sizes
+        """
+        stepsizes = []
+        for stepsize in reversed(list(self.STEPSIZE.keys())):
+            if ((stepsize_min and stepsize >= stepsize_min) and
+                (stepsize_max and stepsize <= stepsize_max)):
+                stepsizes.append(stepsize)
+        return stepsizes
+
+
+    def _profile_runs(self, *profiles):
+        """Converts profiles to pulse runs that switch the microstep mode GPIOs,
+        and the direction GPIO between profiles of opposite direction,
+        see pulse_runs().
+
+        Args:
+            profiles (Profile): compiled profiles, output in order
+
+        Returns:
+            [(int, int, int, int)]: list of period (us), number of pulses,
+                                    bits of GPIOs to set and bits of GPIOs to clear.
+        """
+        runs = []
+        stepsize = self.stepsize
+        direction = self.direction
+        for profile in profiles:
+            dir_on, dir_off = (0, 0)
+            if not (direction == profile.direction):
+                direction = profile.direction
+                dir_on, dir_off = self._direction_bits[direction]
+            for size, period, count in profile.runs():
+                on_mask, off_mask = self._stepsize_bits[size] if size != stepsize else (0, 0)
+                runs.append((period, count, on_mask | dir_on, off_mask | dir_off))
+                stepsize = size
+                dir_on, dir_off = (0, 0)
+        return runs
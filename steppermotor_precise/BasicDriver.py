@@ -12,7 +12,16 @@ __status__ = "Development"
 
 import time
 import sys
+import math
+import asyncio
+import itertools
+import threading
+from collections import deque
 import pigpio as pigpio
+from steppermotor_precise.PositionTracker import PositionTracker
+from steppermotor_precise.ConnectionPool import ConnectionPool
+from steppermotor_precise.Calibration import Calibration
+from steppermotor_precise.Tracer import Tracer
 
 class BasicDriver:
     """
@@ -23,23 +32,76 @@ class BasicDriver:
     WAIT_ENABLE = 1         # seconds to stabilize after enable
     DEFAULT_DUTYCYCLE = 127 # 0..255
     GPIOS = {}              # dict of GPIO description: GPIO pin
+    ENGINES = ("pwm", "wave")   # available pulse output engines
+    WAVE_MIN_HIGH = 2       # minimum step pulse HIGH duration for waveforms (us)
+    WAVE_MAX_LOOP = 65535   # maximum repeat count of a single wave_chain loop
+    WAVE_POLL = 0.001       # seconds between wave_tx_busy polls
+    ABORT_POLL = 0.002      # seconds between abort checks of asynchronous motions
+    WAVE_CHUNK = 2000       # maximum number of single step pulses per wave
+    WAVE_MAX_PULSES = 12000 # pigpio wave memory, in pulses of all waves together
+    WAVE_MAX_WAVES = 250    # pigpio maximum number of waves
+    WAVE_MAX_LOOPS = 20     # pigpio maximum number of loops in a wave chain
+    WAVE_MAX_CHAIN = 600    # pigpio maximum length of a wave chain
+    WAVE_LOOP_MIN = 20      # minimum number of pulses of a run repeated by a loop
+    STREAM_CHUNK = 1000     # maximum number of step pulses per streamed wave
+    STREAM_WAVES = 3        # streamed waves in the daemon: sent, queued and created
+    HARDWARE_PWM_GPIOS = (12, 13, 18, 19)   # GPIOs with a hardware PWM channel
+    HARDWARE_PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}   # hardware PWM channel per GPIO
+    # software PWM frequencies (Hz) at the default sample rate of 5 us
+    PWM_FREQUENCIES = (8000, 4000, 2000, 1600, 1000, 800, 500, 400, 320, 250,
+                       200, 160, 100, 80, 50, 40, 20, 10)
+    POOL = ConnectionPool() # pigpio connections shared by all drivers
+    TIMINGS = ("sleep", "deadline") # available "pwm" engine timing modes
+    ABORT_MODES = ("immediate", "decel")   # available abort() modes
+    SPIN = 0.002            # seconds before a deadline to stop sleeping and spin
+    LATENCY = 0             # initial estimate of the one-way command latency (s)
+    LATENCY_WEIGHT = 0.2    # weight of a new measurement in the latency estimate
+    CALIBRATION = Calibration() # command latency measurements per daemon
 
     # default settings:
     direction = True        # rotation direction
     frequency = 0           # PWM pulses per second
     dutycycle = 0           # 0..255 for 0..100%. Start with 0 i.e. no pulses on output
-    gpio = None             # pigpio object
+    gpio = None             # GPIO backend, pigpio connection by default
     verbosity = None        # integer to set verbosity
+    engine = "pwm"          # pulse output engine, any of ENGINES
+    hardware_pwm = False    # "pwm" engine uses hardware PWM on the step GPIO
+    timing = "sleep"        # "pwm" engine timing, any of TIMINGS
+    resonance_bands = ()    # speeds (whole steps/s) not to cruise at, see set_resonance_bands()
+    last_timing = None      # timing report of the last "pwm" engine pulse output
+    calibration = None      # command latency statistics of the daemon, see calibrate()
+    last_pulses = 0         # pulses output by the last (cancelled) apulse()
+    last_stream = None      # report of the last stream_runs()
+    last_abort = None       # report of the last aborted motion, see abort()
+    tracker = None          # optional PositionTracker
+    tracer = None           # optional Tracer of motion events
+    enabled = False         # driver chip is enabled
+    ready_at = 0            # gpio.monotonic() at which the enabled chip has settled
+    idle_timeout = None     # seconds without motion before automatic disable
+    commands_sent = 0       # GPIO and PWM commands sent to the daemon
+    commands_saved = 0      # GPIO and PWM commands skipped by the shadow state
 
-    def __init__(self, GPIOS, frequency, verbosity=0):
+    def __init__(self, GPIOS, frequency, verbosity=0, engine=None, hardware_pwm=None,
+                 gpio=None):
         """Initialize the motor driver.
         Sets verbosity, GPIO pins numbers, frequency.
-        Connects to PIGPIO and configures GPIO.
+        Connects to PIGPIO through the shared POOL, or uses the specified GPIO
+        backend, and configures GPIO.
 
         Args:
             GPIOS (dict): dict of GPIO description: GPIO pin.
             frequency (int): PWM pulses per second.
             verbosity (int, optional): integer to set verbosity. Defaults to 0.
+            engine (str, optional): Pulse output engine, "pwm" for PWM output timed
+                                    with sleep or "wave" for hardware timed
+                                    waveforms. Defaults to None ("pwm").
+            hardware_pwm (bool, optional): Use hardware PWM for the "pwm" engine.
+                                           Defaults to None to use it when the step
+                                           GPIO is one of HARDWARE_PWM_GPIOS.
+            gpio (GPIOBackend, optional): GPIO backend, e.g. a SimulatorBackend or
+                                          POOL.acquire(host, port) for a remote daemon.
+                                          Defaults to None to share the connection
+                                          to the local PIGPIO daemon.
         """
 
         def _get_key(val, dict):
@@ -49,14 +111,92 @@ class BasicDriver:
 
         self.verbosity = verbosity
         self.GPIOS = GPIOS
+        if engine is not None and engine not in self.ENGINES:
+            raise Exception("Error: Invalid engine: " + str(engine))
+        self.engine = engine or self.engine
+        if hardware_pwm and self.GPIOS['step'] not in self.HARDWARE_PWM_GPIOS:
+            raise Exception("Error: Step GPIO has no hardware PWM: " + str(self.GPIOS['step']))
+        detect_pwm = hardware_pwm is None
+        if detect_pwm:
+            hardware_pwm = self.GPIOS['step'] in self.HARDWARE_PWM_GPIOS
+        self.hardware_pwm = hardware_pwm
+        self._step_alt = False      # step GPIO is in the ALT mode of hardware PWM
 
-        # init pigpio interface 'gpio'
-        self.gpio = pigpio.pi()
-        if not self.gpio.connected:
-            print("Could not connect to PIGPIO daemon, is it running? Exiting.")
-            exit()
-        elif self.verbosity >= 1:
-            print("Connected to PIGPIO daemon.")
+        # precompute GPIO bank bits, to change several GPIOs with one command
+        self._gpio_bits = 0
+        for g in list(self.GPIOS.values()):
+            self._gpio_bits |= 1 << g
+        self._direction_bits = {True: (1 << self.GPIOS['direction'], 0),
+                                False: (0, 1 << self.GPIOS['direction'])}
+        self._enable_bits = 1 << self.GPIOS['enable']
+
+        # enable state
+        self._lock = threading.RLock()
+        self._moving = 0            # number of motions in progress
+        self._idle_at = 0           # gpio.monotonic() at the end of the last motion
+        self._idle_timer = None
+        self._idle_disabled = False     # disabled by the idle timer, enabled again by motion
+        self._idle = threading.Event()  # set when no motion is in progress
+        self._idle.set()
+
+        # abort state of the motion in progress
+        self._abort = threading.Event()
+        self._abort_mode = None
+        self._abort_at = None       # gpio.monotonic() of the abort() call
+        self._abort_stopped = None  # gpio.monotonic() at which the output stopped
+        self._move_pulses = 0       # pulses output by the motion in progress
+
+        # measured one-way command latency (s)
+        self.latency = self.LATENCY
+
+        # record() of the tracer, None when not tracing
+        self._trace = None
+
+        # shadow state of the last values written to the daemon
+        self._known_bits = 0        # bits of GPIOs with a known level
+        self._high_bits = 0         # bits of GPIOs known to be high
+        self._pwm_frequency = None  # last requested PWM frequency
+        self._pwm_dutycycle = None  # last PWM duty cycle
+
+        # init GPIO backend 'gpio', share the pigpio connection by default
+        if gpio is not None:
+            self.gpio = gpio
+            if self.verbosity >= 1:
+                print("Using GPIO backend " + type(gpio).__name__ + ".")
+        else:
+            self.gpio = self.POOL.acquire()
+            if not self.gpio.connected:
+                print("Could not connect to PIGPIO daemon, is it running? Exiting.")
+                exit()
+            elif self.verbosity >= 1:
+                print("Connected to PIGPIO daemon.")
+
+        # tune the timing with the stored calibration of this daemon
+        calibration = None
+        if getattr(self.gpio, 'persistent_calibration', True):
+            calibration = self.CALIBRATION.load(self.gpio)
+        if calibration:
+            self._apply_calibration(calibration)
+            if self.verbosity >= 1:
+                print("Loaded calibration of " + self.CALIBRATION.key(self.gpio))
+
+        # verbose motion events are echoed by a tracer
+        if self.verbosity >= 2:
+            self.set_tracer(Tracer(clock=self.gpio.monotonic_ns, echo=self.verbosity))
+
+        # GPIOs 12 and 18, and GPIOs 13 and 19 share a hardware PWM channel
+        if self.hardware_pwm:
+            channel = self.HARDWARE_PWM_CHANNELS[self.GPIOS['step']]
+            owner = self.gpio.pwm_channels.get(channel)
+            if owner is not None and owner != self.GPIOS['step']:
+                if not detect_pwm:
+                    raise Exception("Error: Hardware PWM channel is used by GPIO " + str(owner))
+                self.hardware_pwm = False
+                if self.verbosity >= 1:
+                    print("Hardware PWM channel is used by GPIO " + str(owner) +
+                          ", using software PWM.")
+            else:
+                self.gpio.pwm_channels[channel] = self.GPIOS['step']
 
         # init required gpio pins
         for g in list(self.GPIOS.values()):
@@ -64,30 +204,44 @@ class BasicDriver:
             if self.verbosity >= 1:
                 print("GPIO " + _get_key(g, self.GPIOS) + " is set to pin " + str(g) )
 
-        for g in list(self.GPIOS.values()):
-            self.gpio.write(g, False)
+        self._write_bank(0, self._gpio_bits)
 
         # set defaults
         self.set_direction(self.direction)
         self.set_frequency(frequency)
         if self.verbosity >= 1:
             print("Initial frequency: " + str(self.frequency))
+            print("Pulse engine: " + self.engine)
+            if self.hardware_pwm:
+                print("Using hardware PWM on GPIO " + str(self.GPIOS['step']))
 
 
     def close(self):
         """
-        Set all GPIOs to low and disconnects from pigpio daemon
+        Set all GPIOs to low and disconnects from pigpio daemon, or releases
+        the connection when it is shared with other drivers.
         """
         # Switch gpios off
-        for g in list(self.GPIOS.values()):
-            self.gpio.write(g, False)
+        self._write_bank(0, self._gpio_bits)
 
         if self.verbosity >= 2:
             print("Set GPIOs to Low.")
 
-        # Disconnect from PIGPIO daemon
-        self.gpio.stop()
-        print("Closed PIGPIO connection.")
+        self._cancel_idle_timer()
+        if self.tracker:
+            self.tracker.close()
+
+        # free the hardware PWM channel for other drivers
+        if self.hardware_pwm:
+            channel = self.HARDWARE_PWM_CHANNELS[self.GPIOS['step']]
+            if self.gpio.pwm_channels.get(channel) == self.GPIOS['step']:
+                del self.gpio.pwm_channels[channel]
+
+        # Disconnect from PIGPIO daemon, when no other driver uses the connection
+        if not self.POOL.release(self.gpio):
+            self.gpio.stop()
+        if self.verbosity >= 1:
+            print("Closed PIGPIO connection.")
 
 
     def set_direction(self, direction):
@@ -96,14 +250,208 @@ class BasicDriver:
         Args:
             direction (bool): Rotation direction, True for clockwise
         """
-        self.gpio.write(self.GPIOS['direction'], direction)
+        self._write_bank(*self._direction_bits[bool(direction)])
         self.direction = direction
+        if self._trace:
+            self._trace(Tracer.DIRECTION, direction)
+
+
+    def set_tracer(self, tracer):
+        """Starts recording motion events into the tracer, or stops when None.
+        Without a tracer, the motion functions record nothing.
+
+        Args:
+            tracer (Tracer): tracer to record into, or None
+        """
+        self.tracer = tracer
+        self._trace = tracer.record if tracer else None
+
+
+    def _write_bank(self, on_mask, off_mask):
+        """Sets and clears GPIOs with at most one command each.
+        GPIOs that already have the requested level are skipped.
+
+        Args:
+            on_mask (int): bits of GPIOs to set
+            off_mask (int): bits of GPIOs to clear
+        """
+        set_mask = on_mask & ~(self._known_bits & self._high_bits)
+        clear_mask = off_mask & ~(self._known_bits & ~self._high_bits)
+        if set_mask:
+            self.gpio.set_bank_1(set_mask)
+            self.commands_sent += 1
+        elif on_mask:
+            self.commands_saved += 1
+        if clear_mask:
+            self.gpio.clear_bank_1(clear_mask)
+            self.commands_sent += 1
+        elif off_mask:
+            self.commands_saved += 1
+        if self._trace and (set_mask or clear_mask):
+            self._trace(Tracer.PIN_WRITE, set_mask, clear_mask)
+        self._shadow_bank(on_mask, off_mask)
+
+
+    def _shadow_bank(self, on_mask, off_mask):
+        """Records GPIO levels that were set outside of _write_bank(), e.g. by a waveform.
+
+        Args:
+            on_mask (int): bits of GPIOs that are high
+            off_mask (int): bits of GPIOs that are low
+        """
+        self._known_bits |= on_mask | off_mask
+        self._high_bits = (self._high_bits | on_mask) & ~off_mask
+
+
+    def resync(self):
+        """Reads the GPIO levels back from the daemon and forgets the PWM
+        settings, for when something else has changed the GPIOs.
+        The next frequency and duty cycle are always sent.
+        """
+        levels = self.gpio.read_bank_1()
+        self.commands_sent += 1
+        self._known_bits = self._gpio_bits
+        self._high_bits = levels & self._gpio_bits
+        self._pwm_frequency = None
+        self._pwm_dutycycle = None
         if self.verbosity >= 2:
-            print("Set direction to " + str(direction))
+            print("Resynchronized GPIO levels: " + hex(self._high_bits))
+
+
+    def calibrate(self, samples=200, save=True):
+        """Measures the round trip latency of the daemon commands used for
+        pulse output, tunes the timing corrections with it and stores the
+        statistics in the calibration file, so the next drivers connecting
+        to the same daemon load them at startup.
+        The step GPIO is kept low, the motor does not move.
+
+        Args:
+            samples (int, optional): Number of measurements per command. Defaults to 200.
+            save (bool, optional): Store the results in the calibration file, unless the
+                                   backend does not keep them, e.g. the simulator.
+                                   Defaults to True.
+
+        Returns:
+            dict: latency statistics (s) per command, see Calibration.summarize()
+        """
+        step = self.GPIOS['step']
+        frequency = int(self.frequency)
+        commands = {"write": lambda: self.gpio.write(step, 0),
+                    "set_PWM_dutycycle": lambda: self.gpio.set_PWM_dutycycle(step, 0),
+                    "set_PWM_frequency": lambda: self.gpio.set_PWM_frequency(step, frequency)}
+        if self.hardware_pwm:
+            commands["hardware_PWM"] = lambda: self.gpio.hardware_PWM(step, frequency, 0)
+
+        clock = self.gpio.monotonic_ns
+        results = {}
+        for name, command in commands.items():
+            latencies = []
+            for _ in range(samples):
+                start = clock()
+                command()
+                latencies.append((clock() - start) / 1000000000)
+            results[name] = Calibration.summarize(latencies)
+        self.commands_sent += samples * len(commands)
+        if "hardware_PWM" in commands:
+            # the hardware PWM samples left the step GPIO in its ALT mode
+            self._step_alt = True
+
+        # the daemon state was changed behind the shadow state
+        self.resync()
+        self._apply_calibration(results)
+        if save and getattr(self.gpio, 'persistent_calibration', True):
+            self.CALIBRATION.save(self.gpio, results)
+        if self.verbosity >= 1:
+            for name, result in results.items():
+                print("Latency of " + name + ": " + str(round(result["p50"] * 1000000, 1)) +
+                      " us (p50), " + str(round(result["p99"] * 1000000, 1)) + " us (p99)")
+        return results
+
+
+    def _apply_calibration(self, calibration):
+        """Sets the command latency estimate from calibration statistics.
+
+        Args:
+            calibration (dict): latency statistics (s) per command
+        """
+        self.calibration = calibration
+        command = "hardware_PWM" if self.hardware_pwm else "set_PWM_dutycycle"
+        if command in calibration:
+            # one-way latency is half of the median round trip
+            self.latency = calibration[command]["p50"] / 2
+
+
+    def track_position(self, callback=None, settle=None):
+        """Starts tracking the absolute position of the motor at position 0.
+
+        Args:
+            callback (bool, optional): Count the real step edges with a pigpio
+                                       callback. Defaults to None to count them
+                                       only with the "pwm" engine.
+            settle (float, optional): maximum seconds to wait for the edges of a
+                                      move to be counted. Defaults to None for
+                                      PositionTracker.SETTLE.
+
+        Returns:
+            PositionTracker: the tracker of this driver
+        """
+        if self.tracker:
+            self.tracker.close()
+        self.tracker = PositionTracker(self, callback=callback, settle=settle)
+        return self.tracker
+
+
+    @property
+    def position(self):
+        """float: absolute position in whole steps, see track_position()"""
+        if not self.tracker:
+            raise Exception("Error: Position is not tracked, call track_position() first.")
+        return self.tracker.position
+
+
+    def move_to(self, target, auto=False, **kwargs):
+        """Moves to an absolute position, see track_position().
+
+        Args:
+            target (float): absolute position in whole steps.
+            auto (bool, optional): Use auto_step() instead of step(). Defaults to False.
+            kwargs: arguments for step() or auto_step()
+
+        Returns:
+            dict: report of the move, see PositionTracker.end(). None if no move was made.
+        """
+        steps = target - self.position
+        self.tracker.report = None
+        if auto:
+            self.auto_step(steps, **kwargs)
+        else:
+            self.step(steps, **kwargs)
+        return self.tracker.report
+
+
+    def _track(self, pulses, steps=None, stepsize=None):
+        """Reports a move to the position tracker.
+
+        Args:
+            pulses (int): number of pulses output
+            steps (float, optional): signed whole steps made. Defaults to None
+                                     for pulses at the current step size and direction.
+            stepsize (float, optional): microstep size at the end of the move. Defaults to None.
+
+        Returns:
+            dict: report of the tracker, see PositionTracker.end()
+        """
+        stepsize = stepsize or getattr(self, 'stepsize', 1)
+        if steps is None:
+            steps = pulses * stepsize if self.direction else -pulses * stepsize
+        return self.tracker.end(pulses, steps, stepsize)
 
 
     def set_frequency(self, frequency):
-        """Sets PWM frequency
+        """Sets PWM frequency.
+        With the "wave" engine the frequency is only limited by the
+        microsecond resolution of the waveform. With hardware PWM the
+        frequency is exact and is sent together with the duty cycle.
 
         Args:
             frequency (int): PWM frequency (Hz)
@@ -113,96 +461,1345 @@ class BasicDriver:
         """
         if frequency < 1:
             raise Exception("Error: Invalid frequency: " + str(frequency))
-        actual_freq = self.gpio.set_PWM_frequency(self.GPIOS['step'], frequency)
+        if self.engine == "wave":
+            period = self._wave_period(frequency)
+            actual_freq = 1000000 / period
+        elif self.hardware_pwm:
+            actual_freq = frequency
+            self.frequency = actual_freq
+            if self._pwm_dutycycle:
+                # frequency of running hardware PWM is changed immediately
+                self._hardware_PWM(self._pwm_dutycycle)
+        elif frequency == self._pwm_frequency:
+            actual_freq = self.frequency
+            self.commands_saved += 1
+        else:
+            actual_freq = self.gpio.set_PWM_frequency(self.GPIOS['step'], frequency)
+            self.commands_sent += 1
+            self._pwm_frequency = frequency
         self.frequency = actual_freq
-        if self.verbosity >= 2:
-            print("Frequency is set to " + str(actual_freq))
+        if self._trace:
+            self._trace(Tracer.PWM_FREQUENCY, actual_freq)
         return actual_freq
 
 
+    def _actual_frequency(self, frequency):
+        """Returns the pulse frequency that set_frequency() would set: software
+        PWM snaps to the frequency table of the daemon, waveforms to a whole
+        microsecond period.
+
+        Args:
+            frequency (float): requested pulse frequency (Hz)
+
+        Returns:
+            float: pulse frequency (Hz) that is output
+        """
+        if self.engine == "wave":
+            return 1000000 / self._wave_period(frequency)
+        if self.hardware_pwm:
+            return frequency
+        table = getattr(self.gpio, 'PWM_FREQUENCIES', self.PWM_FREQUENCIES)
+        return min(table, key=lambda f: abs(f - frequency))
+
+
+    def _frequency_below(self, frequency):
+        """Returns the highest frequency to request whose actual pulse
+        frequency is not above a frequency, see _actual_frequency().
+
+        Args:
+            frequency (float): highest pulse frequency (Hz)
+
+        Returns:
+            float: frequency (Hz) to pass to set_frequency()
+        """
+        if self.engine == "wave":
+            return 1000000 / math.ceil(1000000 / frequency)
+        if self.hardware_pwm:
+            return int(frequency)
+        table = getattr(self.gpio, 'PWM_FREQUENCIES', self.PWM_FREQUENCIES)
+        return max((f for f in table if f <= frequency), default=min(table))
+
+
+    def set_resonance_bands(self, bands):
+        """Sets the resonance bands of the motor: ranges of speed at which
+        it must not cruise. Accelerated moves sweep through the bands and
+        cruise below them instead, see AutoDRV8825.auto_step().
+        The bands are speeds in whole steps/s, so they hold for every
+        microstep size, see resonance_frequencies().
+
+        Args:
+            bands ([(float, float)]): lower and upper speed (whole steps/s) of every band
+        """
+        merged = []
+        for low, high in sorted(bands):
+            if low <= 0 or high <= low:
+                raise Exception("Error: Invalid resonance band: " + str((low, high)))
+            if merged and low <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(high, merged[-1][1]))
+            else:
+                merged.append((low, high))
+        self.resonance_bands = tuple(merged)
+        if self.verbosity >= 1:
+            print("Resonance bands: " + str(self.resonance_bands))
+
+
+    def resonance_frequencies(self, stepsize=None):
+        """Returns the resonance bands as pulse frequencies at a microstep size.
+
+        Args:
+            stepsize (float, optional): Microstep size. Defaults to None for the current size.
+
+        Returns:
+            [(float, float)]: lower and upper pulse frequency (Hz) of every band
+        """
+        stepsize = stepsize or getattr(self, 'stepsize', 1)
+        return [(low / stepsize, high / stepsize) for low, high in self.resonance_bands]
+
+
     def set_dutycycle(self, dutycycle):
         """Sets PWM duty cycle
 
         Args:
             dutycycle (int): PWM duty cycle 0..255 (for 0..100%)
         """
-        self.gpio.set_PWM_dutycycle(self.GPIOS['step'], dutycycle)
+        if dutycycle == self._pwm_dutycycle and (not self.hardware_pwm or
+                                                 self._pwm_frequency == self.frequency):
+            self.commands_saved += 1
+        elif self.hardware_pwm:
+            self._hardware_PWM(dutycycle)
+        else:
+            self.gpio.set_PWM_dutycycle(self.GPIOS['step'], dutycycle)
+            self.commands_sent += 1
+            self._pwm_dutycycle = dutycycle
         self.dutycycle = dutycycle
-        if self.verbosity >= 3:
-            print("Dutycycle is set to " + str(dutycycle))
+        if self._trace:
+            self._trace(Tracer.PWM_DUTYCYCLE, dutycycle)
+
 
+    def _hardware_PWM(self, dutycycle):
+        """Sends frequency and duty cycle to the hardware PWM channel of the step GPIO.
+        GPIOs 12 and 18, and GPIOs 13 and 19 share a channel.
 
-    def enable(self, frequency=None, direction=None):
+        Args:
+            dutycycle (int): PWM duty cycle 0..255 (for 0..100%)
+        """
+        self.gpio.hardware_PWM(self.GPIOS['step'], int(self.frequency),
+                               int(dutycycle * 1000000 / 255))
+        self.commands_sent += 1
+        self._step_alt = True
+        self._pwm_frequency = self.frequency
+        self._pwm_dutycycle = dutycycle
+
+
+    def enable(self, frequency=None, direction=None, dutycycle=None, wait=False,
+               idle_timeout=None):
         """Enables motor driver chip to make it ready for stepping.
-        Requires some time to settle, set by WAIT_ENABLE.
+        The chip requires some time to settle, set by WAIT_ENABLE. Instead of
+        waiting here, the moment the chip is ready is recorded in ready_at and
+        motion functions only wait for the settle time that is left, so other
+        work can overlap with settling.
 
         Args:
             frequency (int, optional): PWM frequency (Hz). Defaults to None.
             direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+            wait (bool, optional): Wait until the chip has settled. Defaults to False.
+            idle_timeout (float, optional): Seconds without motion after which the
+                                            chip is disabled automatically, 0 to
+                                            keep it enabled. Defaults to None.
         """
         if frequency:
             self.set_frequency(frequency)
-        if direction:
+        if direction is not None:
             self.set_direction(direction)
-        time.sleep(self.WAIT_ENABLE)
+        if dutycycle:
+            self.dutycycle = dutycycle
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout or None
 
-        self.gpio.write(self.GPIOS['enable'], True)
-        time.sleep(self.WAIT_ENABLE)
+        with self._lock:
+            if not self.enabled:
+                self._write_bank(self._enable_bits, 0)
+                self.enabled = True
+                self.ready_at = self.gpio.monotonic() + self.WAIT_ENABLE
+                if self.verbosity >= 1:
+                    print("Enabled motor.")
+            self._idle_disabled = False
+            self._idle_at = self.gpio.monotonic()
+            self._restart_idle_timer()
 
-        print("Enabled motor.")
+        if wait:
+            self.wait_ready()
 
 
     def disable(self):
         """Disables motor driver chip by setting duty cycle to zero.
-        Requires some time to settle, set by WAIT_ENABLE.
+        Holds the motor until WAIT_ENABLE after the last motion, so it comes to rest.
         """
+        with self._lock:
+            self._cancel_idle_timer()
+            self.set_dutycycle(0)
+            self._sleep_until(self._idle_at + self.WAIT_ENABLE)
+
+            self._write_bank(0, self._enable_bits)
+            self.enabled = False
+            self.ready_at = 0
+            self._idle_disabled = False
+
+        if self.verbosity >= 1:
+            print("Disabled motor.")
+
+
+    def wait_ready(self):
+        """Waits for the settle time that is left after enable()."""
+        self._sleep_until(self.ready_at)
+
+
+    async def aenable(self, frequency=None, direction=None, dutycycle=None, wait=False,
+                      idle_timeout=None):
+        """Asynchronous version of enable(), optionally awaits the settle time.
+
+        Args:
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+            direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+            wait (bool, optional): Await until the chip has settled. Defaults to False.
+            idle_timeout (float, optional): Seconds without motion after which the
+                                            chip is disabled automatically. Defaults to None.
+        """
+        self.enable(frequency=frequency, direction=direction, dutycycle=dutycycle,
+                    idle_timeout=idle_timeout)
+        if wait:
+            await self.await_ready()
+
+
+    async def adisable(self):
+        """Asynchronous version of disable(), awaits the hold time."""
+        self._cancel_idle_timer()
         self.set_dutycycle(0)
-        time.sleep(self.WAIT_ENABLE)
+        await self.gpio.asleep(max(0, self._idle_at + self.WAIT_ENABLE - self.gpio.monotonic()))
+        self.disable()
+
+
+    async def await_ready(self):
+        """Asynchronous version of wait_ready()."""
+        await self.gpio.asleep(max(0, self.ready_at - self.gpio.monotonic()))
+
+
+    def _sleep_until(self, deadline):
+        """Sleeps until the gpio.monotonic() deadline, if it is in the future."""
+        remaining = deadline - self.gpio.monotonic()
+        if remaining > 0:
+            self.gpio.sleep(remaining)
+
+
+    def _motion_start(self):
+        """Marks the start of a motion: enables the chip again when it was
+        disabled by the idle timer, stops the idle timer and waits for the
+        settle time that is left.
+        """
+        with self._lock:
+            if self._idle_disabled:
+                self.enable()
+            if not self._moving:
+                self._idle.clear()
+            self._moving += 1
+            self._cancel_idle_timer()
+        self.wait_ready()
+
+
+    def _motion_end(self, pulses=0):
+        """Marks the end of a motion: restarts the idle timer. At the end of
+        the outermost motion, reports and clears an abort.
+
+        Args:
+            pulses (int, optional): number of pulses output by the motion. Defaults to 0.
+        """
+        with self._lock:
+            self._moving -= 1
+            self._move_pulses += pulses
+            self._idle_at = self.gpio.monotonic()
+            if not self._moving:
+                if self._abort_at is not None:
+                    stopped = self._abort_stopped or self._idle_at
+                    self.last_abort = {"mode": self._abort_mode,
+                                       "requested_at": self._abort_at,
+                                       "stopped_at": stopped,
+                                       "latency_s": max(0, stopped - self._abort_at),
+                                       "pulses": self._move_pulses}
+                    if self.verbosity >= 1:
+                        print("Aborted motion after " + str(self._move_pulses) + " pulses.")
+                self._abort.clear()
+                self._abort_mode = None
+                self._abort_at = None
+                self._abort_stopped = None
+                self._move_pulses = 0
+                self._idle.set()
+            self._restart_idle_timer()
+
+
+    def abort(self, mode="immediate", wait=True, timeout=None):
+        """Stops the motion in progress, from any thread. Motion functions
+        wait on an event instead of sleeping, so the pulse output stops within
+        about one command round trip. In "decel" mode auto_step() ramps down
+        through the smaller microstep sizes of the move first, other motions
+        stop immediately. The result is reported in last_abort. The number of
+        pulses is counted when the position is tracked with a callback, and
+        follows from the elapsed time and pulse timing otherwise.
+        Asynchronous motions check for an abort every ABORT_POLL seconds and
+        always stop immediately; they can be cancelled as well.
+
+        Args:
+            mode (str, optional): Any of ABORT_MODES. Defaults to "immediate".
+            wait (bool, optional): Wait until the motion has stopped, pass False
+                                   from the thread of the motion or from the
+                                   event loop. Defaults to True.
+            timeout (float, optional): Maximum seconds to wait. Defaults to None.
+
+        Returns:
+            int: number of pulses output by the aborted motion, 0 when no motion
+                 was in progress, None when not waiting or not stopped in time
+        """
+        if mode not in self.ABORT_MODES:
+            raise Exception("Error: Invalid abort mode: " + str(mode))
+        if wait and self._in_event_loop():
+            raise Exception("Error: abort() cannot wait in the event loop, pass wait=False.")
+        with self._lock:
+            if not self._moving:
+                return 0
+            if self._abort_at is None:
+                self._abort_at = self.gpio.monotonic()
+            self._abort_mode = mode
+            self._abort.set()
+        if self._trace:
+            self._trace(Tracer.ABORT, self.ABORT_MODES.index(mode))
+        if not wait or not self._idle.wait(timeout):
+            return None
+        return self.last_abort["pulses"]
+
+
+    @staticmethod
+    def _in_event_loop():
+        """Returns True when called from a running asyncio event loop."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+
+    async def _await_abort(self, seconds):
+        """Awaits a time like gpio.asleep(), wakes up early when the motion
+        is aborted. The abort event is checked every ABORT_POLL seconds.
+
+        Args:
+            seconds (float): time to wait (s)
+
+        Returns:
+            bool: True if the motion was aborted
+        """
+        end = self.gpio.monotonic() + seconds
+        while not self._abort.is_set():
+            remaining = end - self.gpio.monotonic()
+            if remaining <= 0:
+                return False
+            await self.gpio.asleep(min(remaining, self.ABORT_POLL))
+        return True
+
+
+    def _wait_until_ns(self, deadline, spin=0):
+        """Waits for a monotonic_ns() deadline like gpio.sleep_until_ns(),
+        wakes up early when the motion is aborted.
+
+        Args:
+            deadline (int): monotonic time (ns) to wait for
+            spin (int, optional): time (ns) to spin before the deadline. Defaults to 0.
+
+        Returns:
+            bool: True if the motion was aborted
+        """
+        remaining = deadline - self.gpio.monotonic_ns() - spin
+        if remaining > 0 and self.gpio.wait_event(self._abort, remaining / 1000000000):
+            return True
+        self.gpio.sleep_until_ns(deadline, spin)
+        return self._abort.is_set()
+
+
+    def _restart_idle_timer(self):
+        """(Re)starts the timer that disables the chip after idle_timeout,
+        on the clock of the backend, see GPIOBackend.call_later().
+        """
+        self._cancel_idle_timer()
+        if self.enabled and self.idle_timeout and not self._moving:
+            self._idle_timer = self.gpio.call_later(self.idle_timeout, self._idle_disable)
+
 
-        self.gpio.write(self.GPIOS['enable'], False)
-        time.sleep(self.WAIT_ENABLE)
+    def _cancel_idle_timer(self):
+        """Stops the idle timer."""
+        if self._idle_timer:
+            self._idle_timer.cancel()
+            self._idle_timer = None
 
-        print("Disabled motor.")
 
+    def _idle_disable(self):
+        """Disables the chip when it is still idle, called by the idle timer."""
+        with self._lock:
+            if self.enabled and not self._moving:
+                if self.verbosity >= 1:
+                    print("Idle timeout.")
+                self.disable()
+                self._idle_disabled = True
 
-    def pulse(self, pulses, frequency=None, direction=None):
+
+    def pulse(self, pulses, frequency=None, direction=None, dutycycle=None):
         """Output the specified number of pulses to the motor driver chip
         at the specified frequency, with the specified duty cycle and in
         the specified direction.
-        A nonzero PWM duty cycle will start the PWM pulse output.
-        Calculates the time to wait to output the specified number of pulses,
-        and waits this time while the PWM output is active, then sets the
-        PWM duty cycle to zero.
+        The pulses are output by the engine of this driver, see
+        pulse_pwm() and pulse_wave().
 
         Args:
             pulses (int)): number of pulses to output to motor driver chip
             frequency (int, optional): PWM frequency (Hz). Defaults to None.
             direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
 
         Returns:
-            int: (estimated) number of pulses (steps) that were output
+            int: number of pulses (steps) that were output, estimated for the "pwm" engine
         """
-        if pulses < 1:
-            print("Number of pulses must be equal or larger than 1, received: " + str(pulses) + ", aborting.")
+        if not self._pulse_setup(pulses, frequency, direction, dutycycle):
             return 0
 
+        self._motion_start()
+        requested = pulses
+        pulses = 0
+        try:
+            if self._abort.is_set():
+                return 0
+            if self.tracker:
+                self.tracker.begin()
+            if self._trace:
+                self._trace(Tracer.PULSE_START, requested, self.frequency)
+            if self.engine == "wave":
+                pulses = self.pulse_wave(requested)
+            else:
+                pulses = self.pulse_pwm(requested)
+            if self._abort_at is not None:
+                self._abort_stopped = self.gpio.monotonic()
+            if self._trace:
+                self._trace(Tracer.PULSE_END, pulses)
+            if self.tracker:
+                report = self._track(pulses)
+                if pulses < requested:
+                    # the pulses of an aborted output are counted by the callback
+                    pulses = report["counted"]
+        finally:
+            self._motion_end(pulses)
+        return pulses
+
+
+    async def apulse(self, pulses, frequency=None, direction=None, dutycycle=None):
+        """Asynchronous version of pulse(), awaits the output of the pulses
+        without blocking the event loop.
+        When cancelled, the pulse output is stopped, last_pulses is set to the
+        number of pulses output (estimated from the elapsed time) and the
+        cancellation is raised again.
+
+        Args:
+            pulses (int)): number of pulses to output to motor driver chip
+            frequency (int, optional): PWM frequency (Hz). Defaults to None.
+            direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        self.last_pulses = 0
+        if not self._pulse_setup(pulses, frequency, direction, dutycycle):
+            return 0
+
+        await self._amotion_start()
+        if self._abort.is_set():
+            self._motion_end()
+            return 0
+        if self.tracker:
+            self.tracker.begin()
+        if self._trace:
+            self._trace(Tracer.PULSE_START, pulses, self.frequency)
+        try:
+            return await self._apulse_output(pulses)
+        finally:
+            if self._trace:
+                self._trace(Tracer.PULSE_END, self.last_pulses)
+            if self.tracker:
+                self._track(self.last_pulses)
+            self._motion_end(self.last_pulses)
+
+
+    async def _amotion_start(self):
+        """Asynchronous version of _motion_start()."""
+        with self._lock:
+            if self._idle_disabled:
+                self.enable()
+            if not self._moving:
+                self._idle.clear()
+            self._moving += 1
+            self._cancel_idle_timer()
+        try:
+            await self.await_ready()
+        except asyncio.CancelledError:
+            self._motion_end()
+            raise
+
+
+    async def _apulse_output(self, pulses):
+        """Outputs pulses for apulse() with the engine of this driver.
+
+        Args:
+            pulses (int)): number of pulses to output to motor driver chip
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        if self.engine == "wave":
+            period = self._wave_period(self.frequency)
+            wids = [self._wave_create([self._wave_step(period)])]
+            return await self._await_wave(self._wave_loop(wids, pulses), wids, pulses,
+                                          pulses * period / 1000000)
+
+        start = self.gpio.monotonic()
+        self.set_dutycycle(self.dutycycle)
+        try:
+            aborted = await self._await_abort(pulses / self.frequency)
+        except asyncio.CancelledError:
+            self.set_dutycycle(0)
+            self.last_pulses = min(pulses, int((self.gpio.monotonic() - start) * self.frequency))
+            raise
+        self.set_dutycycle(0)
+
+        self.last_pulses = pulses
+        if aborted:
+            self._abort_stopped = self.gpio.monotonic()
+            self.last_pulses = min(pulses, int((self._abort_stopped - start) * self.frequency))
+        return self.last_pulses
+
+
+    def _pulse_setup(self, pulses, frequency, direction, dutycycle):
+        """Checks the number of pulses and sets direction, frequency and duty
+        cycle before pulse output.
+
+        Returns:
+            bool: True if pulses can be output
+        """
+        if pulses < 1:
+            if self.verbosity >= 1:
+                print("Number of pulses must be equal or larger than 1, received: " + str(pulses) + ", aborting.")
+            return False
+
         if direction is not None and not (self.direction == direction):
             self.set_direction(direction)
 
         if frequency:
             self.set_frequency(frequency)
 
-        waittime = pulses / self.frequency
-        if self.verbosity >= 3:
-            print("Sending " + str(pulses) + " pulses...")
+        if dutycycle:
+            self.dutycycle = dutycycle
 
         # dutycycle > 0 is required to output pulses, use default if none was provided
         if not self.dutycycle:
             self.dutycycle = self.DEFAULT_DUTYCYCLE
+        return True
+
 
-        # setting duty cycle will start/stop the PWM output for stepping
+    def pulse_pwm(self, pulses):
+        """Output the specified number of pulses with PWM.
+        A nonzero PWM duty cycle will start the PWM pulse output.
+        Calculates the time to wait to output the specified number of pulses,
+        and waits this time while the PWM output is active, then sets the
+        PWM duty cycle to zero.
+        With "deadline" timing, the stop command is scheduled against a
+        monotonic_ns() deadline from the moment the daemon started the PWM,
+        sent early by the measured command latency, with a coarse sleep
+        followed by a short spin. The result is reported in last_timing.
+
+        Args:
+            pulses (int)): number of pulses to output to motor driver chip
+
+        Returns:
+            int: (estimated) number of pulses (steps) that were output
+        """
+        waittime = pulses / self.frequency
+
+        if self.timing == "sleep":
+            # setting duty cycle will start/stop the PWM output for stepping
+            start = self.gpio.monotonic()
+            self.set_dutycycle(self.dutycycle)
+            aborted = self.gpio.wait_event(self._abort, waittime)
+            self.set_dutycycle(0)
+            if aborted:
+                # pulses that started before the stop
+                elapsed = self.gpio.monotonic() - start
+                return min(pulses, math.ceil(round(elapsed * self.frequency, 6)))
+            return pulses
+
+        clock = self.gpio.monotonic_ns
+        compensation = int(self.latency * 1000000000)
+
+        sent = clock()
         self.set_dutycycle(self.dutycycle)
-        time.sleep(waittime)
+        received = clock()
+        # the daemon started the PWM about halfway the round trip
+        start = (sent + received) // 2
+        deadline = start + int(waittime * 1000000000) - compensation
+        aborted = self._wait_until_ns(deadline, int(self.SPIN * 1000000000))
+
+        stop_sent = clock()
         self.set_dutycycle(0)
+        stop_received = clock()
+        stop = (stop_sent + stop_received) // 2
+
+        # update the latency estimate with both round trips
+        measured = (received - sent + stop_received - stop_sent) / 4000000000
+        self.latency += self.LATENCY_WEIGHT * (measured - self.latency)
+
+        duration = (stop - start) / 1000000000
+        if aborted:
+            # pulses that started before the stop
+            return min(pulses, math.ceil(round(duration * self.frequency, 6)))
+        self.last_timing = {"pulses": pulses,
+                            "planned_s": waittime,
+                            "actual_s": duration,
+                            "latency_s": measured,
+                            "compensation_s": compensation / 1000000000,
+                            "error_pulses": duration * self.frequency - pulses,
+                            "uncompensated_error_pulses":
+                                (duration + compensation / 1000000000) * self.frequency - pulses}
+        return pulses
+
+
+    def pulse_wave(self, pulses):
+        """Output exactly the specified number of pulses with a pigpio waveform.
+        A single step pulse is created as a wave, which is repeated by
+        wave_chain() loops and transmitted by the pigpio daemon with DMA timing.
+        Waits until the daemon has finished transmitting.
+
+        Args:
+            pulses (int)): number of pulses to output to motor driver chip
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        period = self._wave_period(self.frequency)
+        with self._wave_lock():
+            wid = self._wave_create([self._wave_step(period)])
+            try:
+                self.gpio.wave_chain(self._wave_loop([wid], pulses))
+                stopped = self._wave_wait(pulses * period / 1000000)
+            finally:
+                self.gpio.wave_delete(wid)
+
+        if stopped is not None:
+            # pulses that started up to the stop
+            return min(pulses, int(round(stopped * 1000000 / period, 6)) + 1)
+        return pulses
+
+
+    def pulse_runs(self, runs):
+        """Output a table of pulse runs with a single chain of pigpio waveforms.
+        Every run is a number of pulses with equal period. Short runs are
+        packed into flat waves, the longest runs are repeated by wave_chain()
+        loops. Other GPIOs (e.g. microstep mode pins) can be changed just
+        before the first pulse of a run. A run may add the bits of the step
+        GPIOs to pulse, to pulse several step GPIOs at once.
+        Runs that do not fit in the limits of the daemon (WAVE_MAX_PULSES,
+        WAVE_MAX_WAVES, WAVE_MAX_LOOPS and WAVE_MAX_CHAIN) are output by
+        stream_runs() instead.
+
+        Args:
+            runs ([(int, int, int, int[, int])]): list of period (us), number of pulses,
+                                                  bits of GPIOs to set, bits of GPIOs to
+                                                  clear and optionally bits of step GPIOs.
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        plan = self._wave_plan(runs)
+        if not self._wave_fits(plan[0]):
+            return self.stream_runs(runs)
+        wids = []
+        output = 0
+        with self._wave_lock():
+            try:
+                chain, total, duration, changed = self._wave_build(plan, wids)
+                if chain:
+                    self._motion_start()
+                    try:
+                        if self._abort.is_set():
+                            self._known_bits &= ~changed
+                            return 0
+                        if self._trace:
+                            self._trace(Tracer.PULSE_START, total)
+                        self.gpio.wave_chain(chain)
+                        stopped = self._wave_wait(duration)
+                        output = total
+                        if stopped is not None:
+                            self._abort_stopped = self.gpio.monotonic()
+                            self._known_bits &= ~changed
+                            output = self._runs_output(runs, stopped)
+                        if self._trace:
+                            self._trace(Tracer.PULSE_END, output)
+                    finally:
+                        self._motion_end(output)
+            finally:
+                for wid in wids:
+                    self.gpio.wave_delete(wid)
+
+        return output
+
+
+    async def apulse_runs(self, runs):
+        """Asynchronous version of pulse_runs().
+        When cancelled, the waveform is stopped and last_pulses is set to the
+        number of pulses output (estimated from the elapsed time).
+        Runs that do not fit in the limits of the daemon raise an exception.
+
+        Args:
+            runs ([(int, int, int, int[, int])]): list of period (us), number of pulses,
+                                                  bits of GPIOs to set, bits of GPIOs to
+                                                  clear and optionally bits of step GPIOs.
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        self.last_pulses = 0
+        plan = self._wave_plan(runs)
+        if not self._wave_fits(plan[0]):
+            raise Exception("Error: Pulse runs exceed the wave limits of the daemon, "
+                            "use pulse_runs() to stream them.")
+        wids = []
+        try:
+            chain, total, duration, changed = self._wave_build(plan, wids)
+            await self._amotion_start()
+        except BaseException:
+            for wid in wids:
+                self.gpio.wave_delete(wid)
+            raise
+        try:
+            return await self._await_wave(chain, wids, total, duration, changed)
+        finally:
+            self._motion_end()
+
+
+    async def _await_wave(self, chain, wids, pulses, duration, changed=0):
+        """Transmits a wave chain and awaits its completion, then deletes the waves.
+
+        Args:
+            chain ([int]): wave_chain() commands
+            wids ([int]): wave ids used by the chain
+            pulses (int): number of pulses in the chain
+            duration (float): expected transmission time (s)
+            changed (int, optional): bits of other GPIOs changed by the chain,
+                                     their level is unknown when cancelled.
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        lock = self._wave_lock()
+        acquired = lock.acquire(blocking=False)
+        try:
+            # another driver may be transmitting on the daemon
+            while not acquired and not await self._await_abort(self.WAVE_POLL):
+                acquired = lock.acquire(blocking=False)
+        finally:
+            if not acquired:
+                for wid in wids:
+                    self.gpio.wave_delete(wid)
+        if not acquired:
+            # aborted before the transmission
+            self.last_pulses = 0
+            return 0
+        start = self.gpio.monotonic()
+        aborted = False
+        try:
+            if chain:
+                self.gpio.wave_chain(chain)
+                aborted = await self._await_abort(duration)
+                while not aborted and self.gpio.wave_tx_busy():
+                    aborted = await self._await_abort(self.WAVE_POLL)
+                if aborted:
+                    self._wave_stop()
+                    self._abort_stopped = self.gpio.monotonic()
+        except asyncio.CancelledError:
+            self._wave_stop()
+            aborted = True
+            raise
+        finally:
+            if aborted:
+                self._known_bits &= ~changed
+                elapsed = self.gpio.monotonic() - start
+                self.last_pulses = min(pulses, int(pulses * elapsed / duration)) if duration else 0
+            for wid in wids:
+                self.gpio.wave_delete(wid)
+            lock.release()
+
+        if not aborted:
+            self.last_pulses = pulses
+        return self.last_pulses
+
+
+    def stream(self, segments, dutycycle=None):
+        """Output a trajectory of segments without stopping between them,
+        see stream_runs(). The segments are consumed lazily, e.g. from a
+        generator or Trajectory.read_csv(), so memory use does not grow with
+        the length of the trajectory. Fractions of microsteps that a segment
+        cannot make are carried over to the next segment.
+
+        Args:
+            segments (iterable): (steps, frequency[, stepsize]) of every segment, with
+                                 steps negative for counterclockwise, frequency (Hz) and
+                                 stepsize any of the STEPSIZE of the driver chip (1 without
+                                 microstep mode GPIOs), or None for the current values.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            float: number of whole steps that were made, net over all segments
+        """
+        if dutycycle:
+            self.dutycycle = dutycycle
+        # the segments converted ahead of the output, to find the steps made when aborted
+        history = deque(maxlen=(self.STREAM_WAVES + 2) * self.STREAM_CHUNK)
+        if self.tracker:
+            self.tracker.begin()
+        pulses = self.stream_runs(self._segment_runs(segments, history))
+        made = 0
+        for before, steps, size, direction in reversed(history):
+            if before <= pulses:
+                made = steps + math.copysign((pulses - before) * size, direction - 0.5)
+                if size != getattr(self, 'stepsize', 1):
+                    self.stepsize = size
+                self.direction = direction
+                break
+        if self.tracker:
+            self._track(pulses, made)
+        return made
+
+
+    def _segment_runs(self, segments, history):
+        """Converts trajectory segments to pulse runs that switch the microstep
+        mode and direction GPIOs, see stream().
+
+        Args:
+            segments (iterable): (steps, frequency[, stepsize]) of every segment
+            history (deque): gets the pulses and whole steps before, the microstep
+                             size and direction of every converted segment
+
+        Yields:
+            (int, int, int, int): period (us), number of pulses,
+                                  bits of GPIOs to set and bits of GPIOs to clear
+        """
+        # mode GPIO bits per microstep size, without mode GPIOs only whole steps
+        stepsize_bits = getattr(self, '_stepsize_bits', None) or {1: (0, 0)}
+        current = getattr(self, 'stepsize', 1)
+        carry = 0
+        pulsed = 0
+        made = 0
+        for segment in segments:
+            steps, frequency = segment[:2]
+            size = (segment[2] if len(segment) > 2 else None) or current
+            if not size in stepsize_bits:
+                raise Exception("Error: Invalid step size: " + str(size))
+            wanted = steps + carry
+            # can only make whole positive number of pulses
+            pulses = int(abs(wanted) / size + 1e-9)
+            carry = wanted - math.copysign(pulses * size, wanted)
+            if not pulses:
+                continue
+            on_mask, off_mask = (0, 0)
+            if size != current:
+                on_mask, off_mask = stepsize_bits[size]
+                self.stepsize = current = size
+            direction = wanted >= 0
+            if direction != self.direction:
+                on_mask |= self._direction_bits[direction][0]
+                off_mask |= self._direction_bits[direction][1]
+                self.direction = direction
+            period = self._wave_period(frequency or self.frequency)
+            history.append((pulsed, made, size, direction))
+            pulsed += pulses
+            made += math.copysign(pulses * size, wanted)
+            yield period, pulses, on_mask, off_mask
+
+
+    def stream_runs(self, runs):
+        """Output pulse runs from an iterable without gaps, with bounded memory.
+        The runs are consumed lazily and packed into waves of at most
+        STREAM_CHUNK step pulses. The next wave is queued with
+        wave_send_using_mode(WAVE_MODE_ONE_SHOT_SYNC), so it starts when the
+        wave before it ends, and a wave is deleted as soon as wave_tx_at()
+        reports it has been transmitted. At most STREAM_WAVES waves exist in
+        the daemon, whatever the length of the runs. The number of waves,
+        pulses and underruns (the next wave was queued too late) is
+        reported in last_stream.
+
+        Args:
+            runs (iterable): pulse runs, see pulse_runs(), e.g. a generator
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        self.last_pulses = 0
+        self.last_stream = {"waves": 0, "pulses": 0, "underruns": 0}
+        if not self.dutycycle:
+            self.dutycycle = self.DEFAULT_DUTYCYCLE
+        pad = 100 // self.STREAM_WAVES
+        waves = []      # (wave id, number of step pulses, end time, pulses) in the daemon
+        changed = 0
+        end = 0
+        self._motion_start()
+        lock = self._wave_lock()
+        lock.acquire()
+        try:
+            for pulses, count, duration, on_bits, off_bits in self._stream_chunks(runs):
+                if self._abort.is_set():
+                    break
+                wid = self._wave_create([pulses], pad=pad)
+                if len(waves) >= self.STREAM_WAVES - 1 and not self._stream_release(waves):
+                    waves.append((wid, 0, 0, []))
+                    break
+                now = self.gpio.monotonic()
+                if waves and not self.gpio.wave_tx_busy():
+                    self.last_stream["underruns"] += 1
+                self.gpio.wave_send_using_mode(wid, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+                end = max(now, end) + duration
+                waves.append((wid, count, end, pulses))
+                if self._trace:
+                    self._trace(Tracer.PULSE_START, count)
+                self._shadow_bank(on_bits, off_bits)
+                changed |= on_bits | off_bits
+                self.last_stream["waves"] += 1
+            while waves and self._stream_release(waves):
+                pass
+            if waves:
+                # aborted: stop the output and count the pulses of the wave in transmission
+                self._wave_stop()
+                self._abort_stopped = self.gpio.monotonic()
+                self._known_bits &= ~changed
+                _, _, end, pulses = waves[0]
+                t = int(round((self._abort_stopped - end) * 1000000)) + sum(p.delay for p in pulses)
+                step = 1 << self.GPIOS['step']
+                for p in pulses:
+                    if t < 0:
+                        break
+                    if p.gpio_on & step:
+                        self.last_pulses += 1
+                    t -= p.delay
+                self.last_stream["pulses"] = self.last_pulses
+                for wid, _, _, _ in waves:
+                    self.gpio.wave_delete(wid)
+                waves = []
+        except BaseException:
+            self._wave_stop()
+            self._known_bits &= ~changed
+            for wid, _, _, _ in waves:
+                self.gpio.wave_delete(wid)
+            raise
+        finally:
+            self._motion_end(self.last_pulses)
+            lock.release()
+
+        return self.last_pulses
+
+
+    def jog(self, frequency=None, direction=None, dutycycle=None):
+        """Output pulses without end, until the motion is aborted with abort().
+        The pulses are streamed by stream_runs(), so the daemon never holds
+        more than STREAM_WAVES waves however long the motor runs.
+
+        Args:
+            frequency (int, optional): pulse frequency (Hz). Defaults to None.
+            direction (bool, optional): Rotation direction, True for clockwise. Defaults to None.
+            dutycycle (int, optional): PWM duty cycle 0..255 (for 0..100%). Defaults to None.
+
+        Returns:
+            int: number of pulses (steps) that were output
+        """
+        if not self._pulse_setup(1, frequency, direction, dutycycle):
+            return 0
+        if self.tracker:
+            self.tracker.begin()
+        period = self._wave_period(self.frequency)
+        pulses = self.stream_runs(itertools.repeat((period, self.STREAM_CHUNK, 0, 0)))
+        if self.tracker:
+            # the pulses of the aborted output are counted by the callback
+            pulses = self._track(pulses)["counted"]
+        return pulses
+
+
+    def _wave_plan(self, runs):
+        """Packs a table of pulse runs into waves within the limits of the
+        daemon, see pulse_runs(). The longest runs of at least WAVE_LOOP_MIN
+        pulses are repeated by wave_chain() loops, as long as loop counters
+        are left. All other pulses are packed into flat waves of at most
+        WAVE_CHUNK step pulses.
+
+        Args:
+            runs ([(int, int, int, int[, int])]): table of pulse runs
+
+        Returns:
+            ([([pigpio.pulse], int)], int, float, int, int): pulses and repeat count of
+                                                            every wave, number of pulses,
+                                                            duration (s) and bits of other
+                                                            GPIOs set and cleared
+        """
+        if not self.dutycycle:
+            self.dutycycle = self.DEFAULT_DUTYCYCLE
+
+        # loop the longest runs while loop counters are left
+        looped = set()
+        loops = 0
+        for i in sorted(range(len(runs)), key=lambda i: -runs[i][1]):
+            count = runs[i][1] - (1 if runs[i][2] or runs[i][3] else 0)
+            if count < self.WAVE_LOOP_MIN:
+                break
+            needed = self._wave_loop_counters(count)
+            if loops + needed <= self.WAVE_MAX_LOOPS:
+                looped.add(i)
+                loops += needed
+
+        waves = []
+        single = []
+        singles = 0
+        total = 0
+        duration = 0
+        on_bits = 0
+        off_bits = 0
+
+        def _flush():
+            if single:
+                waves.append((list(single), 1))
+                single.clear()
+
+        for i, run in enumerate(runs):
+            period, count, on_mask, off_mask = run[:4]
+            step_mask = run[4] if len(run) > 4 else None
+            total += count
+            duration += period * count
+            if on_mask or off_mask:
+                single += self._wave_step(period, on_mask, off_mask, step_mask)
+                singles += 1
+                count -= 1
+                on_bits = (on_bits | on_mask) & ~off_mask
+                off_bits = (off_bits | off_mask) & ~on_mask
+            if i in looped:
+                _flush()
+                singles = 0
+                waves.append((self._wave_step(period, step_mask=step_mask), count))
+                continue
+            step = self._wave_step(period, step_mask=step_mask)
+            while count > 0:
+                take = min(count, self.WAVE_CHUNK - singles)
+                single += step * take
+                singles += take
+                count -= take
+                if singles >= self.WAVE_CHUNK:
+                    _flush()
+                    singles = 0
+        _flush()
+        return waves, total, duration / 1000000, on_bits, off_bits
+
+
+    def _wave_fits(self, waves):
+        """Returns whether planned waves fit the limits of the daemon: wave
+        memory, number of waves, number of loops and length of the chain.
+
+        Args:
+            waves ([([pigpio.pulse], int)]): pulses and repeat count of every wave,
+                                             see _wave_plan()
+
+        Returns:
+            bool: True if the waves can be sent as one wave chain
+        """
+        pulses = sum(len(pulses) for pulses, _ in waves)
+        loops = sum(self._wave_loop_counters(count) for _, count in waves)
+        chain = sum(len(self._wave_loop([0], count)) for _, count in waves)
+        return (pulses <= self.WAVE_MAX_PULSES and len(waves) <= self.WAVE_MAX_WAVES and
+                loops <= self.WAVE_MAX_LOOPS and chain <= self.WAVE_MAX_CHAIN)
+
+
+    def _wave_build(self, plan, wids):
+        """Creates the waves and the wave chain of planned waves, see _wave_plan().
+
+        Args:
+            plan (tuple): planned waves, see _wave_plan()
+            wids ([int]): list to which the ids of the created waves are added
+
+        Returns:
+            ([int], int, float, int): wave_chain() commands, number of pulses,
+                                      duration (s) and bits of other GPIOs changed
+        """
+        waves, total, duration, on_bits, off_bits = plan
+        chain = []
+        for pulses, count in waves:
+            wids.append(self._wave_create([pulses]))
+            chain += self._wave_loop(wids[-1:], count)
+
+        # the shadow state holds the GPIO levels after the waveform
+        self._shadow_bank(on_bits, off_bits)
+        return chain, total, duration, on_bits | off_bits
 
+
+    def _wave_period(self, frequency):
+        """Returns the period of a step pulse in microseconds.
+
+        Args:
+            frequency (float): pulse frequency (Hz)
+
+        Returns:
+            int: pulse period (us)
+        """
+        period = int(round(1000000 / frequency))
+        if period < 2 * self.WAVE_MIN_HIGH:
+            raise Exception("Error: Frequency too high for waveform: " + str(frequency))
+        return period
+
+
+    def _wave_step(self, period, on_mask=0, off_mask=0, step_mask=None):
+        """Returns the pigpio pulses of a single step pulse.
+        The HIGH duration follows the duty cycle. Other GPIOs are changed
+        WAVE_MIN_HIGH before the rising edge, within the pulse period.
+
+        Args:
+            period (int): pulse period (us)
+            on_mask (int, optional): bits of other GPIOs to set before the pulse.
+            off_mask (int, optional): bits of other GPIOs to clear before the pulse.
+            step_mask (int, optional): bits of the step GPIOs to pulse. Defaults
+                                       to None for the step GPIO of this driver.
+
+        Returns:
+            [pigpio.pulse]: pulses to add to a waveform
+        """
+        step = step_mask or 1 << self.GPIOS['step']
+        high = int(period * (self.dutycycle or self.DEFAULT_DUTYCYCLE) / 255)
+        high = min(max(high, self.WAVE_MIN_HIGH), period - self.WAVE_MIN_HIGH)
+        pulses = [pigpio.pulse(step, 0, high),
+                  pigpio.pulse(0, step, period - high)]
+        if (on_mask or off_mask) and period - high >= 2 * self.WAVE_MIN_HIGH:
+            pulses = [pigpio.pulse(on_mask, off_mask, self.WAVE_MIN_HIGH),
+                      pulses[0],
+                      pigpio.pulse(0, step, period - high - self.WAVE_MIN_HIGH)]
+        elif on_mask or off_mask:
+            pulses[0] = pigpio.pulse(step | on_mask, off_mask, high)
         return pulses
+
+
+    def _wave_create(self, pulses, pad=None):
+        """Creates a waveform from a list of lists of pigpio pulses.
+
+        Args:
+            pulses ([[pigpio.pulse]]): pulses to add to the waveform
+            pad (int, optional): Percentage of the wave resources to reserve with
+                                 wave_create_and_pad(), so a deleted wave leaves
+                                 room for the next. Defaults to None.
+
+        Returns:
+            int: wave id
+        """
+        self._wave_output_mode()
+        with self.gpio.lock:
+            self.gpio.wave_add_new()
+            for p in pulses:
+                self.gpio.wave_add_generic(p)
+            if pad:
+                wid = self.gpio.wave_create_and_pad(pad)
+            else:
+                wid = self.gpio.wave_create()
+        if wid < 0:
+            raise Exception("Error: Could not create waveform: " + str(wid))
+        return wid
+
+
+    def _wave_output_mode(self):
+        """Sets the step GPIO to output mode after hardware PWM has set it to
+        its ALT mode, as waveforms only reach GPIOs in output mode.
+        """
+        if self._step_alt:
+            self.gpio.set_mode(self.GPIOS['step'], pigpio.OUTPUT)
+            self.commands_sent += 1
+            self._step_alt = False
+
+
+    def _wave_loop_counters(self, count):
+        """Returns the number of loops of _wave_loop() for a repeat count.
+
+        Args:
+            count (int): number of repetitions
+
+        Returns:
+            int: number of wave_chain() loops
+        """
+        outer, inner = divmod(count, self.WAVE_MAX_LOOP)
+        return (1 + (outer > 1) if outer else 0) + (inner > 1)
+
+
+    def _wave_loop(self, wids, count):
+        """Returns the wave_chain() commands to transmit the waves count times.
+        Counts above WAVE_MAX_LOOP are split in nested loops and a remainder.
+
+        Args:
+            wids ([int]): wave ids to transmit in order
+            count (int): number of repetitions
+
+        Returns:
+            [int]: wave_chain() commands
+        """
+        def _loop(chain, n):
+            if n == 1:
+                return chain
+            return [255, 0] + chain + [255, 1, n & 255, n >> 8]
+
+        outer, inner = divmod(count, self.WAVE_MAX_LOOP)
+        if outer > self.WAVE_MAX_LOOP:
+            raise Exception("Error: Too many pulses for waveform: " + str(count))
+        chain = []
+        if outer:
+            chain += _loop(_loop(list(wids), self.WAVE_MAX_LOOP), outer)
+        if inner:
+            chain += _loop(list(wids), inner)
+        return chain
+
+
+    def _wave_wait(self, duration):
+        """Waits until the daemon has transmitted the current waveform.
+        When the motion is aborted, stops the transmission.
+
+        Args:
+            duration (float): expected transmission time (s)
+
+        Returns:
+            float: time (s) from the start of the waveform to the stop when
+                   aborted, None otherwise
+        """
+        start = self.gpio.monotonic()
+        aborted = self.gpio.wait_event(self._abort, duration)
+        while not aborted and self.gpio.wave_tx_busy():
+            aborted = self.gpio.wait_event(self._abort, self.WAVE_POLL)
+        if not aborted:
+            return None
+        self._wave_stop()
+        return self.gpio.monotonic() - start
+
+
+    def _wave_lock(self):
+        """Returns the lock of the wave transmitter of the daemon. pigpio
+        transmits one wave chain at a time, so the wave output of all drivers
+        on a connection is serialized by this lock.
+
+        Returns:
+            threading.Lock: wave_lock of the backend, shared by its drivers
+        """
+        return self.gpio.wave_lock
+
+
+    def _wave_stop(self):
+        """Stops the waveform transmission. The step GPIO is cleared, as the
+        transmission may stop halfway a step pulse.
+        """
+        self.gpio.wave_tx_stop()
+        self.gpio.clear_bank_1(1 << self.GPIOS['step'])
+        self.commands_sent += 1
+
+
+    @staticmethod
+    def _runs_output(runs, elapsed):
+        """Returns the number of pulses of a table of pulse runs that started
+        within the elapsed time, e.g. up to the stop of an aborted waveform.
+
+        Args:
+            runs ([(int, int, int, int[, int])]): table of pulse runs, see pulse_runs()
+            elapsed (float): time (s) since the start of the waveform
+
+        Returns:
+            int: number of pulses output
+        """
+        elapsed = elapsed * 1000000
+        output = 0
+        for run in runs:
+            period, count = run[:2]
+            if elapsed < 0:
+                break
+            n = min(count, int(round(elapsed / period, 6)) + 1)
+            output += n
+            elapsed -= n * period
+        return output
+
+
+    def _stream_chunks(self, runs):
+        """Packs pulse runs into waves of at most STREAM_CHUNK step pulses,
+        see stream_runs(). Long runs are split over several waves.
+
+        Args:
+            runs (iterable): pulse runs, see pulse_runs()
+
+        Yields:
+            ([pigpio.pulse], int, float, int, int): pulses of the wave, number of
+                                                    step pulses, duration (s) and
+                                                    bits of other GPIOs set and cleared
+        """
+        pulses = []
+        count = 0
+        duration = 0
+        on_bits = 0
+        off_bits = 0
+        for run in runs:
+            period, n, on_mask, off_mask = run[:4]
+            step_mask = run[4] if len(run) > 4 else None
+            step = None
+            while n > 0:
+                if on_mask or off_mask:
+                    pulses += self._wave_step(period, on_mask, off_mask, step_mask)
+                    on_bits = (on_bits | on_mask) & ~off_mask
+                    off_bits = (off_bits | off_mask) & ~on_mask
+                    on_mask = off_mask = 0
+                    take = 1
+                else:
+                    take = min(n, self.STREAM_CHUNK - count)
+                    step = step or self._wave_step(period, step_mask=step_mask)
+                    pulses += step * take
+                n -= take
+                count += take
+                duration += period * take
+                if count >= self.STREAM_CHUNK:
+                    yield pulses, count, duration / 1000000, on_bits, off_bits
+                    pulses = []
+                    count = 0
+                    duration = 0
+                    on_bits = 0
+                    off_bits = 0
+        if count:
+            yield pulses, count, duration / 1000000, on_bits, off_bits
+
+
+    def _stream_release(self, waves):
+        """Waits until the oldest streamed wave has been transmitted, then deletes it.
+
+        Args:
+            waves ([(int, int, float, [pigpio.pulse])]): wave id, number of step pulses, end
+                                                        time and pulses of the streamed
+                                                        waves, oldest first
+
+        Returns:
+            bool: False if the motion was aborted while waiting
+        """
+        wid, count, end, _ = waves[0]
+        if self.gpio.wait_event(self._abort, end - self.gpio.monotonic()):
+            return False
+        while self.gpio.wave_tx_at() == wid or (len(waves) == 1 and self.gpio.wave_tx_busy()):
+            if self.gpio.wait_event(self._abort, self.WAVE_POLL):
+                return False
+        waves.pop(0)
+        self.gpio.wave_delete(wid)
+        self.last_pulses += count
+        self.last_stream["pulses"] = self.last_pulses
+        if self._trace:
+            self._trace(Tracer.PULSE_END, count)
+        return True
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import os
+import json
+import time
+import threading
+
+class Calibration:
+    """
+    This class keeps the command latency measurements of pigpio daemons in a
+    small JSON file, keyed by host, port and pigpio daemon version, so the
+    timing corrections of the drivers are tuned per machine. The file is
+    read once per process.
+    """
+    FILENAME = os.path.join(os.path.expanduser("~"), ".config", "steppermotor_precise",
+                            "calibration.json")
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, filename=None):
+        """Initialize the calibration store.
+
+        Args:
+            filename (str, optional): Name of the calibration file. Defaults to None
+                                      for STEPPERMOTOR_CALIBRATION or FILENAME.
+        """
+        self.filename = filename or os.getenv("STEPPERMOTOR_CALIBRATION") or self.FILENAME
+        self._data = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(gpio):
+        """Returns the key of a GPIO backend: host, port and daemon version.
+
+        Args:
+            gpio (GPIOBackend): GPIO backend
+
+        Returns:
+            str: key in the calibration file
+        """
+        host = getattr(gpio, '_host', None) or type(gpio).__name__
+        port = getattr(gpio, '_port', None)
+        version = getattr(gpio, 'get_pigpio_version', None)
+        return str(host) + ":" + str(port) + ":" + str(version() if version else None)
+
+    @classmethod
+    def summarize(cls, samples):
+        """Returns statistics of latency samples.
+
+        Args:
+            samples ([float]): latencies (s)
+
+        Returns:
+            dict: number of samples, minimum, maximum, mean and PERCENTILES (s)
+        """
+        samples = sorted(samples)
+        n = len(samples)
+        summary = {"samples": n, "min": samples[0], "max": samples[-1],
+                   "mean": sum(samples) / n}
+        for p in cls.PERCENTILES:
+            summary["p" + str(p)] = samples[min(n - 1, int(p * n / 100))]
+        return summary
+
+    def _read(self):
+        """Returns the contents of the calibration file, read once."""
+        if self._data is None:
+            try:
+                with open(self.filename) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def load(self, gpio):
+        """Returns the calibration of a GPIO backend.
+
+        Args:
+            gpio (GPIOBackend): GPIO backend
+
+        Returns:
+            dict: statistics per command, see summarize(), or None
+        """
+        with self._lock:
+            return self._read().get(self.key(gpio))
+
+    def save(self, gpio, results):
+        """Stores the calibration of a GPIO backend and writes the file.
+
+        Args:
+            gpio (GPIOBackend): GPIO backend
+            results (dict): statistics per command, see summarize()
+        """
+        with self._lock:
+            data = self._read()
+            data[self.key(gpio)] = dict(results, created=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # replace the file at once, other processes never read half a file
+            temporary = self.filename + "." + str(os.getpid())
+            with open(temporary, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(temporary, self.filename)
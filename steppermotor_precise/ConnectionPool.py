@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import os
+import threading
+from steppermotor_precise.PigpioBackend import PigpioBackend
+
+class ConnectionPool:
+    """
+    This class shares pigpio daemon connections between driver instances.
+    Connections are reference counted per (host, port): the first driver
+    opens the connection, the following drivers reuse it and the connection
+    is stopped when the last driver releases it. Commands of a shared
+    connection are serialized by pigpio, sequences of commands that must not
+    interleave (e.g. building a waveform) are guarded by the lock of the
+    connection.
+    """
+
+    def __init__(self, factory=None):
+        """Initialize the pool without connections.
+
+        Args:
+            factory (function, optional): Returns a new connection for a host and
+                                          port. Defaults to None for PigpioBackend.
+        """
+        self.factory = factory or PigpioBackend
+        self._lock = threading.Lock()
+        self._connections = {}      # (host, port): [connection, number of users]
+
+    @staticmethod
+    def _key(host, port):
+        """Returns the (host, port) key with the pigpio defaults filled in."""
+        host = host or os.getenv("PIGPIO_ADDR", "localhost")
+        port = int(port or os.getenv("PIGPIO_PORT", 8888))
+        return host, port
+
+    def acquire(self, host=None, port=None):
+        """Returns the shared connection to a pigpio daemon, connects if needed.
+        Every acquire() must be followed by a release().
+
+        Args:
+            host (str, optional): Host name of the daemon. Defaults to None for
+                                  PIGPIO_ADDR or localhost.
+            port (int, optional): Port of the daemon. Defaults to None for
+                                  PIGPIO_PORT or 8888.
+
+        Returns:
+            PigpioBackend: connection, check connected before use
+        """
+        key = self._key(host, port)
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is None:
+                connection = self.factory(*key)
+                if not connection.connected:
+                    return connection
+                entry = self._connections[key] = [connection, 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, connection):
+        """Releases a connection, stops it when it has no more users.
+
+        Args:
+            connection (PigpioBackend): connection returned by acquire()
+
+        Returns:
+            bool: True if the connection belongs to the pool
+        """
+        with self._lock:
+            for key, entry in self._connections.items():
+                if entry[0] is connection:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._connections[key]
+                        connection.stop()
+                    return True
+        return False
+
+    def info(self):
+        """Returns the number of users per connection.
+
+        Returns:
+            dict: (host, port): number of users
+        """
+        with self._lock:
+            return {key: entry[1] for key, entry in self._connections.items()}
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+# Vectorized estimation of the duration and pulse counts of step() and
+# auto_step() moves, without hardware. Every argument may be a scalar or a
+# NumPy array, arrays are broadcast against each other so that many candidate
+# moves are estimated at once.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _require_numpy():
+    if np is None:
+        raise Exception("Error: The estimator requires numpy, install it with 'pip install numpy'.")
+
+
+def _snap(frequency, frequencies):
+    """Returns the frequencies set_frequency() sets: the nearest entry of the
+    software PWM frequency table, or the frequency itself without a table."""
+    if not len(frequencies):
+        return frequency
+    table = np.asarray(frequencies, dtype=float)
+    return table[np.abs(frequency[..., np.newaxis] - table).argmin(axis=-1)]
+
+
+def _snap_below(frequency, frequencies):
+    """Returns the highest frequencies that are not above a frequency like
+    BasicDriver._frequency_below(), whole frequencies without a table."""
+    if not len(frequencies):
+        return np.trunc(frequency)
+    table = np.asarray(frequencies, dtype=float)
+    below = np.where(table <= frequency[..., np.newaxis], table, -np.inf).max(axis=-1)
+    return np.where(np.isfinite(below), below, table.min())
+
+
+def estimate_step(steps, frequency, stepsize, frequencies=()):
+    """Estimates step() moves: the pulses output after truncation to whole
+    microsteps, the steps made and the time needed at the PWM frequency.
+
+    Args:
+        steps (array): number of whole steps to make.
+        frequency (array): PWM frequency (Hz).
+        stepsize (array): Microstep size.
+        frequencies ([int], optional): software PWM frequency table the frequency
+                                       snaps to, see set_frequency(). Defaults to ()
+                                       for exact frequencies.
+
+    Returns:
+        dict: arrays 'pulses', 'stepsmade', 'step_error' (requested - made steps)
+              and 'duration' (s)
+    """
+    _require_numpy()
+    steps, frequency, stepsize = np.broadcast_arrays(
+        np.asarray(steps, dtype=float), np.asarray(frequency, dtype=float),
+        np.asarray(stepsize, dtype=float))
+
+    pulses = np.trunc(np.abs(steps) / stepsize)
+    stepsmade = np.copysign(pulses * stepsize, steps)
+    return {"pulses": pulses.astype(np.int64),
+            "stepsmade": stepsmade,
+            "step_error": steps - stepsmade,
+            "duration": pulses / _snap(frequency, frequencies)}
+
+
+def estimate_auto_step(STEPSIZE, steps, frequency, stepsize_min, stepsize_max,
+                       accel_microsteps, stepsize, bands=(), frequencies=()):
+    """Estimates auto_step() moves without acceleration profile.
+    Follows StagePlanner.plan(): for every candidate largest microstep size,
+    accel_microsteps pulses at every smaller allowed size in both directions,
+    cruise pulses at the largest size and extra pulses at the smaller sizes
+    for the remainder, and picks the candidate with the fewest pulses.
+    Like auto_step(), candidates that cruise inside a resonance band are only
+    used when no other candidate exists, at a frequency lowered to below the band.
+
+    Args:
+        STEPSIZE (dict): microstep sizes of the driver chip.
+        steps (array): number of whole steps to make.
+        frequency (array): PWM frequency (Hz).
+        stepsize_min (array): Minimum microstep size, 0 or NaN for None.
+        stepsize_max (array): Maximum microstep size, 0 or NaN for None.
+        accel_microsteps (array): Number of acceleration microsteps per speed.
+        stepsize (array): Microstep size set before the move, used when no
+                          microstep size is allowed.
+        bands ([(float, float)], optional): resonance bands, lower and upper speed
+                                            (whole steps/s). Defaults to ().
+        frequencies ([int], optional): software PWM frequency table the frequency
+                                       snaps to, see set_frequency(). Defaults to ()
+                                       for exact frequencies.
+
+    Returns:
+        dict: arrays 'accel_pulses' and 'decel_pulses' (moves x STEPSIZE
+              entries in ascending order), 'cruise_pulses', 'cruise_size',
+              'pulses', 'stepsmade', 'step_error' and 'duration' (s).
+              'sizes' holds the microstep sizes of the columns.
+    """
+    _require_numpy()
+    steps, frequency, stepsize_min, stepsize_max, accel_microsteps, stepsize = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in
+          (steps, frequency, stepsize_min, stepsize_max, accel_microsteps, stepsize)))
+    steps = np.atleast_1d(steps)
+    shape = steps.shape
+    sizes = np.array(sorted(STEPSIZE), dtype=float)
+    accel = np.abs(np.trunc(np.atleast_1d(accel_microsteps)))
+    current = np.atleast_1d(stepsize)
+    frequency = _snap(np.atleast_1d(frequency), frequencies)
+
+    def _col(a):
+        return np.atleast_1d(np.nan_to_num(a))[..., np.newaxis]
+
+    # determine allowed stepsizes
+    allowed = ((_col(stepsize_min) > 0) & (sizes >= _col(stepsize_min)) &
+               (_col(stepsize_max) > 0) & (sizes <= _col(stepsize_max)))
+    any_allowed = allowed.any(axis=-1)
+    smallest = np.where(any_allowed, np.where(allowed, sizes, np.inf).min(axis=-1), current)
+
+    # sizes at which the speed is inside a resonance band
+    speeds = np.atleast_1d(frequency)[..., np.newaxis] * sizes
+    resonant = np.zeros(speeds.shape, dtype=bool)
+    for low, high in bands:
+        resonant |= (low < speeds) & (speeds < high)
+
+    # can only make whole number of finest microsteps
+    total = np.trunc(np.abs(steps) / smallest) * smallest
+
+    # without allowed stepsizes, the move is a cruise at the current stepsize
+    best_pulses = np.where(any_allowed, np.inf, np.trunc(np.abs(steps) / current))
+    best_top = np.full(shape, -1)
+    best_cruise = np.where(any_allowed, 0.0, best_pulses)
+    best_extra = np.zeros(shape + (len(sizes),))
+    # candidates that cruise inside a band
+    fallback_pulses = np.full(shape, np.inf)
+    fallback_top = np.full(shape, -1)
+    fallback_cruise = np.zeros(shape)
+    fallback_extra = np.zeros(shape + (len(sizes),))
+
+    # try every allowed size as the largest, sizes are multiples of each other
+    ramp = np.zeros(shape)
+    below = np.zeros(shape)
+    for top in range(len(sizes)):
+        valid = allowed[..., top] & (2 * ramp <= total)
+        remainder = np.maximum(total - 2 * ramp, 0)
+        cruise = np.floor(remainder / sizes[top])
+        remainder = remainder - cruise * sizes[top]
+        extra = np.zeros(shape + (len(sizes),))
+        for i in reversed(range(top)):
+            # no extra pulses at resonant sizes, except at the smallest size
+            usable = allowed[..., i] & ~(resonant[..., i] & (sizes[i] > smallest))
+            extra[..., i] = np.where(usable, np.floor(remainder / sizes[i]), 0)
+            remainder = remainder - extra[..., i] * sizes[i]
+        pulses = 2 * accel * below + cruise + extra.sum(axis=-1)
+        in_band = resonant[..., top] & (cruise > 0)
+        worse = valid & in_band & (pulses < fallback_pulses)
+        fallback_pulses = np.where(worse, pulses, fallback_pulses)
+        fallback_top = np.where(worse, top, fallback_top)
+        fallback_cruise = np.where(worse, cruise, fallback_cruise)
+        fallback_extra = np.where(worse[..., np.newaxis], extra, fallback_extra)
+        valid = valid & ~in_band
+        better = valid & (pulses < best_pulses)
+        best_pulses = np.where(better, pulses, best_pulses)
+        best_top = np.where(better, top, best_top)
+        best_cruise = np.where(better, cruise, best_cruise)
+        best_extra = np.where(better[..., np.newaxis], extra, best_extra)
+        ramp = ramp + np.where(allowed[..., top], accel * sizes[top], 0)
+        below = below + allowed[..., top]
+
+    # without other candidate, cruise inside a band
+    use_fallback = np.isinf(best_pulses) & (fallback_top >= 0)
+    best_pulses = np.where(use_fallback, fallback_pulses, best_pulses)
+    best_top = np.where(use_fallback, fallback_top, best_top)
+    best_cruise = np.where(use_fallback, fallback_cruise, best_cruise)
+    best_extra = np.where(use_fallback[..., np.newaxis], fallback_extra, best_extra)
+
+    ramping = allowed & (np.arange(len(sizes)) < best_top[..., np.newaxis])
+    accel_pulses = ramping * accel[..., np.newaxis] + best_extra
+    decel_pulses = ramping * accel[..., np.newaxis]
+    cruise_size = np.where(best_top >= 0, sizes[np.maximum(best_top, 0)], current)
+    stepsmade = np.copysign((accel_pulses * sizes).sum(axis=-1) + (decel_pulses * sizes).sum(axis=-1) +
+                            best_cruise * cruise_size, steps)
+
+    # the frequency is lowered to below the band of the largest size of the move
+    top_size = np.where(best_cruise > 0, cruise_size,
+                        np.where(accel_pulses > 0, sizes, 0).max(axis=-1))
+    speed = frequency * top_size
+    for low, high in sorted(bands, reverse=True):
+        speed = np.where((low < speed) & (speed < high), low, speed)
+    frequency = np.where((speed < frequency * top_size) & (top_size > 0),
+                         _snap_below(speed / np.where(top_size > 0, top_size, 1), frequencies),
+                         frequency)
+
+    return {"sizes": sizes,
+            "accel_pulses": accel_pulses.astype(np.int64),
+            "decel_pulses": decel_pulses.astype(np.int64),
+            "cruise_pulses": best_cruise.astype(np.int64),
+            "cruise_size": cruise_size,
+            "pulses": best_pulses.astype(np.int64),
+            "stepsmade": stepsmade,
+            "step_error": steps - stepsmade,
+            "duration": best_pulses / frequency}
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import time
+import asyncio
+import threading
+
+class GPIOBackend:
+    """
+    This class defines the interface between the motor drivers and the GPIO.
+    A backend provides the subset of the pigpio.pi API used by the drivers:
+    connected, stop, set_mode, write, set_bank_1, clear_bank_1, read_bank_1,
+    set_PWM_frequency, set_PWM_dutycycle, hardware_PWM, callback,
+    wave_add_new, wave_add_generic, wave_create, wave_create_and_pad,
+    wave_delete, wave_chain, wave_send_using_mode, wave_tx_at, wave_tx_busy
+    and wave_tx_stop.
+    In addition, the backend provides the clock of the drivers: all waits
+    inside motion functions go through sleep(), wait_event(), asleep() and monotonic(),
+    and timers through call_later(), so a simulated backend can run them in
+    virtual time.
+    A backend has a lock, to guard sequences of commands (e.g. building a
+    waveform) when it is shared by several drivers, and a wave_lock, held
+    while a driver transmits waves, as the daemon transmits one at a time.
+    pwm_channels maps the hardware PWM channels in use to the GPIO that uses
+    them, so two drivers do not share a channel.
+    """
+    connected = False
+    persistent_calibration = True   # latency measurements are kept in the calibration file
+
+    def sleep(self, seconds):
+        """Waits for a number of seconds.
+
+        Args:
+            seconds (float): time to wait (s)
+        """
+        time.sleep(seconds)
+
+    def wait_event(self, event, seconds):
+        """Waits for a number of seconds or until an event is set.
+
+        Args:
+            event (threading.Event): event to wait for
+            seconds (float): maximum time to wait (s)
+
+        Returns:
+            bool: True if the event is set
+        """
+        if seconds > 0:
+            return event.wait(seconds)
+        return event.is_set()
+
+    def call_later(self, seconds, function):
+        """Calls a function after a number of seconds, from a timer thread.
+
+        Args:
+            seconds (float): time to wait (s)
+            function (function): function without arguments
+
+        Returns:
+            threading.Timer: the timer, cancel() stops it
+        """
+        timer = threading.Timer(seconds, function)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def sleep_until_ns(self, deadline, spin=0):
+        """Waits until a monotonic_ns() deadline: sleeps until spin before the
+        deadline, then spins to wake up at the deadline without oversleep.
+
+        Args:
+            deadline (int): monotonic time (ns) to wait for
+            spin (int, optional): time (ns) to spin before the deadline. Defaults to 0.
+        """
+        remaining = deadline - time.monotonic_ns() - spin
+        if remaining > 0:
+            time.sleep(remaining / 1000000000)
+        while time.monotonic_ns() < deadline:
+            pass
+
+    async def asleep(self, seconds):
+        """Asynchronous version of sleep().
+
+        Args:
+            seconds (float): time to wait (s)
+        """
+        await asyncio.sleep(seconds)
+
+    def monotonic(self):
+        """Returns the current time of the clock of the backend.
+
+        Returns:
+            float: monotonic time (s)
+        """
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        """Returns the current time of the clock of the backend in nanoseconds.
+
+        Returns:
+            int: monotonic time (ns)
+        """
+        return time.monotonic_ns()
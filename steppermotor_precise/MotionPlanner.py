@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+from steppermotor_precise.TorqueModel import TorqueModel
+
+class MotionPlanner:
+    """
+    This class queues moves and plans their junction speeds with look-ahead,
+    like the GRBL planner. Consecutive moves in the same direction blend
+    without stopping, the motor only decelerates fully at direction reversals
+    and at the end of the queue (or the end of the look-ahead window).
+    Speeds are in whole steps/s. The planned moves are compiled to profiles
+    by a ProfileCompiler. Moves with a TorqueModel cruise at most at the
+    maximum speed of the load and are planned with the acceleration of the
+    model at every speed, see TorqueModel.reachable_speed().
+    """
+    LOOKAHEAD = 16      # number of following moves considered for junction speeds
+
+    def __init__(self, compiler, lookahead=None):
+        """Initialize the planner with an empty queue.
+
+        Args:
+            compiler (ProfileCompiler): compiler for the planned moves.
+            lookahead (int, optional): Number of following moves to look ahead. Defaults to None.
+        """
+        self.compiler = compiler
+        self.lookahead = lookahead or self.LOOKAHEAD
+        self.moves = []
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, steps, frequency, start_frequency, acceleration, stepsizes, bands=()):
+        """Adds a move to the queue.
+
+        Args:
+            steps (float): number of whole steps to make, negative for counterclockwise.
+            frequency (int): cruise pulse frequency (Hz).
+            start_frequency (int): pulse frequency (Hz) at standstill.
+            acceleration (float): acceleration in whole steps/s^2, or a TorqueModel.
+            stepsizes ([float]): allowed microstep sizes.
+            bands ([(float, float)], optional): resonance bands, lower and upper
+                                                speed (whole steps/s). Defaults to ().
+        """
+        if not stepsizes:
+            raise Exception("Error: No allowed step sizes for move.")
+        vmax = frequency * max(stepsizes)
+        if isinstance(acceleration, TorqueModel):
+            # like the compiled profile, cruise at most at the maximum speed
+            vmax = min(vmax, acceleration.max_speed())
+        elif acceleration <= 0:
+            raise Exception("Error: Invalid acceleration: " + str(acceleration))
+        stepsizes = sorted(stepsizes)
+        # distance is truncated to whole finest microsteps, like the profile
+        distance = int(abs(steps) / stepsizes[0]) * stepsizes[0]
+        if not distance:
+            return
+        self.moves.append({"steps": steps, "frequency": frequency,
+                           "start_frequency": start_frequency,
+                           "acceleration": acceleration,
+                           "stepsizes": stepsizes,
+                           "distance": distance,
+                           "vmin": start_frequency * stepsizes[0],
+                           "bands": tuple(bands),
+                           "vmax": self.compiler.allowed_speed(vmax, bands)})
+
+    def clear(self):
+        """Empties the queue."""
+        self.moves = []
+
+    def plan(self):
+        """Plans the junction speeds of the queued moves, compiles them and
+        empties the queue.
+
+        Returns:
+            [Profile]: compiled profiles, to be output without pause
+        """
+        moves = self.moves
+        self.moves = []
+        n = len(moves)
+
+        # highest speed at every junction, zero speed at reversals
+        junctions = [0.0] * (n + 1)
+        for i in range(1, n):
+            a, b = moves[i - 1], moves[i]
+            if (a["steps"] >= 0) == (b["steps"] >= 0):
+                junctions[i] = min(a["vmax"], b["vmax"])
+
+        # backward pass: be able to stop at the end of the look-ahead window
+        exits = [0.0] * n
+        for i in range(n):
+            end = min(i + self.lookahead, n - 1)
+            v = 0.0
+            for j in range(end, i, -1):
+                v = min(junctions[j], self._reach(moves[j], v))
+            exits[i] = min(junctions[i + 1], v) if i < n - 1 else 0.0
+
+        # forward pass: limit to what can be reached from the entry speed
+        profiles = []
+        entry = 0.0
+        for i, move in enumerate(moves):
+            exit_speed = min(exits[i], self._reach(move, entry))
+            profiles.append(self.compiler.compile(
+                move["steps"], move["frequency"], move["start_frequency"],
+                move["acceleration"], move["stepsizes"],
+                entry_speed=max(entry, move["vmin"]),
+                exit_speed=max(exit_speed, move["vmin"]), bands=move["bands"]))
+            entry = exit_speed
+        return profiles
+
+    @staticmethod
+    def _reach(move, speed):
+        """Returns the speed reached by accelerating over the distance of a move.
+
+        Args:
+            move (dict): queued move
+            speed (float): speed (whole steps/s) at the start of the move
+
+        Returns:
+            float: speed (whole steps/s)
+        """
+        acceleration = move["acceleration"]
+        if isinstance(acceleration, TorqueModel):
+            return acceleration.reachable_speed(speed, move["distance"])
+        return math.sqrt(speed * speed + 2 * acceleration * move["distance"])
@@ -0,0 +1,340 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import os
+import json
+import struct
+import asyncio
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Frames on the socket are a header with the payload length and codec,
+# followed by the payload. A request frame holds a batch of requests
+# [id, motor, command, arguments], a completion frame a batch of
+# completions [id, ok, result or error text].
+HEADER = struct.Struct("<IB")
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+MAX_FRAME = 1 << 20
+SOCKET = "/tmp/steppermotor_precise.sock"
+
+def _socket_path(path):
+    return path or os.getenv("STEPPERMOTOR_SOCKET") or SOCKET
+
+def _encode(obj, codec):
+    if codec == CODEC_MSGPACK:
+        payload = msgpack.packb(obj)
+    else:
+        payload = json.dumps(obj, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), codec) + payload
+
+async def _read_frame(reader):
+    """Returns the codec and decoded payload of the next frame."""
+    length, codec = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise Exception("Error: Frame too large: " + str(length))
+    payload = await reader.readexactly(length)
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise Exception("Error: Received msgpack frame, install it with 'pip install msgpack'.")
+        return codec, msgpack.unpackb(payload)
+    return codec, json.loads(payload)
+
+
+class MotionServer:
+    """
+    This class is a motion server that owns the motor drivers of a Pi, so
+    several processes can share them without fighting over the GPIOs or
+    initializing drivers themselves. Clients connect to a Unix domain socket
+    and send batches of requests, see MotionClient. The requests of a motor
+    run in the order they were received, motors run concurrently, and
+    completions are sent back as soon as they are done, combined into one
+    frame when several are ready. An abort request stops the move in
+    progress without waiting in the queue of the motor.
+    """
+    # command: driver method, position is answered by the server
+    COMMANDS = {"step": "astep",
+                "auto_step": "aauto_step",
+                "enable": "aenable",
+                "disable": "adisable",
+                "position": None,
+                "abort": None}
+
+    def __init__(self, path=None, verbosity=0):
+        """Initialize the server without motors.
+
+        Args:
+            path (str, optional): Path of the Unix socket. Defaults to None for
+                                  STEPPERMOTOR_SOCKET or /tmp/steppermotor_precise.sock.
+            verbosity (int, optional): Integer to set verbosity. Defaults to 0.
+        """
+        self.path = _socket_path(path)
+        self.verbosity = verbosity
+        self.motors = {}
+        self._queues = {}
+        self._workers = []
+        self._server = None
+        self._socket = None     # device and inode of the socket created by start()
+
+    def add_motor(self, name, driver):
+        """Adds a motor driver, owned by the server from now on.
+        The position of the motor is tracked when it is not yet.
+
+        Args:
+            name (str): name of the motor in requests
+            driver (BasicDriver): motor driver
+        """
+        if not driver.tracker:
+            driver.track_position()
+        self.motors[name] = driver
+
+    async def start(self):
+        """Starts listening on the socket and running the motor queues.
+        A socket left behind by a server that exited is replaced, a socket
+        of a running server is not.
+        """
+        if os.path.exists(self.path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except ConnectionRefusedError:
+                os.unlink(self.path)
+            else:
+                writer.close()
+                raise Exception("Error: Motion server already running on " + self.path)
+        for name in self.motors:
+            self._queues[name] = asyncio.Queue()
+            self._workers.append(asyncio.ensure_future(self._run_motor(name)))
+        self._server = await asyncio.start_unix_server(self._serve_client, path=self.path)
+        stat = os.stat(self.path)
+        self._socket = (stat.st_dev, stat.st_ino)
+        if self.verbosity >= 1:
+            print("Motion server listening on " + self.path)
+
+    async def serve(self):
+        """Starts the server and serves until cancelled, then closes it."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def run(self):
+        """Runs the server in a new event loop until interrupted."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def close(self):
+        """Stops serving and closes the motor drivers."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        for driver in self.motors.values():
+            driver.close()
+        self.motors = {}
+        # only remove the socket this server created, not that of another server
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat and (stat.st_dev, stat.st_ino) == self._socket:
+            os.unlink(self.path)
+        self._socket = None
+
+    async def _serve_client(self, reader, writer):
+        """Reads request frames of a client and queues the requests per motor."""
+        outbox = asyncio.Queue()
+        codec = [CODEC_JSON]
+        sender = asyncio.ensure_future(self._send_completions(writer, outbox, codec))
+        try:
+            while True:
+                codec[0], requests = await _read_frame(reader)
+                for request in requests:
+                    self._dispatch(request, outbox)
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            # the client disconnected, or the server is closing
+            pass
+        except Exception as e:
+            if self.verbosity >= 1:
+                print(str(e))
+        finally:
+            sender.cancel()
+            writer.close()
+
+    def _dispatch(self, request, outbox):
+        """Queues a request at its motor, or completes it with an error."""
+        try:
+            id, motor, command, arguments = request
+        except (TypeError, ValueError):
+            outbox.put_nowait([None, False, "Error: Invalid request: " + repr(request)])
+            return
+        if motor not in self.motors:
+            outbox.put_nowait([id, False, "Error: Unknown motor: " + str(motor)])
+        elif command not in self.COMMANDS:
+            outbox.put_nowait([id, False, "Error: Unknown command: " + str(command)])
+        elif command == "abort":
+            # stops the move in progress instead of waiting behind it in the queue
+            try:
+                self.motors[motor].abort(wait=False, **(arguments or {}))
+                outbox.put_nowait([id, True, None])
+            except Exception as e:
+                outbox.put_nowait([id, False, str(e)])
+        else:
+            self._queues[motor].put_nowait((id, command, arguments or {}, outbox))
+
+    async def _run_motor(self, name):
+        """Runs the queued requests of a motor in order."""
+        driver = self.motors[name]
+        queue = self._queues[name]
+        while True:
+            id, command, arguments, outbox = await queue.get()
+            try:
+                if command == "position":
+                    result = driver.position
+                else:
+                    result = await getattr(driver, self.COMMANDS[command])(**arguments)
+                outbox.put_nowait([id, True, result])
+            except asyncio.CancelledError:
+                outbox.put_nowait([id, False, "Error: Motion server closed."])
+                raise
+            except Exception as e:
+                outbox.put_nowait([id, False, str(e)])
+
+    @staticmethod
+    async def _send_completions(writer, outbox, codec):
+        """Sends completions, all completions that are ready in one frame."""
+        try:
+            while True:
+                completions = [await outbox.get()]
+                while not outbox.empty():
+                    completions.append(outbox.get_nowait())
+                writer.write(_encode(completions, codec[0]))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            # the client disconnected, its completions are dropped
+            pass
+
+
+class MotionClient:
+    """
+    This class is an asyncio client of a MotionServer. send() queues a
+    request and returns a future of its result, flush() sends all queued
+    requests in one frame, so many requests take a single round trip.
+    """
+
+    def __init__(self, path=None, codec=None):
+        """Initialize the client.
+
+        Args:
+            path (str, optional): Path of the Unix socket. Defaults to None for
+                                  STEPPERMOTOR_SOCKET or /tmp/steppermotor_precise.sock.
+            codec (int, optional): CODEC_JSON or CODEC_MSGPACK. Defaults to None
+                                   for msgpack when installed.
+        """
+        self.path = _socket_path(path)
+        if codec is None:
+            codec = CODEC_MSGPACK if msgpack else CODEC_JSON
+        self.codec = codec
+        self._id = 0
+        self._batch = []
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+
+    async def connect(self):
+        """Connects to the server."""
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def close(self):
+        """Disconnects, pending requests are cancelled."""
+        if self._receiver:
+            self._receiver.cancel()
+            self._receiver = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def send(self, motor, command, **arguments):
+        """Queues a request until flush().
+
+        Args:
+            motor (str): name of the motor
+            command (str): one of MotionServer.COMMANDS
+            arguments: keyword arguments of the driver method
+
+        Returns:
+            asyncio.Future: result of the request, raises the error of the server
+        """
+        self._id += 1
+        future = asyncio.get_event_loop().create_future()
+        self._pending[self._id] = future
+        self._batch.append([self._id, motor, command, arguments])
+        return future
+
+    async def flush(self):
+        """Sends the queued requests in one frame."""
+        if self._batch:
+            self._writer.write(_encode(self._batch, self.codec))
+            self._batch = []
+            await self._writer.drain()
+
+    async def call(self, motor, command, **arguments):
+        """Sends a request and awaits its result, see send()."""
+        future = self.send(motor, command, **arguments)
+        await self.flush()
+        return await future
+
+    async def _receive(self):
+        """Resolves the futures of received completions."""
+        try:
+            while True:
+                _, completions = await _read_frame(self._reader)
+                for id, ok, result in completions:
+                    future = self._pending.pop(id, None)
+                    if future is None or future.done():
+                        continue
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(Exception(result))
+        except asyncio.IncompleteReadError:
+            self._fail_pending(Exception("Error: Motion server disconnected."))
+        except OSError as e:
+            # e.g. ConnectionResetError, no completions can arrive anymore
+            self._fail_pending(e)
+
+    def _fail_pending(self, exception):
+        """Fails the futures of all pending requests with the exception."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._pending = {}
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import os
+import mmap
+import json
+import struct
+import hashlib
+import threading
+from steppermotor_precise.Profile import Profile
+
+class MoveCache:
+    """
+    This class keeps compiled profiles in a compact binary file, so a process
+    does not have to compile the moves of a recipe again after a restart.
+    The file is memory mapped: opening it only reads the index, profiles are
+    decoded on first use and several processes share one copy in memory.
+    The file carries a stamp of the package version and the calibration,
+    all entries are ignored when the stamp does not match.
+
+    File layout (little endian):
+        header: magic, format version, stamp (32 bytes), number of entries
+        index:  key digest (16 bytes), offset and length of every entry
+        data:   steps, number of phases, and per phase the microstep size,
+                number of pulses and the period (us) of every pulse
+    """
+    FILENAME = os.path.join(os.path.expanduser("~"), ".cache", "steppermotor_precise",
+                            "moves.bin")
+    MAGIC = b"SMMC"
+    FORMAT = 1
+    HEADER = struct.Struct("<4sH32sI")
+    INDEX = struct.Struct("<16sQI")
+    PROFILE = struct.Struct("<dI")
+    PHASE = struct.Struct("<dI")
+
+    def __init__(self, filename=None, namespace="", stamp=b""):
+        """Opens the cache file, when it exists.
+
+        Args:
+            filename (str, optional): Name of the cache file. Defaults to None
+                                      for STEPPERMOTOR_MOVE_CACHE or FILENAME.
+            namespace (str, optional): Added to every key, e.g. the driver class
+                                       and its STEPSIZE table. Defaults to "".
+            stamp (bytes, optional): Stamp of the package version and calibration,
+                                     see make_stamp(). Defaults to b"".
+        """
+        self.filename = filename or os.getenv("STEPPERMOTOR_MOVE_CACHE") or self.FILENAME
+        self.namespace = namespace
+        self.stamp = hashlib.blake2b(stamp, digest_size=32).digest()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._map = None
+        self._index = {}        # key digest: (offset, length) in the mapped file
+        self._new = {}          # key digest: encoded entry, not yet saved
+        self._open()
+
+    @staticmethod
+    def make_stamp(calibration=None, version=None):
+        """Returns a stamp for the package version and calibration.
+
+        Args:
+            calibration (dict, optional): calibration of the driver. Defaults to None.
+            version (str, optional): package version. Defaults to None for the
+                                     installed version.
+
+        Returns:
+            bytes: stamp
+        """
+        if version is None:
+            try:
+                from importlib.metadata import version as package_version
+                version = package_version("python-rpi-steppermotor-precise")
+            except Exception:
+                version = __version__
+        return json.dumps([version, calibration], sort_keys=True, default=str).encode()
+
+    def _digest(self, key):
+        return hashlib.blake2b(repr((self.namespace, key)).encode(), digest_size=16).digest()
+
+    def _open(self):
+        """Maps the cache file and reads its index, ignores missing or stale files."""
+        try:
+            with open(self.filename, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if len(self._map) < self.HEADER.size:
+            return
+        magic, version, stamp, entries = self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.FORMAT or stamp != self.stamp:
+            return
+        offset = self.HEADER.size
+        for _ in range(entries):
+            digest, start, length = self.INDEX.unpack_from(self._map, offset)
+            self._index[digest] = (start, length)
+            offset += self.INDEX.size
+
+    def __len__(self):
+        return len(self._index) + len(self._new)
+
+    def get(self, key):
+        """Returns the stored profile of a key.
+
+        Args:
+            key (tuple): key of the move, e.g. the arguments of ProfileCompiler.compile()
+
+        Returns:
+            Profile: stored profile or None
+        """
+        digest = self._digest(key)
+        with self._lock:
+            data = self._new.get(digest)
+            if data is None and digest in self._index:
+                start, length = self._index[digest]
+                data = self._map[start:start + length]
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._decode(data)
+
+    def add(self, key, profile):
+        """Adds a profile, it is written to the file by save().
+
+        Args:
+            key (tuple): key of the move
+            profile (Profile): compiled profile
+        """
+        digest = self._digest(key)
+        with self._lock:
+            if digest not in self._index:
+                self._new[digest] = self._encode(profile)
+
+    def save(self):
+        """Writes the stored and added profiles to the cache file.
+        The file is replaced at once, so other processes never map half a file.
+        """
+        with self._lock:
+            if not self._new:
+                return
+            entries = [(digest, self._map[start:start + length])
+                       for digest, (start, length) in self._index.items()]
+            entries += list(self._new.items())
+
+            offset = self.HEADER.size + len(entries) * self.INDEX.size
+            index = []
+            for digest, data in entries:
+                index.append(self.INDEX.pack(digest, offset, len(data)))
+                offset += len(data)
+
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary = self.filename + "." + str(os.getpid())
+            with open(temporary, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.FORMAT, self.stamp, len(entries)))
+                f.write(b"".join(index))
+                for _, data in entries:
+                    f.write(data)
+            os.replace(temporary, self.filename)
+
+            if self._map is not None:
+                self._map.close()
+            self._map = None
+            self._index = {}
+            self._new = {}
+            self._open()
+
+    def close(self):
+        """Saves the added profiles and unmaps the file."""
+        self.save()
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._index = {}
+
+    def _encode(self, profile):
+        parts = [self.PROFILE.pack(profile.steps, len(profile.phases))]
+        for size, periods in profile.phases:
+            parts.append(self.PHASE.pack(size, len(periods)))
+            parts.append(struct.pack("<" + str(len(periods)) + "I", *periods))
+        return b"".join(parts)
+
+    def _decode(self, data):
+        steps, count = self.PROFILE.unpack_from(data, 0)
+        offset = self.PROFILE.size
+        phases = []
+        for _ in range(count):
+            size, pulses = self.PHASE.unpack_from(data, offset)
+            offset += self.PHASE.size
+            periods = struct.unpack_from("<" + str(pulses) + "I", data, offset)
+            offset += 4 * pulses
+            phases.append((size, list(periods)))
+        return Profile(steps, phases)
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+
+class MultiAxis:
+    """
+    This class coordinates the motion of several motor drivers connected
+    to the same pigpio daemon. The step pulses of all axes are interpolated
+    Bresenham-style into one combined waveform, so all axes start and stop
+    on the same DMA tick without a thread per motor.
+    """
+
+    def __init__(self, drivers, frequency=None, verbosity=0):
+        """Initialize the coordinator.
+
+        Args:
+            drivers ([BasicDriver]): motor drivers with a step size, e.g. DRV8825 or A4988.
+            frequency (int, optional): pulse frequency (Hz) of the axis with the
+                                       most pulses. Defaults to None for the
+                                       frequency of the first driver.
+            verbosity (int, optional): Integer to set verbosity. Defaults to 0.
+        """
+        if not drivers:
+            raise Exception("Error: No drivers for MultiAxis.")
+        hosts = set((getattr(d.gpio, '_host', id(d.gpio)), getattr(d.gpio, '_port', None))
+                    for d in drivers)
+        if len(hosts) > 1:
+            raise Exception("Error: MultiAxis drivers must use the same pigpio daemon.")
+        pins = [d.GPIOS['step'] for d in drivers]
+        if len(set(pins)) < len(pins):
+            raise Exception("Error: MultiAxis drivers must use different step GPIOs.")
+
+        self.drivers = list(drivers)
+        self.frequency = frequency or drivers[0].frequency
+        self.verbosity = verbosity
+
+
+    def move(self, steps, frequency=None):
+        """Make a linear move: every axis makes its number of whole steps at
+        its current microstep size, all axes start and stop together.
+        The axis with the most pulses runs at the frequency, the other
+        axes are interpolated.
+        The interpolated pulses are packed into flat waves, or streamed when
+        they exceed the wave limits of the daemon (see BasicDriver.pulse_runs()).
+
+        Args:
+            steps ([float]): number of whole steps to make per axis, in order of drivers.
+            frequency (int, optional): pulse frequency (Hz) of the axis with the
+                                       most pulses. Defaults to None.
+
+        Returns:
+            [float]: number of whole steps made per axis
+        """
+        if len(steps) != len(self.drivers):
+            raise Exception("Error: Expected steps for " + str(len(self.drivers)) + " axes.")
+
+        # can only make whole positive number of pulses
+        pulses = [int(abs(s) / d.stepsize) for s, d in zip(steps, self.drivers)]
+        ticks = max(pulses)
+        if ticks < 1:
+            return [0.0] * len(self.drivers)
+
+        for s, d in zip(steps, self.drivers):
+            if not (d.direction == (s >= 0)):
+                d.set_direction(s >= 0)
+
+        period = self.drivers[0]._wave_period(frequency or self.frequency)
+        for d in self.drivers:
+            d._wave_output_mode()
+        runs = self._runs(pulses, ticks, period)
+
+        # the first driver outputs the waveform, the others wait for their settle time
+        tracked = [(d, p) for d, p in zip(self.drivers, pulses) if d.tracker]
+        for d in self.drivers[1:]:
+            d._motion_start()
+        try:
+            for d, _ in tracked:
+                d.tracker.begin()
+            self.drivers[0].pulse_runs(runs)
+            for d, p in tracked:
+                d._track(p)
+        finally:
+            for d in self.drivers[1:]:
+                d._motion_end()
+
+        if self.verbosity >= 2:
+            print("Moved " + str(pulses) + " pulses in " + str(ticks) + " ticks")
+        return [math.copysign(p * d.stepsize, s) for p, d, s in zip(pulses, self.drivers, steps)]
+
+
+    def _runs(self, pulses, ticks, period):
+        """Interpolates the pulses of all axes over the ticks of the longest axis.
+
+        Args:
+            pulses ([int]): number of pulses per axis
+            ticks (int): number of ticks, the largest number of pulses
+            period (int): tick period (us)
+
+        Returns:
+            [(int, int, int, int, int)]: runs for BasicDriver.pulse_runs()
+        """
+        bits = [1 << d.GPIOS['step'] for d in self.drivers]
+        errors = [ticks // 2] * len(pulses)
+        runs = []
+        for _ in range(ticks):
+            mask = 0
+            for i, p in enumerate(pulses):
+                errors[i] += p
+                if errors[i] >= ticks:
+                    errors[i] -= ticks
+                    mask |= bits[i]
+            if runs and runs[-1][4] == mask:
+                runs[-1][1] += 1
+            else:
+                runs.append([period, 1, 0, 0, mask])
+        return [tuple(run) for run in runs]
@@ -0,0 +1,29 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import threading
+import pigpio as pigpio
+from steppermotor_precise.GPIOBackend import GPIOBackend
+
+class PigpioBackend(pigpio.pi, GPIOBackend):
+    """
+    This class is the default GPIO backend: a connection to the pigpio daemon
+    with the real time clock. The pigpio.pi methods are used as they are,
+    so commands have no extra overhead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Connects to the pigpio daemon, takes the arguments of pigpio.pi."""
+        super().__init__(*args, **kwargs)
+        self.lock = threading.RLock()
+        self.wave_lock = threading.Lock()
+        self.pwm_channels = {}
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+import pigpio as pigpio
+from steppermotor_precise.Tracer import Tracer
+
+class PositionTracker:
+    """
+    This class keeps the absolute position of a motor in microsteps.
+    It counts the real step pulses with a pigpio callback on the step GPIO,
+    or trusts the pulse counts of the driver when no callback is used
+    (exact for the "wave" engine, estimated for the "pwm" engine).
+    Every move results in a report of the expected and counted pulses.
+    """
+    SETTLE = 0.05       # default maximum seconds to wait for edge notifications after a move
+
+    def __init__(self, driver, callback=None, settle=None):
+        """Initialize the tracker at position 0.
+
+        Args:
+            driver (BasicDriver): motor driver to track.
+            callback (bool, optional): Count step edges with a pigpio callback. Defaults
+                                       to None to count only the estimated pulses of
+                                       the "pwm" engine, and trust the exact pulse
+                                       counts of the "wave" engine.
+            settle (float, optional): maximum seconds to wait for edge notifications
+                                      after a move, 0 to count without waiting.
+                                      Defaults to None for SETTLE.
+        """
+        self.driver = driver
+        self.settle = self.SETTLE if settle is None else settle
+        # position resolution is the finest microstep size of the driver
+        self.resolution = min(getattr(driver, 'STEPSIZE', None) or [1])
+        self.microsteps = 0
+        self.moves = 0
+        self.pulses = 0         # total expected pulses over all moves
+        self.errors = 0         # total pulse error over all moves
+        self.report = None      # report of the last move
+        self._start = 0
+        self._group = None      # expected pulses of the moves of a group, see begin_group()
+        self._callback = None
+        if callback is None:
+            callback = getattr(driver, 'engine', None) != "wave"
+        if callback:
+            self._callback = driver.gpio.callback(driver.GPIOS['step'], pigpio.RISING_EDGE)
+
+    @property
+    def position(self):
+        """float: absolute position in whole steps"""
+        return self.microsteps * self.resolution
+
+    def reset(self, position=0):
+        """Sets the absolute position, e.g. after homing.
+
+        Args:
+            position (float, optional): position in whole steps. Defaults to 0.
+        """
+        self.microsteps = int(round(position / self.resolution))
+
+    def close(self):
+        """Cancels the pigpio callback."""
+        if self._callback:
+            self._callback.cancel()
+            self._callback = None
+
+    def begin(self):
+        """Marks the start of a move, or of a part of the move of a group."""
+        if self._callback and self._group is None:
+            self._start = self._callback.tally()
+
+    def begin_group(self):
+        """Marks the start of a move made of several moves, e.g. the stages of
+        auto_step(). The moves until end_group() are reported as one move.
+        """
+        self.begin()
+        self._group = 0
+
+    def end_group(self, steps, stepsize):
+        """Marks the end of the move of a group, see end().
+
+        Args:
+            steps (float): number of whole steps the moves of the group made (expected)
+            stepsize (float): microstep size at the end of the move
+
+        Returns:
+            dict: report of the move of the group, see end()
+        """
+        pulses, self._group = self._group, None
+        return self.end(pulses, steps, stepsize)
+
+    def end(self, pulses, steps, stepsize):
+        """Marks the end of a move and updates the position with the counted pulses.
+        When the counted pulses differ from the expected pulses, the
+        difference is corrected with the microstep size of the end of the move.
+
+        Args:
+            pulses (int): number of pulses the driver output (expected)
+            steps (float): number of whole steps the driver made (expected)
+            stepsize (float): microstep size at the end of the move
+
+        Returns:
+            dict: report of expected and counted pulses, pulse error, steps made
+                  and the new position. Within a group the counted pulses and
+                  the position are only updated at end_group().
+        """
+        if self._group is not None:
+            self._group += pulses
+            return {"pulses": pulses, "counted": pulses, "error": 0,
+                    "steps": steps, "made": steps, "position": self.position}
+
+        counted = pulses
+        if self._callback:
+            # edge notifications arrive after the pulses, wait for them to settle
+            clock = self.driver.gpio
+            deadline = clock.monotonic() + self.settle
+            counted = self._callback.tally() - self._start
+            while counted < pulses and clock.monotonic() < deadline:
+                clock.sleep(0.001)
+                counted = self._callback.tally() - self._start
+
+        error = counted - pulses
+        made = math.copysign(abs(steps) + error * stepsize, steps)
+        self.microsteps += int(round(made / self.resolution))
+        self.moves += 1
+        self.pulses += pulses
+        self.errors += error
+        self.report = {"pulses": pulses, "counted": counted, "error": error,
+                       "steps": steps, "made": made, "position": self.position}
+        if self.driver._trace:
+            self.driver._trace(Tracer.MOVE_REPORT, made, error)
+        return self.report
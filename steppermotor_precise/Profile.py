@@ -0,0 +1,416 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+import threading
+from collections import OrderedDict
+from steppermotor_precise.TorqueModel import TorqueModel
+
+class Profile:
+    """
+    This class holds a compiled motion profile: a per-pulse timing table
+    of a move, grouped in phases of equal microstep size.
+    """
+
+    def __init__(self, steps, phases):
+        """Initialize the profile.
+
+        Args:
+            steps (float): requested number of whole steps, negative for counterclockwise.
+            phases ([(float, [int])]): list of microstep size versus the
+                                       period (us) of every pulse at that size.
+        """
+        self.steps = steps
+        self.phases = phases
+
+    @property
+    def direction(self):
+        """bool: Rotation direction, True for clockwise"""
+        return self.steps >= 0
+
+    @property
+    def pulses(self):
+        """int: total number of pulses"""
+        return sum(len(periods) for _, periods in self.phases)
+
+    @property
+    def stepsmade(self):
+        """float: number of whole steps made by the profile, with the sign of steps"""
+        return math.copysign(sum(size * len(periods) for size, periods in self.phases),
+                             self.steps)
+
+    def position(self, pulses):
+        """Returns the steps made and microstep size after a number of pulses,
+        e.g. for a profile that was stopped early.
+
+        Args:
+            pulses (int): number of pulses output
+
+        Returns:
+            (float, float): number of whole steps made with the sign of steps,
+                            and the microstep size of the last pulse
+        """
+        made = 0
+        stepsize = None
+        for size, periods in self.phases:
+            if pulses <= 0:
+                break
+            n = min(pulses, len(periods))
+            made += size * n
+            stepsize = size
+            pulses -= n
+        return math.copysign(made, self.steps), stepsize
+
+    def speed(self, pulses):
+        """Returns the speed of the last pulse after a number of pulses,
+        e.g. to decelerate from a profile that was stopped early.
+
+        Args:
+            pulses (int): number of pulses output
+
+        Returns:
+            float: speed (whole steps/s), 0 before the first pulse
+        """
+        for size, periods in self.phases:
+            if pulses <= len(periods):
+                return 1000000 * size / periods[pulses - 1] if pulses > 0 else 0.0
+            pulses -= len(periods)
+        return 0.0
+
+    @property
+    def duration(self):
+        """float: duration of the profile (s)"""
+        return sum(sum(periods) for _, periods in self.phases) / 1000000
+
+    def runs(self):
+        """Returns the timing table with consecutive equal pulses combined.
+
+        Returns:
+            [(float, int, int)]: list of microstep size, period (us) and number of pulses
+        """
+        runs = []
+        for size, periods in self.phases:
+            for period in periods:
+                if runs and runs[-1][0] == size and runs[-1][1] == period:
+                    runs[-1][2] += 1
+                else:
+                    runs.append([size, period, 1])
+        return [tuple(run) for run in runs]
+
+
+class ProfileCompiler:
+    """
+    This class compiles trapezoidal acceleration profiles into per-pulse
+    timing tables and keeps the compiled profiles in a bounded LRU cache,
+    backed by an optional persistent MoveCache shared between processes.
+    The speed ramps up from the start frequency at the finest microstep size
+    with the specified acceleration and switches to coarser microstep sizes
+    whenever the pulse rate would exceed the cruise frequency.
+    With a TorqueModel instead of a constant acceleration, the speed ramps up
+    with the highest acceleration the motor sustains at every speed, so the
+    profile is time-optimal for the load.
+    Resonance bands of the motor are swept through with BAND_BOOST times the
+    acceleration, and a move never cruises or peaks inside a band.
+    """
+    MAXSIZE = 256           # default maximum number of cached profiles
+    BAND_BOOST = 2          # acceleration factor while sweeping through a resonance band
+
+    def __init__(self, maxsize=None, store=None):
+        """Initialize the compiler with an empty cache.
+
+        Args:
+            maxsize (int, optional): Maximum number of cached profiles. Defaults to None.
+            store (MoveCache, optional): Persistent cache of compiled profiles. Defaults to None.
+        """
+        self.maxsize = maxsize or self.MAXSIZE
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def info(self):
+        """Returns cache statistics.
+
+        Returns:
+            dict: hits, misses, current size and maximum size of the cache,
+                  and hits, misses and size of the persistent store
+        """
+        info = {"hits": self.hits, "misses": self.misses,
+                "size": len(self._cache), "maxsize": self.maxsize}
+        if self.store is not None:
+            info.update({"store_hits": self.store.hits, "store_misses": self.store.misses,
+                         "store_size": len(self.store)})
+        return info
+
+    def clear(self):
+        """Empties the cache and resets the statistics."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @staticmethod
+    def allowed_speed(speed, bands):
+        """Returns the speed, or the lower edge of the resonance band it is in.
+
+        Args:
+            speed (float): speed (whole steps/s)
+            bands ([(float, float)]): resonance bands, lower and upper speed (whole steps/s)
+
+        Returns:
+            float: highest speed up to speed outside the bands
+        """
+        for low, high in sorted(bands, reverse=True):
+            if low < speed < high:
+                speed = low
+        return speed
+
+    @staticmethod
+    def stopping_distance(speed, start_frequency, acceleration, stepsizes, bands=(),
+                          limit=None):
+        """Returns the distance a compiled profile needs to slow down from a
+        speed to the start frequency at the finest microstep size.
+
+        Args:
+            speed (float): speed (whole steps/s)
+            start_frequency (int): pulse frequency (Hz) at the end of the move.
+            acceleration (float): acceleration in whole steps/s^2, or a TorqueModel.
+            stepsizes ([float]): allowed microstep sizes.
+            bands ([(float, float)], optional): resonance bands, lower and upper
+                                                speed (whole steps/s). Defaults to ().
+            limit (float, optional): maximum distance (whole steps). Defaults to None.
+
+        Returns:
+            float: distance (whole steps), a multiple of the finest microstep size
+        """
+        finest = stepsizes[0]
+        v0 = start_frequency * finest
+        limit = math.inf if limit is None else int(abs(limit) / finest)
+        if speed <= v0:
+            return min(1, limit) * finest
+        if isinstance(acceleration, TorqueModel):
+            # ticks below the speed, the speed is reached after the last one
+            ticks = len(ProfileCompiler._ramp_table(v0 ** 2, finest, limit,
+                                                    acceleration, speed)) + 1
+        else:
+            # fewest ticks at which the ramp reaches the speed
+            low = 1
+            high = int(math.ceil((speed ** 2 - v0 ** 2) / (2 * acceleration * finest))) + 1
+            bands = sorted(bands)
+            while low < high:
+                middle = (low + high) // 2
+                if ProfileCompiler._ramp(v0 ** 2, (middle - 1) * finest, acceleration,
+                                         bands) >= speed:
+                    high = middle
+                else:
+                    low = middle + 1
+            ticks = low
+        return min(ticks, limit) * finest
+
+    def compile(self, steps, frequency, start_frequency, acceleration, stepsizes,
+                entry_speed=None, exit_speed=None, bands=()):
+        """Returns the profile for the move, from cache or store when available.
+
+        Args:
+            steps (float): number of whole steps to make, negative for counterclockwise.
+            frequency (int): cruise pulse frequency (Hz).
+            start_frequency (int): pulse frequency (Hz) at start and end of the move.
+            acceleration (float): acceleration in whole steps/s^2, or a TorqueModel.
+            stepsizes ([float]): allowed microstep sizes.
+            entry_speed (float, optional): speed (whole steps/s) at the start of the
+                                           move, for blended moves. Defaults to None.
+            exit_speed (float, optional): speed (whole steps/s) at the end of the
+                                          move, for blended moves. Defaults to None.
+            bands ([(float, float)], optional): resonance bands, lower and upper
+                                                speed (whole steps/s). Defaults to ().
+
+        Returns:
+            Profile: compiled profile
+        """
+        if entry_speed is not None:
+            entry_speed = round(entry_speed, 6)
+        if exit_speed is not None:
+            exit_speed = round(exit_speed, 6)
+        key = (steps, frequency, start_frequency, acceleration, tuple(sorted(stepsizes)),
+               entry_speed, exit_speed, tuple(sorted(tuple(band) for band in bands)))
+        with self._lock:
+            profile = self._cache.get(key)
+            if profile is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return profile
+            self.misses += 1
+
+        profile = self.store.get(key) if self.store is not None else None
+        if profile is None:
+            profile = self._compile(*key)
+            if self.store is not None:
+                self.store.add(key, profile)
+
+        with self._lock:
+            self._cache[key] = profile
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return profile
+
+    @staticmethod
+    def _compile(steps, frequency, start_frequency, acceleration, stepsizes,
+                 entry_speed=None, exit_speed=None, bands=()):
+        """Compiles the per-pulse timing table of a trapezoidal move.
+        Positions are counted in ticks of the finest microstep size. A coarser
+        microstep size is only used at positions that are a multiple of it,
+        so the move ends exactly at the requested finest microstep.
+        The move starts and ends at the start frequency at the finest
+        microstep size, or at the entry and exit speeds when specified.
+        When the cruise speed, or the peak speed of a short move, is inside a
+        resonance band, the move cruises at the lower edge of the band instead.
+        A TorqueModel already gives the highest acceleration at every speed,
+        so its bands are swept through without BAND_BOOST.
+
+        Returns:
+            Profile: compiled profile
+        """
+        if not stepsizes:
+            raise Exception("Error: No allowed step sizes for profile.")
+        if not isinstance(acceleration, TorqueModel) and acceleration <= 0:
+            raise Exception("Error: Invalid acceleration: " + str(acceleration))
+        if start_frequency < 1 or start_frequency > frequency:
+            raise Exception("Error: Invalid start frequency: " + str(start_frequency))
+
+        finest = stepsizes[0]
+        ticks = [int(round(size / finest)) for size in stepsizes]
+        total = int(abs(steps) / finest)
+        v0 = start_frequency * finest
+        vmax = frequency * stepsizes[-1]
+        entry_sq = max(entry_speed or v0, v0) ** 2
+        exit_sq = max(exit_speed or v0, v0) ** 2
+        min_period = int(round(1000000 / frequency))
+        bands = sorted(bands)
+
+        if isinstance(acceleration, TorqueModel):
+            vmax = min(vmax, acceleration.max_speed())
+            up = ProfileCompiler._ramp_table(entry_sq, finest, total, acceleration, vmax)
+            down = ProfileCompiler._ramp_table(exit_sq, finest, total, acceleration, vmax)
+
+            def _up(pos):
+                return up[pos] if pos < len(up) else vmax
+
+            def _down(pos):
+                pos = max(total - pos - 1, 0)
+                return down[pos] if pos < len(down) else vmax
+        else:
+            def _up(pos):
+                return ProfileCompiler._ramp(entry_sq, pos * finest, acceleration, bands)
+
+            def _down(pos):
+                return ProfileCompiler._ramp(exit_sq, max(total - pos - 1, 0) * finest,
+                                             acceleration, bands)
+
+        if bands and total:
+            # peak speed where the acceleration meets the deceleration
+            low, high = 0, total - 1
+            while low < high:
+                middle = (low + high) // 2
+                if _up(middle) >= _down(middle):
+                    high = middle
+                else:
+                    low = middle + 1
+            peak = max(min(_up(pos), _down(pos)) for pos in (max(low - 1, 0), low))
+            cruise = ProfileCompiler.allowed_speed(min(vmax, peak), bands)
+            if cruise < min(vmax, peak) and cruise ** 2 >= max(entry_sq, exit_sq):
+                vmax = cruise
+
+        phases = []
+        pos = 0
+        while pos < total:
+            v = min(_up(pos), _down(pos), vmax)
+
+            # finest step size that keeps the pulse rate within the frequency
+            i = 0
+            while i < len(stepsizes) - 1 and v / stepsizes[i] > frequency:
+                i += 1
+            # step down to a size that is aligned and fits the remaining ticks
+            while i > 0 and (pos % ticks[i] or total - pos < ticks[i]):
+                i -= 1
+
+            period = max(int(round(1000000 * stepsizes[i] / v)), min_period)
+            if bands:
+                # do not round a speed at the edge of a band into the band
+                speed = 1000000 * stepsizes[i] / period
+                if (ProfileCompiler.allowed_speed(speed, bands) < speed and
+                        ProfileCompiler.allowed_speed(v, bands) == v):
+                    period = int(math.ceil(1000000 * stepsizes[i] / v))
+            if phases and phases[-1][0] == stepsizes[i]:
+                phases[-1][1].append(period)
+            else:
+                phases.append((stepsizes[i], [period]))
+            pos += ticks[i]
+
+        return Profile(steps, phases)
+
+    @staticmethod
+    def _ramp(start_sq, distance, acceleration, bands):
+        """Returns the speed after accelerating over a distance, with
+        BAND_BOOST times the acceleration inside the resonance bands.
+
+        Args:
+            start_sq (float): square of the start speed (whole steps/s)
+            distance (float): distance (whole steps)
+            acceleration (float): acceleration in whole steps/s^2
+            bands ([(float, float)]): sorted resonance bands (whole steps/s)
+
+        Returns:
+            float: speed (whole steps/s)
+        """
+        v_sq = start_sq
+        for low, high in bands:
+            if high * high <= v_sq:
+                continue
+            if v_sq < low * low:
+                needed = (low * low - v_sq) / (2 * acceleration)
+                if distance <= needed:
+                    break
+                v_sq = low * low
+                distance -= needed
+            boosted = acceleration * ProfileCompiler.BAND_BOOST
+            needed = (high * high - v_sq) / (2 * boosted)
+            if distance <= needed:
+                return math.sqrt(v_sq + 2 * boosted * distance)
+            v_sq = high * high
+            distance -= needed
+        return math.sqrt(v_sq + 2 * acceleration * distance)
+
+    @staticmethod
+    def _ramp_table(start_sq, finest, ticks, model, vmax):
+        """Returns the speed at every tick of the finest microstep size while
+        accelerating with the acceleration of a TorqueModel, up to vmax.
+
+        Args:
+            start_sq (float): square of the start speed (whole steps/s)
+            finest (float): finest microstep size (whole steps)
+            ticks (int): maximum number of ticks
+            model (TorqueModel): torque model of motor and load
+            vmax (float): maximum speed (whole steps/s)
+
+        Returns:
+            [float]: speed (whole steps/s) at every tick, until vmax is reached
+        """
+        speeds = []
+        v_sq = start_sq
+        while len(speeds) < ticks:
+            v = math.sqrt(v_sq)
+            if v >= vmax:
+                break
+            speeds.append(v)
+            v_sq += 2 * max(model.acceleration(v), 0) * finest
+        return speeds
@@ -0,0 +1,538 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+import heapq
+import asyncio
+import itertools
+import threading
+from steppermotor_precise.GPIOBackend import GPIOBackend
+
+class _Tally:
+    """Rising edge counter of the simulator, replaces a pigpio callback."""
+
+    def __init__(self, sim, gpio):
+        self.sim = sim
+        self.gpio = gpio
+        self._start = sim.count(gpio)
+
+    def tally(self):
+        return self.sim.count(self.gpio) - self._start
+
+    def reset_tally(self):
+        self._start = self.sim.count(self.gpio)
+
+    def cancel(self):
+        pass
+
+
+class _Call:
+    """Function scheduled by call_at() of the simulator, replaces a timer."""
+
+    def __init__(self, function):
+        self.function = function
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimulatorBackend(GPIOBackend):
+    """
+    This class is a deterministic GPIO backend without hardware. It has a
+    virtual clock that only advances when the drivers sleep, so motion
+    functions run at full speed. Every command is recorded in events and
+    every pin edge in edge_log, both with virtual timestamps (s). PWM output
+    and waveforms are simulated in virtual time, including the frequency
+    table of software PWM and the loops of wave_chain().
+    """
+    # software PWM frequencies (Hz) at the default sample rate of 5 us
+    PWM_FREQUENCIES = (8000, 4000, 2000, 1600, 1000, 800, 500, 400, 320, 250,
+                       200, 160, 100, 80, 50, 40, 20, 10)
+    PWM_RANGE = 255         # software PWM duty cycle range
+    MAX_PULSES = 12000      # wave memory, in pulses of all waves together
+    MAX_WAVES = 250         # number of waves, wave ids are 0..MAX_WAVES - 1
+    MAX_CHAIN = 600         # maximum length of wave_chain() data
+    MAX_LOOPS = 20          # maximum number of loops of one wave_chain()
+    WAVE_MODE_ONE_SHOT = 0  # wave_send_using_mode() modes
+    WAVE_MODE_ONE_SHOT_SYNC = 2
+    WAVE_NOT_FOUND = 9998   # wave_tx_at() results
+    NO_TX_WAVE = 9999
+    persistent_calibration = False  # simulated latencies are not kept in the calibration file
+
+    def __init__(self, record_edges=True):
+        """Initialize the simulator at virtual time 0 with all GPIOs low.
+
+        Args:
+            record_edges (bool, optional): Record every pin edge in edge_log,
+                                           disable for long runs. Defaults to True.
+        """
+        self.connected = True
+        self.lock = threading.RLock()
+        self.wave_lock = threading.Lock()
+        self.pwm_channels = {}      # GPIO per hardware PWM channel in use
+        self.now = 0.0              # virtual time (s)
+        self.record_edges = record_edges
+        self.events = []            # (time, command, arguments) of every command
+        self.edge_log = []          # (time, GPIO, level) of every edge
+        self.modes = {}             # mode per GPIO
+        self.waves = {}             # pulses per wave id
+        self._wave_size = {}        # wave memory used per wave id, padded
+        self._high = 0              # bits of high GPIOs
+        self._alt = 0               # bits of GPIOs in the ALT mode of hardware PWM
+        self._rising = {}           # number of rising edges per GPIO
+        self._wave = []
+        self._pwm_frequency = {}    # software PWM frequency per GPIO
+        self._pwm = {}              # running PWM per GPIO: [frequency, high fraction,
+                                    # time of first pulse, pulses counted]
+        self._tx = None             # pulses of the wave chain being transmitted
+        self._tx_next = None        # next (time, on bits, off bits) of the chain
+        self._tx_end = 0            # time at which the wave chain ends
+        self._tx_waves = []         # (start, end, wave id) of waves sent with wave_send_using_mode()
+        self._calls = []            # heap of (time, number, _Call) scheduled by call_at()
+        self._call_number = itertools.count()
+        self._sleepers = []         # heap of (time, number, future) of asleep() calls
+        self._waking = False        # _wake() is scheduled
+
+    def sleep(self, seconds):
+        """Advances the virtual clock without waiting.
+
+        Args:
+            seconds (float): time to advance (s)
+        """
+        self._run_until(self.now + max(seconds, 0))
+
+    def wait_event(self, event, seconds):
+        """Advances the virtual clock like sleep(), stops when a function
+        scheduled with call_at() sets the event.
+
+        Args:
+            event (threading.Event): event to wait for
+            seconds (float): maximum time to advance (s)
+
+        Returns:
+            bool: True if the event is set
+        """
+        if event.is_set():
+            return True
+        return self._run_until(self.now + max(seconds, 0), event)
+
+    def call_at(self, t, function):
+        """Schedules a function at a virtual time, e.g. to call abort() as if
+        from another thread while a move is waiting.
+
+        Args:
+            t (float): virtual time (s)
+            function (function): function without arguments
+
+        Returns:
+            _Call: the scheduled call, cancel() removes it
+        """
+        call = _Call(function)
+        heapq.heappush(self._calls, (t, next(self._call_number), call))
+        return call
+
+    def call_later(self, seconds, function):
+        """Schedules a function after a number of seconds of virtual time,
+        see call_at().
+
+        Args:
+            seconds (float): time to wait (s)
+            function (function): function without arguments
+
+        Returns:
+            _Call: the scheduled call, cancel() removes it
+        """
+        return self.call_at(self.now + max(seconds, 0), function)
+
+    def _run_until(self, end, event=None):
+        """Advances the virtual clock to end, runs the scheduled functions on
+        the way and stops early when one of them sets the event.
+        """
+        while self._calls and self._calls[0][0] <= end:
+            t, _, call = heapq.heappop(self._calls)
+            if call.cancelled:
+                continue
+            self.now = max(self.now, t)
+            self._advance()
+            call.function()
+            if event is not None and event.is_set():
+                return True
+        self.now = max(self.now, end)
+        self._advance()
+        return event is not None and event.is_set()
+
+    def sleep_until_ns(self, deadline, spin=0):
+        """Advances the virtual clock to a monotonic_ns() deadline.
+
+        Args:
+            deadline (int): virtual time (ns) to advance to
+            spin (int, optional): ignored. Defaults to 0.
+        """
+        self.sleep(deadline / 1000000000 - self.now)
+
+    async def asleep(self, seconds):
+        """Asynchronous version of sleep(). Coroutines that wait concurrently
+        share the virtual clock: it advances to the earliest deadline of the
+        waiting coroutines and wakes only that one, see _wake().
+
+        Args:
+            seconds (float): time to wait (s)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._sleepers, (self.now + max(seconds, 0), next(self._call_number),
+                                        future))
+        if not self._waking:
+            self._waking = True
+            loop.call_soon(self._wake)
+        await future
+
+    def _wake(self):
+        """Advances the virtual clock to the earliest deadline of asleep() and
+        wakes that coroutine. Runs from the event loop after the coroutines
+        that are ready, so all coroutines that start waiting at the same
+        virtual time have added their deadline.
+        """
+        self._waking = False
+        while self._sleepers:
+            t, _, future = heapq.heappop(self._sleepers)
+            if future.done():
+                # cancelled while waiting
+                continue
+            self._run_until(t)
+            future.set_result(None)
+            break
+        if self._sleepers:
+            self._waking = True
+            asyncio.get_running_loop().call_soon(self._wake)
+
+    def monotonic(self):
+        """Returns the virtual time.
+
+        Returns:
+            float: virtual time (s)
+        """
+        return self.now
+
+    def monotonic_ns(self):
+        """Returns the virtual time in nanoseconds.
+
+        Returns:
+            int: virtual time (ns)
+        """
+        return int(self.now * 1000000000)
+
+    def count(self, gpio):
+        """Returns the number of rising edges on a GPIO up to now.
+
+        Args:
+            gpio (int): GPIO number
+
+        Returns:
+            int: number of rising edges
+        """
+        self._advance()
+        return self._rising.get(gpio, 0)
+
+    def edges(self, gpio):
+        """Returns the recorded edges of a GPIO in order of time.
+
+        Args:
+            gpio (int): GPIO number
+
+        Returns:
+            [(float, int)]: time (s) and level of every edge
+        """
+        self._advance()
+        return sorted((t, level) for t, g, level in self.edge_log if g == gpio)
+
+    def _event(self, command, *args):
+        self.events.append((self.now, command, args))
+
+    def _set_levels(self, t, on, off):
+        """Sets and clears GPIO bits at time t and records the edges."""
+        rising = on & ~self._high
+        falling = off & self._high
+        self._high = (self._high | on) & ~off
+        while rising:
+            bit = rising & -rising
+            g = bit.bit_length() - 1
+            self._rising[g] = self._rising.get(g, 0) + 1
+            if self.record_edges:
+                self.edge_log.append((t, g, 1))
+            rising ^= bit
+        if self.record_edges:
+            while falling:
+                bit = falling & -falling
+                self.edge_log.append((t, bit.bit_length() - 1, 0))
+                falling ^= bit
+
+    def _advance(self):
+        """Applies the waveform pulses and counts the PWM pulses up to now."""
+        while self._tx_next is not None and self._tx_next[0] <= self.now:
+            # waveforms do not reach GPIOs in ALT mode
+            t, on, off = self._tx_next
+            self._set_levels(t, on & ~self._alt, off & ~self._alt)
+            self._tx_next = next(self._tx, None)
+        for g, run in self._pwm.items():
+            self._pwm_count(g, run, self.now)
+
+    def _pwm_count(self, gpio, run, until):
+        """Counts the PWM pulses of a running PWM output started before until."""
+        frequency, high, first, counted = run
+        if until < first:
+            return
+        # pulses started before until, a pulse due at until is stopped in time
+        n = math.ceil(round((until - first) * frequency, 6))
+        if n > counted:
+            self._rising[gpio] = self._rising.get(gpio, 0) + n - counted
+            if self.record_edges:
+                for k in range(counted, n):
+                    self.edge_log.append((first + k / frequency, gpio, 1))
+                    self.edge_log.append((first + (k + high) / frequency, gpio, 0))
+            run[3] = n
+
+    def _pwm_set(self, gpio, frequency, high):
+        """Changes the PWM output of a GPIO at the current time."""
+        self._advance()
+        run = self._pwm.get(gpio)
+        if not high or not frequency:
+            self._pwm.pop(gpio, None)
+            self._high &= ~(1 << gpio)
+        elif run is None:
+            self._pwm[gpio] = [frequency, high, self.now, 0]
+        elif run[0] != frequency:
+            # the new period starts after the pulse in progress
+            self._pwm[gpio] = [frequency, high, self.now + 1 / frequency, 0]
+        else:
+            run[1] = high
+
+    # pigpio.pi API
+
+    def stop(self):
+        self._event("stop")
+        self.connected = False
+
+    def set_mode(self, gpio, mode):
+        self._event("set_mode", gpio, mode)
+        self.modes[gpio] = mode
+        self._alt &= ~(1 << gpio)
+        return 0
+
+    def write(self, gpio, level):
+        self._advance()
+        self._event("write", gpio, level)
+        if level:
+            self._set_levels(self.now, 1 << gpio, 0)
+        else:
+            self._set_levels(self.now, 0, 1 << gpio)
+        return 0
+
+    def set_bank_1(self, bits):
+        self._advance()
+        self._event("set_bank_1", bits)
+        self._set_levels(self.now, bits, 0)
+        return 0
+
+    def clear_bank_1(self, bits):
+        self._advance()
+        self._event("clear_bank_1", bits)
+        self._set_levels(self.now, 0, bits)
+        return 0
+
+    def read_bank_1(self):
+        self._advance()
+        self._event("read_bank_1")
+        return self._high
+
+    def set_PWM_frequency(self, gpio, frequency):
+        """Sets the software PWM frequency to the nearest one of the table.
+
+        Returns:
+            int: the frequency that was set (Hz)
+        """
+        actual = min(self.PWM_FREQUENCIES, key=lambda f: abs(f - frequency))
+        self._event("set_PWM_frequency", gpio, frequency, actual)
+        self._pwm_frequency[gpio] = actual
+        run = self._pwm.get(gpio)
+        if run is not None:
+            self._pwm_set(gpio, actual, run[1])
+        return actual
+
+    def set_PWM_dutycycle(self, gpio, dutycycle):
+        self._event("set_PWM_dutycycle", gpio, dutycycle)
+        self._pwm_set(gpio, self._pwm_frequency.get(gpio, 800), dutycycle / self.PWM_RANGE)
+        return 0
+
+    def hardware_PWM(self, gpio, frequency, dutycycle):
+        self._event("hardware_PWM", gpio, frequency, dutycycle)
+        self._alt |= 1 << gpio
+        self._pwm_set(gpio, frequency, dutycycle / 1000000)
+        return 0
+
+    def callback(self, gpio, edge=0, func=None):
+        """Returns a rising edge counter for the GPIO, with tally() and reset_tally()."""
+        if func is not None:
+            raise Exception("Error: The simulator only supports callbacks that count edges.")
+        return _Tally(self, gpio)
+
+    def get_current_tick(self):
+        return int(self.now * 1000000) & 0xFFFFFFFF
+
+    def wave_add_new(self):
+        self._wave = []
+        return 0
+
+    def wave_add_generic(self, pulses):
+        self._wave += [(p.gpio_on, p.gpio_off, p.delay) for p in pulses]
+        return len(self._wave)
+
+    def wave_create(self):
+        return self._wave_store(len(self._wave))
+
+    def wave_create_and_pad(self, percent):
+        if len(self._wave) > self.MAX_PULSES * percent // 100:
+            raise Exception("Error: Too many pulses for padded wave: " + str(len(self._wave)))
+        return self._wave_store(self.MAX_PULSES * percent // 100)
+
+    def _wave_store(self, size):
+        """Stores the new wave, using size pulses of the wave memory."""
+        if size + sum(self._wave_size.values()) > self.MAX_PULSES:
+            raise Exception("Error: Too many pulses for wave: " + str(len(self._wave))
+                            + ", " + str(sum(self._wave_size.values())) + " in use")
+        free = [wid for wid in range(self.MAX_WAVES) if wid not in self.waves]
+        if not free:
+            raise Exception("Error: Too many waves: " + str(len(self.waves)))
+        wid = free[0]
+        self.waves[wid] = self._wave
+        self._wave_size[wid] = size
+        self._wave = []
+        self._event("wave_create", wid, len(self.waves[wid]))
+        return wid
+
+    def wave_delete(self, wid):
+        self._advance()
+        self._event("wave_delete", wid)
+        if any(w == wid and end > self.now for _, end, w in self._tx_waves):
+            raise Exception("Error: Deleted wave " + str(wid) + " before it was transmitted.")
+        del self.waves[wid]
+        del self._wave_size[wid]
+        return 0
+
+    def wave_get_max_pulses(self):
+        return self.MAX_PULSES
+
+    def wave_chain(self, data):
+        """Starts transmitting a chain of waves, supports nested loops.
+        The chain length and number of loops are limited like pigpio.
+        """
+        loops = [0]
+
+        def _parse(i):
+            body = []
+            while i < len(data):
+                if data[i] == 255 and data[i + 1] == 0:
+                    loops[0] += 1
+                    loop, i = _parse(i + 2)
+                    body.append(loop)
+                elif data[i] == 255 and data[i + 1] == 1:
+                    return (body, data[i + 2] + (data[i + 3] << 8)), i + 4
+                else:
+                    body.append(self.waves[data[i]])
+                    i += 1
+            return (body, 1), i
+
+        def _duration(item):
+            if isinstance(item, list):
+                return sum(p[2] for p in item)
+            body, count = item
+            return count * sum(_duration(sub) for sub in body)
+
+        def _pulses(item, start, t):
+            # yields the pulses of the item from t (us after start)
+            if isinstance(item, list):
+                for on, off, delay in item:
+                    yield start + t / 1000000, on, off
+                    t += delay
+                return
+            body, count = item
+            for _ in range(count):
+                for sub in body:
+                    yield from _pulses(sub, start, t)
+                    t += _duration(sub)
+
+        self._advance()
+        self._event("wave_chain", list(data))
+        if len(data) > self.MAX_CHAIN:
+            raise Exception("Error: Wave chain too long: " + str(len(data)))
+        chain = _parse(0)[0]
+        if loops[0] > self.MAX_LOOPS:
+            raise Exception("Error: Too many loops in wave chain: " + str(loops[0]))
+        self._tx_waves = []
+        self._tx = _pulses(chain, self.now, 0)
+        self._tx_next = next(self._tx, None)
+        self._tx_end = self.now + _duration(chain) / 1000000
+        self._advance()
+        return 0
+
+    def wave_send_using_mode(self, wid, mode):
+        """Starts transmitting a wave once. In WAVE_MODE_ONE_SHOT_SYNC mode the
+        wave starts when the wave being transmitted ends, only one wave can wait.
+        """
+        self._advance()
+        self._event("wave_send_using_mode", wid, mode)
+        if mode not in (self.WAVE_MODE_ONE_SHOT, self.WAVE_MODE_ONE_SHOT_SYNC):
+            raise Exception("Error: The simulator only supports one shot waves: " + str(mode))
+        if self._tx_waves and self._tx_waves[-1][0] > self.now:
+            raise Exception("Error: A wave is already waiting for transmission.")
+        start = self.now
+        if mode == self.WAVE_MODE_ONE_SHOT_SYNC and self.now < self._tx_end:
+            start = self._tx_end
+        else:
+            self._tx = None
+            self._tx_next = None
+        t = start
+        pulses = []
+        for on, off, delay in self.waves[wid]:
+            pulses.append((t, on, off))
+            t += delay / 1000000
+        if self._tx_next is None:
+            self._tx = iter(pulses)
+            self._tx_next = next(self._tx, None)
+        else:
+            self._tx = itertools.chain(self._tx, pulses)
+        self._tx_end = t
+        self._tx_waves = [w for w in self._tx_waves if w[1] > self.now]
+        self._tx_waves.append((start, t, wid))
+        self._advance()
+        return 0
+
+    def wave_tx_at(self):
+        self._advance()
+        for start, end, wid in self._tx_waves:
+            if start <= self.now < end:
+                return wid
+        return self.NO_TX_WAVE if self.now >= self._tx_end else self.WAVE_NOT_FOUND
+
+    def wave_tx_busy(self):
+        self._advance()
+        return 1 if self.now < self._tx_end else 0
+
+    def wave_tx_stop(self):
+        self._advance()
+        self._event("wave_tx_stop")
+        self._tx_waves = []
+        self._tx = None
+        self._tx_next = None
+        self._tx_end = self.now
+        return 0
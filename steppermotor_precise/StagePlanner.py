@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+class StagePlanner:
+    """
+    This class plans the microstep stages of auto_step() moves without an
+    acceleration profile. All pulses have the same frequency, so a move is
+    faster when it takes fewer pulses. The motor accelerates by making
+    accel_microsteps pulses at a microstep size before switching to the next
+    larger size, and decelerates the same way in reverse.
+    The planner picks the largest size to reach, the cruise pulses at that
+    size and extra pulses at smaller sizes during acceleration for the
+    remainder, such that the move takes the fewest pulses and ends exactly at
+    the requested finest microstep. Moves that are too short for the full
+    acceleration reach fewer sizes instead of aborting.
+    With resonance bands, the motor does not cruise at a size whose speed is
+    inside a band, and the remainder is not spread over such sizes, so they
+    are passed in accel_microsteps pulses.
+    """
+
+    @staticmethod
+    def plan(steps, stepsizes, accel_microsteps, frequency=None, bands=()):
+        """Returns the time-optimal stages of a move.
+
+        Args:
+            steps (float): number of whole steps to make, the sign is ignored.
+            stepsizes ([float]): allowed microstep sizes, each a multiple of the smallest.
+            accel_microsteps (int): number of pulses at every microstep size
+                                    before switching to the next larger one.
+            frequency (int, optional): pulse frequency (Hz) of the move. Defaults to None.
+            bands ([(float, float)], optional): resonance bands, lower and upper speed
+                                                (whole steps/s). Defaults to ().
+
+        Returns:
+            [(float, int)]: microstep size and number of pulses of every stage, in order
+        """
+        sizes = sorted(stepsizes)
+        ticks = [int(round(size / sizes[0])) for size in sizes]
+        # can only make whole number of finest microsteps
+        total = int(abs(steps) / sizes[0])
+        accel_microsteps = abs(int(accel_microsteps))
+        # sizes at which the speed is inside a resonance band
+        resonant = [bool(frequency) and any(low < frequency * size < high for low, high in bands)
+                    for size in sizes]
+
+        # try every largest size, the ramp to it costs accel_microsteps pulses
+        # per smaller size in both directions
+        best = None
+        fallback = None
+        ramp = 0
+        for top in range(len(sizes)):
+            if top:
+                ramp += 2 * accel_microsteps * ticks[top - 1]
+            if ramp > total:
+                break
+            cruise, remainder = divmod(total - ramp, ticks[top])
+            extra = [0] * top
+            for i in reversed(range(top)):
+                if i and resonant[i]:
+                    continue
+                extra[i], remainder = divmod(remainder, ticks[i])
+            pulses = 2 * accel_microsteps * top + cruise + sum(extra)
+            if resonant[top] and cruise:
+                if fallback is None or pulses < fallback[0]:
+                    fallback = (pulses, top, cruise, extra)
+            elif best is None or pulses < best[0]:
+                best = (pulses, top, cruise, extra)
+
+        _, top, cruise, extra = best or fallback
+        stages = [(sizes[i], accel_microsteps + extra[i]) for i in range(top)]
+        stages.append((sizes[top], cruise))
+        stages += [(sizes[i], accel_microsteps) for i in reversed(range(top))]
+        return [(size, pulses) for size, pulses in stages if pulses]
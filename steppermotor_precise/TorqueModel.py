@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import math
+
+class TorqueModel:
+    """
+    This class models what a motor can do with its load: from the pull-out
+    torque versus speed curve of the motor, the inertia of rotor and load and
+    a safety margin it gives the highest acceleration the motor sustains at
+    every speed. A TorqueModel can be passed as the acceleration of
+    ProfileCompiler.compile() and auto_step(), so the profile accelerates as
+    fast as the load allows at every speed, and a heavier load automatically
+    gives a slower move.
+    A TorqueModel does not change, with_load() returns a model for another load.
+    """
+    STEPS_PER_REVOLUTION = 200  # whole steps per revolution of the motor
+    REACH_STEPS = 64        # integration steps of reachable_speed()
+    MARGIN = 0.3            # default fraction of the pull-out torque kept in reserve
+
+    def __init__(self, curve, rotor_inertia, load_inertia=0, margin=None, load_torque=0,
+                 steps_per_revolution=None, start_speed=None):
+        """Initialize the model.
+
+        Args:
+            curve ([(float, float)]): speed (whole steps/s) and pull-out torque (Nm)
+                                      of points of the torque curve. The torque is
+                                      interpolated linearly and is zero beyond
+                                      the last point.
+            rotor_inertia (float): inertia of the rotor (kg m^2).
+            load_inertia (float, optional): inertia of the load at the motor shaft
+                                            (kg m^2). Defaults to 0.
+            margin (float, optional): fraction of the pull-out torque kept in
+                                      reserve, 0..1. Defaults to None for MARGIN.
+            load_torque (float, optional): torque the load needs at any speed,
+                                           e.g. friction or gravity (Nm). Defaults to 0.
+            steps_per_revolution (int, optional): whole steps per revolution.
+                                                  Defaults to None for STEPS_PER_REVOLUTION.
+            start_speed (float, optional): pull-in speed (whole steps/s) the motor
+                                           starts at from standstill. Defaults to None
+                                           for the speed reached after the first
+                                           microstep, see starting_speed().
+        """
+        self.curve = tuple(sorted((float(speed), float(torque)) for speed, torque in curve))
+        if not self.curve or self.curve[0][0] < 0 or any(t < 0 for _, t in self.curve):
+            raise Exception("Error: Invalid torque curve: " + str(curve))
+        if rotor_inertia <= 0 or load_inertia < 0:
+            raise Exception("Error: Invalid inertia: " + str((rotor_inertia, load_inertia)))
+        self.margin = self.MARGIN if margin is None else margin
+        if not 0 <= self.margin < 1:
+            raise Exception("Error: Invalid safety margin: " + str(self.margin))
+        self.rotor_inertia = rotor_inertia
+        self.load_inertia = load_inertia
+        self.load_torque = load_torque
+        self.steps_per_revolution = steps_per_revolution or self.STEPS_PER_REVOLUTION
+        if self.acceleration(0) <= 0:
+            raise Exception("Error: Motor torque too low for the load.")
+        self.start_speed = start_speed
+
+    def __repr__(self):
+        return ("TorqueModel(" + repr(self.curve) + ", " + repr(self.rotor_inertia) +
+                ", load_inertia=" + repr(self.load_inertia) +
+                ", margin=" + repr(self.margin) +
+                ", load_torque=" + repr(self.load_torque) +
+                ", steps_per_revolution=" + repr(self.steps_per_revolution) +
+                ", start_speed=" + repr(self.start_speed) + ")")
+
+    def __eq__(self, other):
+        return isinstance(other, TorqueModel) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return hash(repr(self))
+
+    def with_load(self, load_inertia, load_torque=0):
+        """Returns the model of the motor with another load.
+
+        Args:
+            load_inertia (float): inertia of the load at the motor shaft (kg m^2).
+            load_torque (float, optional): torque the load needs (Nm). Defaults to 0.
+
+        Returns:
+            TorqueModel: model with the new load, and the start speed for that load
+        """
+        return TorqueModel(self.curve, self.rotor_inertia, load_inertia, self.margin,
+                           load_torque, self.steps_per_revolution)
+
+    def starting_speed(self, stepsize):
+        """Returns the speed the motor starts at from standstill: the pull-in
+        speed when specified, else the speed reached after accelerating over
+        the first microstep.
+
+        Args:
+            stepsize (float): finest microstep size of the move (whole steps)
+
+        Returns:
+            float: speed (whole steps/s)
+        """
+        return self.start_speed or math.sqrt(2 * self.acceleration(0) * stepsize)
+
+    def torque(self, speed):
+        """Returns the pull-out torque at a speed.
+
+        Args:
+            speed (float): speed (whole steps/s)
+
+        Returns:
+            float: pull-out torque (Nm)
+        """
+        if speed <= self.curve[0][0]:
+            return self.curve[0][1]
+        for (v0, t0), (v1, t1) in zip(self.curve, self.curve[1:]):
+            if speed <= v1:
+                return t0 + (t1 - t0) * (speed - v0) / (v1 - v0)
+        return 0.0
+
+    def acceleration(self, speed):
+        """Returns the highest acceleration the motor sustains at a speed,
+        with the safety margin of the torque kept in reserve.
+
+        Args:
+            speed (float): speed (whole steps/s)
+
+        Returns:
+            float: acceleration in whole steps/s^2, zero or negative above the
+                   speed the motor can reach
+        """
+        torque = (1 - self.margin) * self.torque(speed) - self.load_torque
+        alpha = torque / (self.rotor_inertia + self.load_inertia)
+        return alpha * self.steps_per_revolution / (2 * math.pi)
+
+    def max_speed(self):
+        """Returns the highest speed the motor can reach with the load.
+
+        Returns:
+            float: speed (whole steps/s)
+        """
+        # the acceleration is linear between the points of the curve
+        previous, a0 = 0, self.acceleration(0)
+        for speed, _ in self.curve:
+            a1 = self.acceleration(speed)
+            if a1 <= 0:
+                return previous + (speed - previous) * a0 / (a0 - a1)
+            previous, a0 = speed, a1
+        return previous
+
+    def lowest_acceleration(self, speed):
+        """Returns the lowest acceleration the motor sustains up to a speed,
+        e.g. to plan with a constant acceleration.
+
+        Args:
+            speed (float): speed (whole steps/s)
+
+        Returns:
+            float: acceleration in whole steps/s^2
+        """
+        speeds = [v for v, _ in self.curve if v < speed] + [0, speed]
+        return min(self.acceleration(v) for v in speeds)
+
+    def reachable_speed(self, speed, distance):
+        """Returns the speed reached by accelerating from a speed over a
+        distance, e.g. to plan junction speeds. The acceleration of every
+        integration step is the lower one of its start and (predicted) end
+        speed, so the speed is not overestimated.
+
+        Args:
+            speed (float): start speed (whole steps/s)
+            distance (float): distance (whole steps)
+
+        Returns:
+            float: speed (whole steps/s), at most max_speed() when starting below it
+        """
+        v_sq = speed * speed
+        step = distance / self.REACH_STEPS
+        for _ in range(self.REACH_STEPS):
+            a = self.acceleration(math.sqrt(v_sq))
+            predicted = math.sqrt(v_sq + 2 * max(a, 0) * step)
+            v_sq += 2 * max(min(a, self.acceleration(predicted)), 0) * step
+        return math.sqrt(v_sq)
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+import time
+import json
+
+class Tracer:
+    """
+    This class records typed motion events of a driver in a preallocated ring
+    buffer with monotonic timestamps (ns). Recording stores four numbers and
+    does no formatting, so it hardly disturbs the timing of a move. When the
+    buffer is full the oldest events are overwritten. The events can be
+    exported as Chrome trace / Perfetto JSON, or echoed as text for verbosity.
+    """
+    SIZE = 65536            # default number of events in the ring buffer
+
+    # event kinds and their arguments a, b
+    PIN_WRITE = 0           # bits of GPIOs set, bits of GPIOs cleared
+    PWM_FREQUENCY = 1       # frequency (Hz)
+    PWM_DUTYCYCLE = 2       # duty cycle 0..255
+    PULSE_START = 3         # number of pulses, frequency (Hz)
+    PULSE_END = 4           # number of pulses output
+    STEPSIZE = 5            # microstep size
+    DIRECTION = 6           # rotation direction
+    PHASE = 7               # microstep size, number of whole steps of an acceleration phase
+    ABORT = 8               # index of the mode in ABORT_MODES of the driver
+    MOVE_REPORT = 9         # whole steps made, pulse error of the position tracker
+    QUEUE_RUN = 10          # number of queued moves, number of pulses
+
+    NAMES = ("pin_write", "pwm_frequency", "pwm_dutycycle", "pulse_start", "pulse_end",
+             "stepsize", "direction", "phase", "abort", "move_report", "queue_run")
+    LEVELS = (3, 2, 3, 3, 3, 3, 2, 3, 2, 2, 2)   # verbosity at which an event kind is echoed
+    TEXT = ("Set GPIO bits {a:#x}, cleared GPIO bits {b:#x}",
+            "Frequency is set to {a}",
+            "Dutycycle is set to {a}",
+            "Sending {a} pulses...",
+            "Sent {a} pulses.",
+            "Step size is set to {a}",
+            "Set direction to {a}",
+            "Requesting {b} steps at step size {a}...",
+            "Aborting motion, mode {a}",
+            "Move made {a} steps, pulse error {b}",
+            "Ran {a} queued moves, {b} pulses")
+
+    def __init__(self, size=None, clock=None, echo=0):
+        """Initialize the tracer with an empty ring buffer.
+
+        Args:
+            size (int, optional): Number of events in the ring buffer. Defaults to None.
+            clock (function, optional): Returns monotonic time (ns). Defaults to None
+                                        for time.monotonic_ns.
+            echo (int, optional): Verbosity to print recorded events at, 0 for none.
+                                  Defaults to 0.
+        """
+        self.size = size or self.SIZE
+        self.clock = clock or time.monotonic_ns
+        self.echo = echo
+        self.count = 0          # total number of recorded events
+        self._times = [0] * self.size
+        self._kinds = [0] * self.size
+        self._a = [0] * self.size
+        self._b = [0] * self.size
+
+    def record(self, kind, a=0, b=0):
+        """Records an event.
+
+        Args:
+            kind (int): event kind, e.g. Tracer.PULSE_START
+            a (number, optional): first argument. Defaults to 0.
+            b (number, optional): second argument. Defaults to 0.
+        """
+        i = self.count % self.size
+        self._times[i] = self.clock()
+        self._kinds[i] = kind
+        self._a[i] = a
+        self._b[i] = b
+        self.count += 1
+        if self.echo >= self.LEVELS[kind]:
+            print(self.TEXT[kind].format(a=a, b=b))
+
+    def clear(self):
+        """Forgets all recorded events."""
+        self.count = 0
+
+    def events(self):
+        """Returns the recorded events that are still in the buffer.
+
+        Returns:
+            [(int, str, number, number)]: time (ns), kind name and arguments,
+                                          oldest first
+        """
+        first = max(0, self.count - self.size)
+        events = []
+        for n in range(first, self.count):
+            i = n % self.size
+            events.append((self._times[i], self.NAMES[self._kinds[i]], self._a[i], self._b[i]))
+        return events
+
+    def chrome_trace(self, name="motor"):
+        """Converts the recorded events to the Chrome trace event format, which
+        can be opened in chrome://tracing or ui.perfetto.dev. Pulse output is
+        shown as a duration, PWM settings as counters and the other events
+        as instants.
+
+        Args:
+            name (str, optional): name of the trace thread. Defaults to "motor".
+
+        Returns:
+            dict: trace with a traceEvents list
+        """
+        trace = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": 1,
+                  "args": {"name": name}}]
+        for t, kind, a, b in self.events():
+            event = {"name": kind, "ts": t / 1000, "pid": 1, "tid": 1}
+            if kind == "pulse_start":
+                event.update({"name": "pulse", "ph": "B", "args": {"pulses": a, "frequency": b}})
+            elif kind == "pulse_end":
+                event.update({"name": "pulse", "ph": "E", "args": {"output": a}})
+            elif kind == "pwm_frequency":
+                event.update({"ph": "C", "args": {"frequency": a}})
+            elif kind == "pwm_dutycycle":
+                event.update({"ph": "C", "args": {"dutycycle": a}})
+            else:
+                event.update({"ph": "i", "s": "t", "args": {"a": a, "b": b}})
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def export(self, filename, name="motor"):
+        """Writes the recorded events to a Chrome trace / Perfetto JSON file.
+
+        Args:
+            filename (str): name of the file to write
+            name (str, optional): name of the trace thread. Defaults to "motor".
+        """
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(name), f)
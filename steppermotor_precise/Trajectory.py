@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+__author__ = "Jan Bonne Aans"
+__copyright__ = "Copyright 2021, Jan Bonne Aans"
+__credits__ = []
+__license__ = "GPLv3"
+__version__ = "1"
+__maintainer__ = "Jan Bonne Aans"
+__email__ = "jbaans-at-gmail.com"
+__status__ = "Development"
+
+# Lazy readers and a writer of trajectory files for stream(). A trajectory
+# is a sequence of segments (steps, frequency, stepsize), read one at a time
+# so memory use does not depend on the length of the file. A stepsize of
+# None (empty in CSV, 0 in binary files) keeps the current microstep size.
+
+import csv
+import struct
+from fractions import Fraction
+
+SEGMENT = struct.Struct("<ddd")     # steps, frequency (Hz), stepsize
+BLOCK = 4096                        # segments per read of a binary file
+
+def read_csv(filename):
+    """Yields the segments of a CSV file with lines steps,frequency[,stepsize].
+    The stepsize may be a fraction, e.g. 1/32. Empty lines and lines starting
+    with # are skipped.
+
+    Args:
+        filename (str): name of the CSV file
+
+    Yields:
+        (float, float, float): steps, frequency (Hz) and stepsize or None
+    """
+    with open(filename, newline="") as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            stepsize = row[2].strip() if len(row) > 2 else ""
+            yield (float(row[0]), float(row[1]),
+                   float(Fraction(stepsize)) if stepsize else None)
+
+
+def read_binary(filename):
+    """Yields the segments of a binary file of SEGMENT records.
+
+    Args:
+        filename (str): name of the binary file
+
+    Yields:
+        (float, float, float): steps, frequency (Hz) and stepsize or None
+    """
+    with open(filename, "rb") as f:
+        while True:
+            data = f.read(SEGMENT.size * BLOCK)
+            if len(data) % SEGMENT.size:
+                raise Exception("Error: Truncated trajectory file: " + filename)
+            if not data:
+                return
+            for steps, frequency, stepsize in SEGMENT.iter_unpack(data):
+                yield steps, frequency, stepsize or None
+
+
+def write_binary(filename, segments):
+    """Writes segments to a binary file of SEGMENT records.
+
+    Args:
+        filename (str): name of the binary file
+        segments (iterable): (steps, frequency[, stepsize]) of every segment
+
+    Returns:
+        int: number of segments written
+    """
+    count = 0
+    with open(filename, "wb") as f:
+        for segment in segments:
+            stepsize = (segment[2] if len(segment) > 2 else None) or 0
+            f.write(SEGMENT.pack(segment[0], segment[1], stepsize))
+            count += 1
+    return count
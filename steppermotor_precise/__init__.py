@@ -3,3 +3,18 @@ from steppermotor_precise.AutoA4988 import AutoA4988
 from steppermotor_precise.DRV8825 import DRV8825
 from steppermotor_precise.AutoDRV8825 import AutoDRV8825
 from steppermotor_precise.BasicDriver import BasicDriver
+from steppermotor_precise.Profile import Profile, ProfileCompiler
+from steppermotor_precise.MultiAxis import MultiAxis
+from steppermotor_precise.PositionTracker import PositionTracker
+from steppermotor_precise.MotionPlanner import MotionPlanner
+from steppermotor_precise.GPIOBackend import GPIOBackend
+from steppermotor_precise.PigpioBackend import PigpioBackend
+from steppermotor_precise.SimulatorBackend import SimulatorBackend
+from steppermotor_precise.Tracer import Tracer
+from steppermotor_precise.ConnectionPool import ConnectionPool
+from steppermotor_precise.Calibration import Calibration
+from steppermotor_precise.StagePlanner import StagePlanner
+from steppermotor_precise.MoveCache import MoveCache
+from steppermotor_precise.MotionServer import MotionServer, MotionClient
+from steppermotor_precise.TorqueModel import TorqueModel
+from steppermotor_precise import Trajectory
@@ -0,0 +1,41 @@
+import pytest
+
+from steppermotor_precise import BasicDriver, Calibration, SimulatorBackend
+
+
+def _chain_stats(data):
+    """Returns the number of waves, loops and bytes of a wave chain."""
+    wids = set()
+    loops = 0
+    i = 0
+    while i < len(data):
+        if data[i] == 255 and data[i + 1] == 0:
+            loops += 1
+            i += 2
+        elif data[i] == 255 and data[i + 1] == 1:
+            i += 4
+        else:
+            wids.add(data[i])
+            i += 1
+    return len(wids), loops, len(data)
+
+
+@pytest.fixture(autouse=True)
+def calibration(tmp_path, monkeypatch):
+    """Keeps the calibration file of the tests out of the home directory."""
+    store = Calibration(str(tmp_path / "calibration.json"))
+    monkeypatch.setattr(BasicDriver, "CALIBRATION", store)
+    return store
+
+
+@pytest.fixture
+def sim():
+    return SimulatorBackend()
+
+
+@pytest.fixture
+def chains(sim):
+    """Returns a function that lists (waves, loops, bytes) of every wave chain sent."""
+    def _chains():
+        return [_chain_stats(args[0]) for _, command, args in sim.events if command == "wave_chain"]
+    return _chains
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from steppermotor_precise import AutoA4988, AutoDRV8825, SimulatorBackend, TorqueModel, Tracer
+
+GPIOS = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+
+
+def _assert_within_limits(chains):
+    assert chains()
+    for waves, loops, length in chains():
+        assert waves <= SimulatorBackend.MAX_WAVES
+        assert loops <= SimulatorBackend.MAX_LOOPS
+        assert length <= SimulatorBackend.MAX_CHAIN
+
+
+@pytest.mark.parametrize("driver, stepsize_min", [(AutoDRV8825, 1/32), (AutoA4988, 1/16)])
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+@pytest.mark.parametrize("steps, pulses", [(0.25, {1/32: 8, 1/16: 4}), (-1, {1/32: 24, 1/16: 16})])
+def test_auto_step_shorter_than_acceleration(sim, driver, stepsize_min, engine, steps, pulses):
+    # 8 pulses per size, ramping up to 1/16 and back down at 1/32 takes 16 pulses of 1/32
+    motor = driver(GPIOS, 1000, accel_microsteps=8, engine=engine, gpio=sim)
+    motor.enable()
+    made = motor.auto_step(steps, stepsize_min=stepsize_min, stepsize_max=1)
+
+    assert made == steps
+    assert sim.count(GPIOS["step"]) == pulses[stepsize_min]
+    assert motor.stepsize == stepsize_min
+
+
+@pytest.mark.parametrize("driver, stepsize_min", [(AutoDRV8825, 1/32), (AutoA4988, 1/16)])
+@pytest.mark.parametrize("steps", [100, 1000])
+def test_auto_step_profile_fits_wave_limits(sim, chains, driver, stepsize_min, steps):
+    motor = driver(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    motor.enable()
+    made = motor.auto_step(steps, frequency=32000, stepsize_min=stepsize_min, stepsize_max=1,
+                           acceleration=20000)
+    assert made == steps
+    _assert_within_limits(chains)
+
+
+def test_auto_step_torque_model_fits_wave_limits(sim, chains):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    curve = [(0, 0.45), (1000, 0.35), (2000, 0.2), (3500, 0)]
+    motor.set_torque_model(TorqueModel(curve, rotor_inertia=57e-7, margin=0.3))
+    motor.set_load(load_inertia=5e-5)
+    motor.enable()
+    assert motor.auto_step(200, frequency=32000, stepsize_min=1/32, stepsize_max=1/8) == 200
+    _assert_within_limits(chains)
+
+
+@pytest.mark.parametrize("torque_model", [False, True])
+def test_decel_abort_ramps_down_compiled_profile(sim, torque_model):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    kwargs = {"acceleration": 5000}
+    if torque_model:
+        curve = [(0, 0.45), (1000, 0.35), (2000, 0.2), (3500, 0)]
+        motor.set_torque_model(TorqueModel(curve, rotor_inertia=57e-7, margin=0.3))
+        kwargs = {}
+    motor.enable(wait=True)
+    sim.call_at(sim.monotonic() + 0.5, lambda: motor.abort("decel", wait=False))
+    made = motor.auto_step(3000, frequency=16000, stepsize_min=1/32, stepsize_max=1/4, **kwargs)
+
+    assert 0 < made <= 3000
+    assert motor.last_abort["mode"] == "decel"
+    assert motor.last_abort["latency_s"] > 0
+    edges = [t for t, level in sim.edges(GPIOS["step"]) if level]
+    assert edges[-1] > 0.5 + motor.last_abort["latency_s"] / 2
+
+
+def test_queue_move_with_torque_model(sim):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    curve = [(0, 0.45), (1000, 0.35), (2000, 0.2), (3500, 0)]
+    motor.set_torque_model(TorqueModel(curve, rotor_inertia=57e-7, margin=0.3))
+    motor.set_load(load_inertia=5e-5)
+    motor.enable()
+    # the cruise speed of 4000 steps/s is above the maximum speed of the load
+    for steps in (500, 500, 1000):
+        motor.queue_move(steps, frequency=32000, stepsize_min=1/32, stepsize_max=1/8)
+    assert motor.run_queue() == 2000
+
+
+def test_bands_checked_at_snapped_pwm_frequency(sim):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, hardware_pwm=False, gpio=sim)
+    motor.set_resonance_bands([(115, 130)])
+    # 900 Hz snaps to 1000 Hz: 125 steps/s at 1/8 is inside the band
+    stages, frequency = motor._stages(200, motor._stepsizes(1/32, 1/8), 900)
+    actual = motor._actual_frequency(frequency)
+    for size, _ in stages:
+        assert not 115 < actual * size < 130
+
+
+@pytest.mark.parametrize("bands", [(), ((115, 130),), ((60, 70), (115, 260))])
+@pytest.mark.parametrize("steps", [3, 50, 400])
+def test_estimate_auto_step_with_bands(sim, bands, steps):
+    pytest.importorskip("numpy")
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    motor.set_resonance_bands(bands)
+    motor.enable(wait=True)
+    estimate = AutoDRV8825.estimate_auto_step(steps, 1000, 1/32, 1/4, 8, bands=bands,
+                                              pwm_frequencies=())
+    start = sim.monotonic()
+    made = motor.auto_step(steps, frequency=1000, stepsize_min=1/32, stepsize_max=1/4)
+    assert estimate["stepsmade"][0] == made
+    assert estimate["pulses"][0] == sim.count(GPIOS["step"])
+    assert estimate["duration"][0] == pytest.approx(sim.monotonic() - start, rel=0.02)
+
+
+@pytest.mark.parametrize("bands", [(), ((60, 70), (115, 260))])
+def test_estimate_auto_step_at_snapped_pwm_frequency(sim, bands):
+    pytest.importorskip("numpy")
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, hardware_pwm=False, gpio=sim)
+    motor.set_resonance_bands(bands)
+    motor.enable(wait=True)
+    # 900 Hz snaps to 1000 Hz
+    estimate = AutoDRV8825.estimate_auto_step(400, 900, 1/32, 1/4, 8, bands=bands)
+    start = sim.monotonic()
+    made = motor.auto_step(400, frequency=900, stepsize_min=1/32, stepsize_max=1/4)
+    assert estimate["stepsmade"][0] == made
+    assert estimate["duration"][0] == pytest.approx(sim.monotonic() - start, rel=0.02)
+
+
+def test_queue_and_move_reports_are_traced(sim, capsys):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    motor.track_position(callback=False)
+    tracer = Tracer(clock=sim.monotonic_ns)
+    motor.set_tracer(tracer)
+    motor.enable()
+    for steps in (100, 200):
+        motor.queue_move(steps, frequency=16000, stepsize_min=1/32, stepsize_max=1/4,
+                         acceleration=20000)
+    assert motor.run_queue() == 300
+
+    kinds = [kind for _, kind, _, _ in tracer.events()]
+    assert kinds.count("queue_run") == 1
+    assert kinds.count("move_report") == 1
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("driver", [AutoDRV8825, AutoA4988])
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+def test_auto_move_to_reports_one_move(sim, driver, engine):
+    motor = driver(GPIOS, 1000, accel_microsteps=8, engine=engine, gpio=sim)
+    tracker = motor.track_position()
+    motor.enable(wait=True)
+    report = motor.move_to(100, auto=True, stepsize_min=1/16, stepsize_max=1/2)
+    assert tracker.moves == 1
+    assert report["steps"] == report["made"] == 100
+    assert report["pulses"] == sim.count(GPIOS["step"])
+    assert report["error"] == 0
+    assert motor.position == 100
+
+
+def test_aauto_step_reports_one_move(sim):
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+    tracker = motor.track_position()
+    motor.enable(wait=True)
+    made = asyncio.run(motor.aauto_step(-100, stepsize_min=1/16, stepsize_max=1/2))
+    assert made == -100
+    assert tracker.moves == 1
+    assert tracker.report["pulses"] == sim.count(GPIOS["step"])
+    assert motor.position == -100
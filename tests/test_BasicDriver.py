@@ -0,0 +1,261 @@
+import asyncio
+
+import pytest
+
+from steppermotor_precise import AutoDRV8825, DRV8825, SimulatorBackend
+
+GPIOS = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+
+
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+def test_step_enables_after_idle_timeout(sim, engine):
+    motor = DRV8825(GPIOS, 1000, engine=engine, gpio=sim)
+    motor.enable(idle_timeout=0.01)
+    sim.sleep(0.005)
+    assert motor.enabled
+    sim.sleep(0.01)
+    assert not motor.enabled
+
+    start = sim.monotonic()
+    assert motor.step(10) == 10.0
+    assert motor.enabled
+    enabled_at = [t for t, level in sim.edges(GPIOS["enable"]) if level][-1]
+    pulses = [t for t, level in sim.edges(GPIOS["step"]) if level and t >= start]
+    assert len(pulses) == 10
+    assert pulses[0] >= enabled_at + motor.WAIT_ENABLE
+
+
+def test_concurrent_wave_moves_are_serialized(sim):
+    x = DRV8825(GPIOS, 1000, engine="wave", gpio=sim)
+    y = DRV8825({"enable": 5, "step": 6, "direction": 7, "m0": 8, "m1": 9, "m2": 10}, 2000,
+                engine="wave", gpio=sim)
+    x.enable(wait=True)
+    y.enable(wait=True)
+
+    async def _main():
+        return await asyncio.gather(x.apulse(300), y.apulse(500))
+
+    assert asyncio.run(_main()) == [300, 500]
+    assert sim.count(GPIOS["step"]) == 300
+    assert sim.count(6) == 500
+
+
+def test_hardware_pwm_channel_is_not_shared(sim):
+    x = DRV8825(dict(GPIOS, step=12), 1000, gpio=sim)
+    y = DRV8825({"enable": 5, "step": 18, "direction": 7, "m0": 8, "m1": 9, "m2": 10}, 1000,
+                gpio=sim)
+    assert x.hardware_pwm
+    assert not y.hardware_pwm
+    with pytest.raises(Exception):
+        DRV8825({"enable": 5, "step": 18, "direction": 7, "m0": 8, "m1": 9, "m2": 10}, 1000,
+                hardware_pwm=True, gpio=sim)
+    x.close()
+    assert DRV8825({"enable": 5, "step": 18, "direction": 7, "m0": 8, "m1": 9, "m2": 10}, 1000,
+                   gpio=sim).hardware_pwm
+
+
+def test_wave_output_after_hardware_pwm(sim):
+    motor = AutoDRV8825(dict(GPIOS, step=12), 1000, accel_microsteps=8, gpio=sim)
+    motor.enable(wait=True)
+    assert motor.step(10) == 10.0
+    assert sim.count(12) == 10
+    assert motor.auto_step(10, frequency=1000, stepsize_min=1/32, stepsize_max=1/4,
+                           acceleration=2000) == 10
+    assert motor.last_pulses > 0
+    assert sim.count(12) == 10 + motor.last_pulses
+
+
+def test_step_times_snapped_pwm_frequency(sim):
+    pytest.importorskip("numpy")
+    motor = DRV8825(GPIOS, 900, hardware_pwm=False, gpio=sim)
+    motor.enable(wait=True)
+    start = sim.monotonic()
+    assert motor.step(100) == 100.0
+    assert motor.frequency == 1000
+    estimate = DRV8825.estimate_step(100, 900, 1)
+    assert estimate["duration"] == pytest.approx(sim.monotonic() - start, rel=0.02)
+
+
+@pytest.mark.parametrize("engine, settle", [("wave", None), ("pwm", 0)])
+def test_tracked_move_does_not_wait_for_edges(sim, engine, settle):
+    motor = DRV8825(GPIOS, 1000, engine=engine, gpio=sim)
+    motor.enable(wait=True)
+    start = sim.monotonic()
+    motor.step(100)
+    untracked = sim.monotonic() - start
+
+    tracker = motor.track_position(settle=settle)
+    assert (tracker._callback is None) == (engine == "wave")
+    start = sim.monotonic()
+    report = motor.move_to(100)
+    assert sim.monotonic() - start == pytest.approx(untracked, abs=0.001)
+    assert report["made"] == 100
+
+
+def test_wave_step_after_calibrate_on_hardware_pwm_gpio(sim):
+    motor = DRV8825(dict(GPIOS, step=12), 1000, engine="wave", gpio=sim)
+    assert motor.hardware_pwm
+    motor.enable(wait=True)
+    motor.calibrate(samples=5, save=False)
+    assert motor.step(10) == 10.0
+    assert sim.count(12) == 10
+
+
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+def test_immediate_abort_stops_step(sim, engine):
+    motor = DRV8825(GPIOS, 1000, engine=engine, gpio=sim)
+    motor.enable(wait=True)
+    start = sim.monotonic()
+    sim.call_at(start + 0.2, lambda: motor.abort(wait=False))
+    made = motor.step(1000)
+
+    assert 150 <= made <= 250
+    assert motor.last_abort["mode"] == "immediate"
+    assert motor.last_abort["latency_s"] < 0.01
+    assert sim.count(GPIOS["step"]) == pytest.approx(made, abs=2)
+    assert sim.monotonic() - start < 0.25
+
+
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+def test_immediate_abort_stops_apulse(sim, engine):
+    motor = DRV8825(GPIOS, 1000, engine=engine, gpio=sim)
+    motor.enable(wait=True)
+    start = sim.monotonic()
+    sim.call_at(start + 0.2, lambda: motor.abort(wait=False))
+    pulses = asyncio.run(motor.apulse(1000))
+
+    assert 190 <= pulses <= 210
+    assert motor.last_pulses == pulses
+    assert motor.last_abort["latency_s"] <= motor.ABORT_POLL + 0.001
+    assert sim.count(GPIOS["step"]) == pytest.approx(pulses, abs=2)
+    assert sim.monotonic() - start < 0.25
+
+
+def test_abort_cannot_wait_in_event_loop(sim):
+    motor = DRV8825(GPIOS, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+
+    async def _main():
+        move = asyncio.ensure_future(motor.astep(1000))
+        await sim.asleep(0.1)
+        with pytest.raises(Exception, match="wait=False"):
+            motor.abort()
+        motor.abort(wait=False)
+        return await move
+
+    assert 0 < asyncio.run(_main()) < 1000
+
+
+def test_simulator_calibration_is_not_persisted(sim, calibration):
+    motor = DRV8825(GPIOS, 1000, gpio=sim)
+    motor.calibrate(samples=5)
+    assert motor.calibration
+    assert calibration.load(sim) is None
+    assert DRV8825(GPIOS, 1000, gpio=SimulatorBackend()).calibration is None
+
+
+def _gpio_commands(sim):
+    return [command for _, command, _ in sim.events
+            if command in ("write", "set_bank_1", "clear_bank_1")]
+
+
+def test_repeated_direction_and_stepsize_send_no_commands(sim):
+    motor = DRV8825(GPIOS, 1000, gpio=sim)
+    motor.set_stepsize(1/8, direction=False)
+    sent = len(_gpio_commands(sim))
+    saved = motor.commands_saved
+
+    for _ in range(3):
+        motor.set_direction(False)
+        motor.set_stepsize(1/8)
+        motor.set_stepsize(1/8, direction=False)
+    assert len(_gpio_commands(sim)) == sent
+    assert motor.commands_saved > saved
+
+    motor.set_direction(True)
+    assert _gpio_commands(sim)[sent:] == ["set_bank_1"]
+
+
+def test_resync_reads_levels_after_external_write(sim):
+    motor = DRV8825(GPIOS, 1000, gpio=sim)
+    motor.set_direction(True)
+    # another program clears the direction GPIO behind the shadow state
+    sim.write(GPIOS["direction"], 0)
+    sent = len(_gpio_commands(sim))
+    motor.set_direction(True)
+    assert len(_gpio_commands(sim)) == sent
+
+    motor.resync()
+    assert sim.events[-1][1] == "read_bank_1"
+    motor.set_direction(True)
+    assert _gpio_commands(sim)[sent:] == ["set_bank_1"]
+    assert sim.read_bank_1() & (1 << GPIOS["direction"])
+
+
+def test_stream_carries_microstep_fractions(sim):
+    motor = DRV8825(GPIOS, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+    # 1.6 microsteps per segment, the fractions add up to 16 whole microsteps
+    made = motor.stream([(0.05, 2000, 1/32)] * 10)
+
+    assert made == pytest.approx(0.5)
+    assert motor.last_pulses == 16
+    assert sim.count(GPIOS["step"]) == 16
+    assert motor.stepsize == 1/32
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_stream_reports_steps_made_when_aborted(sim, direction):
+    motor = DRV8825(GPIOS, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+    start = sim.monotonic()
+    sim.call_at(start + 1.5, lambda: motor.abort(wait=False))
+    # 1 s of full steps, then microsteps of 1/4, 1000 pulses per second
+    segments = [(direction * 100, 1000, 1)] * 10 + [(direction * 25, 1000, 1/4)] * 100
+    made = motor.stream(segments)
+
+    pulses = motor.last_pulses
+    assert 1400 < pulses < 1600
+    assert sim.count(GPIOS["step"]) == pytest.approx(pulses, abs=2)
+    assert made == pytest.approx(direction * (1000 + (pulses - 1000) / 4))
+    assert motor.stepsize == 1/4
+    assert motor.direction == (direction > 0)
+    assert len(sim.waves) == 0
+
+
+@pytest.mark.parametrize("direction", [True, False])
+def test_jog_abort_keeps_waves_bounded(sim, direction):
+    motor = DRV8825(GPIOS, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+    sim.call_at(sim.monotonic() + 5, lambda: motor.abort(wait=False))
+    made = motor.jog(4000, direction, stepsize=1/4)
+
+    live = most = 0
+    for _, command, _ in sim.events:
+        live += {"wave_create": 1, "wave_delete": -1}.get(command, 0)
+        most = max(most, live)
+    assert most <= motor.STREAM_WAVES
+    assert len(sim.waves) == 0
+    pulses = sim.count(GPIOS["step"])
+    assert pulses == pytest.approx(5 * 4000, abs=10)
+    assert motor.last_pulses == pytest.approx(pulses, abs=2)
+    assert made == (1 if direction else -1) * motor.last_pulses / 4
+
+
+def test_deadline_timing_reports_last_timing(sim):
+    motor = DRV8825(GPIOS, 1000, gpio=sim)
+    motor.enable(wait=True)
+    assert motor.timing == "sleep"
+    assert motor.step(100) == 100.0
+    assert motor.last_timing is None
+
+    motor.timing = "deadline"
+    assert motor.step(100) == 100.0
+    timing = motor.last_timing
+    assert timing["pulses"] == 100
+    assert timing["planned_s"] == pytest.approx(0.1)
+    assert timing["actual_s"] == pytest.approx(0.1 - timing["compensation_s"], abs=0.001)
+    assert abs(timing["error_pulses"]) < 1
+    assert timing["uncompensated_error_pulses"] == pytest.approx(
+        timing["error_pulses"] + timing["compensation_s"] * 1000)
+    assert sim.count(GPIOS["step"]) == 200
@@ -0,0 +1,74 @@
+import pytest
+
+from steppermotor_precise import BasicDriver, ConnectionPool, DRV8825, SimulatorBackend
+
+GPIOS = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+
+
+@pytest.fixture
+def pool():
+    connections = []
+
+    def _connect(host, port):
+        connection = SimulatorBackend()
+        connection.key = (host, port)
+        connections.append(connection)
+        return connection
+
+    pool = ConnectionPool(_connect)
+    pool.connections = connections
+    return pool
+
+
+def test_acquire_reuses_connection_per_daemon(pool):
+    first = pool.acquire("pi1", 8888)
+    assert pool.acquire("pi1", 8888) is first
+    other = pool.acquire("pi2", 8888)
+    assert other is not first
+    assert len(pool.connections) == 2
+    assert pool.info() == {("pi1", 8888): 2, ("pi2", 8888): 1}
+
+
+def test_release_stops_connection_after_last_user(pool):
+    connection = pool.acquire("pi1", 8888)
+    pool.acquire("pi1", 8888)
+
+    assert pool.release(connection)
+    assert connection.connected
+    assert pool.info() == {("pi1", 8888): 1}
+
+    assert pool.release(connection)
+    assert not connection.connected
+    assert pool.info() == {}
+    assert not pool.release(connection)
+    # the next user connects again
+    assert pool.acquire("pi1", 8888) is not connection
+
+
+def test_release_of_foreign_connection(pool):
+    assert not pool.release(SimulatorBackend())
+
+
+def test_unconnected_connection_is_not_pooled():
+    def _connect(host, port):
+        connection = SimulatorBackend()
+        connection.connected = False
+        return connection
+
+    pool = ConnectionPool(_connect)
+    assert not pool.acquire("pi1", 8888).connected
+    assert pool.info() == {}
+
+
+def test_drivers_share_pooled_connection(pool, monkeypatch):
+    monkeypatch.setattr(BasicDriver, "POOL", pool)
+    x = DRV8825(GPIOS, 1000)
+    y = DRV8825({"enable": 5, "step": 6, "direction": 7, "m0": 8, "m1": 9, "m2": 10}, 1000)
+    assert x.gpio is y.gpio
+    assert len(pool.connections) == 1
+
+    x.close()
+    assert y.gpio.connected
+    y.close()
+    assert not y.gpio.connected
+    assert pool.info() == {}
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+
+import pytest
+
+from steppermotor_precise import AutoDRV8825, MotionClient, MotionServer
+
+GPIOS = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+
+
+def test_close_keeps_socket_of_other_server(sim, tmp_path):
+    path = str(tmp_path / "motion.sock")
+
+    async def _main():
+        server = MotionServer(path)
+        await server.start()
+        other = MotionServer(path)
+        with pytest.raises(Exception, match="already running"):
+            await other.start()
+        await other.close()
+        assert os.path.exists(path)
+        await server.close()
+        assert not os.path.exists(path)
+
+    asyncio.run(_main())
+
+
+def test_close_with_connected_client_is_quiet(sim, tmp_path, caplog):
+    path = str(tmp_path / "motion.sock")
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+
+    async def _main():
+        server = MotionServer(path)
+        server.add_motor("x", motor)
+        await server.start()
+        client = MotionClient(path)
+        await client.connect()
+        assert await client.call("x", "enable", wait=True) is None
+        assert await client.call("x", "step", steps=10) == 10
+        await server.close()
+        await client.close()
+
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        asyncio.run(_main())
+    assert not caplog.records
+
+
+def test_abort_request_stops_queued_move(sim, tmp_path):
+    path = str(tmp_path / "motion.sock")
+    motor = AutoDRV8825(GPIOS, 1000, accel_microsteps=8, engine="wave", gpio=sim)
+
+    async def _main():
+        server = MotionServer(path)
+        server.add_motor("x", motor)
+        await server.start()
+        try:
+            async with MotionClient(path) as client:
+                await client.call("x", "enable", wait=True)
+                move = client.send("x", "auto_step", steps=2000, stepsize_min=1/8,
+                                   stepsize_max=1/8)
+                await client.flush()
+                while not sim.count(GPIOS["step"]):
+                    await asyncio.sleep(0.001)
+                await client.call("x", "abort")
+                return await move
+        finally:
+            await server.close()
+
+    made = asyncio.run(_main())
+    assert 0 < made < 2000
+    assert motor.last_abort["mode"] == "immediate"
+
+
+def test_connection_reset_fails_pending_requests(tmp_path):
+    path = str(tmp_path / "motion.sock")
+
+    async def _silent(reader, writer):
+        # a server that takes requests and never completes them
+        await reader.read()
+        writer.close()
+
+    async def _main():
+        server = await asyncio.start_unix_server(_silent, path)
+        try:
+            async with MotionClient(path) as client:
+                moves = [client.send("x", "step", steps=10), client.send("y", "step", steps=20)]
+                await client.flush()
+                # the stream protocol is told of the reset, as by the transport
+                client._writer.transport.get_protocol().connection_lost(
+                    ConnectionResetError("Connection reset by peer"))
+                for move in moves:
+                    with pytest.raises(ConnectionResetError):
+                        await asyncio.wait_for(move, 1)
+                assert not client._pending
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(_main())
@@ -0,0 +1,52 @@
+import struct
+
+from steppermotor_precise import MoveCache, ProfileCompiler
+
+
+def _profile():
+    return ProfileCompiler().compile(200, 8000, 500, 20000, [1/16, 1/8, 1/4])
+
+
+def test_saved_profile_is_reloaded_from_mapped_file(tmp_path):
+    filename = str(tmp_path / "moves.bin")
+    profile = _profile()
+    cache = MoveCache(filename, stamp=b"v1")
+    cache.add(("move", 200), profile)
+    cache.close()
+
+    reopened = MoveCache(filename, stamp=b"v1")
+    assert len(reopened) == 1
+    stored = reopened.get(("move", 200))
+    assert stored.steps == profile.steps
+    assert stored.phases == [(size, list(periods)) for size, periods in profile.phases]
+    assert stored.pulses == profile.pulses
+    assert reopened.hits == 1
+    assert reopened.get(("move", 100)) is None
+    reopened.close()
+
+
+def test_periods_are_stored_little_endian(tmp_path):
+    filename = str(tmp_path / "moves.bin")
+    profile = _profile()
+    cache = MoveCache(filename)
+    cache.add(("move", 200), profile)
+    cache.close()
+
+    size, periods = profile.phases[0]
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert struct.pack("<d", size) + struct.pack("<I", len(periods)) + \
+        struct.pack("<" + str(len(periods)) + "I", *periods) in data
+
+
+def test_stale_stamp_invalidates_cache(tmp_path):
+    filename = str(tmp_path / "moves.bin")
+    cache = MoveCache(filename, stamp=MoveCache.make_stamp({"latency": 1}, "1"))
+    cache.add(("move", 200), _profile())
+    cache.close()
+
+    for stamp in (MoveCache.make_stamp({"latency": 2}, "1"),
+                  MoveCache.make_stamp({"latency": 1}, "2")):
+        stale = MoveCache(filename, stamp=stamp)
+        assert len(stale) == 0
+        assert stale.get(("move", 200)) is None
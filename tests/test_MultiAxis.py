@@ -0,0 +1,30 @@
+from steppermotor_precise import DRV8825, MultiAxis, SimulatorBackend
+
+GPIOS_X = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+GPIOS_Y = {"enable": 5, "step": 6, "direction": 7, "m0": 8, "m1": 9, "m2": 10}
+
+
+def _axes(sim):
+    x = DRV8825(GPIOS_X, 1000, engine="wave", gpio=sim)
+    y = DRV8825(GPIOS_Y, 1000, engine="wave", gpio=sim)
+    x.enable()
+    y.enable()
+    return MultiAxis([x, y], frequency=4000)
+
+
+def test_move_fits_wave_limits(sim, chains):
+    axes = _axes(sim)
+    assert axes.move([1000, 700]) == [1000.0, 700.0]
+    assert sim.count(GPIOS_X["step"]) == 1000
+    assert sim.count(GPIOS_Y["step"]) == 700
+    for waves, loops, length in chains():
+        assert waves <= SimulatorBackend.MAX_WAVES
+        assert loops <= SimulatorBackend.MAX_LOOPS
+        assert length <= SimulatorBackend.MAX_CHAIN
+
+
+def test_long_move_is_streamed(sim):
+    axes = _axes(sim)
+    assert axes.move([20000, -13000]) == [20000.0, -13000.0]
+    assert sim.count(GPIOS_X["step"]) == 20000
+    assert sim.count(GPIOS_Y["step"]) == 13000
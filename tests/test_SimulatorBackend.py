@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from steppermotor_precise import DRV8825
+
+GPIOS_X = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+GPIOS_Y = {"enable": 5, "step": 6, "direction": 7, "m0": 8, "m1": 9, "m2": 10}
+
+
+def test_asleep_shares_the_virtual_clock(sim):
+    async def _sleep(seconds, order):
+        await sim.asleep(seconds)
+        order.append((seconds, sim.monotonic()))
+
+    order = []
+
+    async def _main():
+        await asyncio.gather(_sleep(0.3, order), _sleep(0.1, order), _sleep(0.2, order))
+
+    asyncio.run(_main())
+    assert order == [(0.1, 0.1), (0.2, 0.2), (0.3, 0.3)]
+
+
+def test_concurrent_pwm_moves(sim):
+    x = DRV8825(GPIOS_X, 1000, gpio=sim, hardware_pwm=False)
+    y = DRV8825(GPIOS_Y, 1000, gpio=sim, hardware_pwm=False)
+    x.enable(wait=True)
+    y.enable(wait=True)
+    start = sim.monotonic()
+
+    async def _main():
+        return await asyncio.gather(x.astep(100), y.astep(100))
+
+    assert asyncio.run(_main()) == [100.0, 100.0]
+    assert sim.count(GPIOS_X["step"]) == 100
+    assert sim.count(GPIOS_Y["step"]) == 100
+    # the moves ran at the same time
+    assert sim.monotonic() - start < 0.15
+
+
+def _bits(gpios, *names):
+    return sum(1 << gpios[name] for name in names)
+
+
+@pytest.mark.parametrize("pulses", [65535, 65536, 70000, 2 * 65535 + 7])
+def test_looped_wave_makes_exact_pulse_count(sim, chains, pulses):
+    motor = DRV8825(GPIOS_X, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+    assert motor.pulse_runs([(20, pulses, 0, 0)]) == pulses
+
+    assert sim.count(GPIOS_X["step"]) == pulses
+    # one chain with loop counters, not streamed
+    [(waves, loops, _)] = chains()
+    assert loops >= 1
+    assert not [command for _, command, _ in sim.events if command == "wave_send_using_mode"]
+
+
+def test_pulse_over_loop_limit_makes_exact_pulse_count(sim):
+    motor = DRV8825(GPIOS_X, 1000, engine="wave", gpio=sim)
+    motor.enable(wait=True)
+    assert motor.pulse(70000, frequency=50000) == 70000
+    assert sim.count(GPIOS_X["step"]) == 70000
+
+
+def test_stepsize_and_direction_in_one_bank_write(sim):
+    motor = DRV8825(GPIOS_X, 1000, stepsize=1/4, gpio=sim)
+    motor.set_direction(True)
+    start = len(sim.events)
+    motor.set_stepsize(1/32, direction=False)
+
+    writes = [(command, args) for _, command, args in sim.events[start:]
+              if command in ("write", "set_bank_1", "clear_bank_1")]
+    assert writes == [("set_bank_1", (_bits(GPIOS_X, "m0", "m2"),)),
+                      ("clear_bank_1", (_bits(GPIOS_X, "m1", "direction"),))]
+    levels = sim.read_bank_1()
+    assert [bool(levels & _bits(GPIOS_X, name)) for name in ("m0", "m1", "m2", "direction")] \
+        == [True, False, True, False]
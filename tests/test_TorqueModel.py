@@ -0,0 +1,20 @@
+import math
+
+from steppermotor_precise import ProfileCompiler, TorqueModel
+
+CURVE = [(0, 0.45), (1000, 0.35), (2000, 0.2), (3500, 0)]
+
+
+def test_starting_speed_after_first_microstep():
+    model = TorqueModel(CURVE, rotor_inertia=57e-7, margin=0.3).with_load(5e-5)
+    assert math.isclose(model.starting_speed(1/32), math.sqrt(2 * model.acceleration(0) / 32))
+    assert TorqueModel(CURVE, 57e-7, start_speed=50).starting_speed(1/32) == 50
+
+
+def test_profile_ramps_from_starting_speed():
+    model = TorqueModel(CURVE, rotor_inertia=57e-7, margin=0.3).with_load(5e-5)
+    start_frequency = int(model.starting_speed(1/32) * 32)
+    assert start_frequency < 32000
+    profile = ProfileCompiler().compile(2000, 32000, start_frequency, model, [1/32, 1/16, 1/8])
+    periods = profile.phases[0][1]
+    assert periods[0] > periods[1] > round(1000000 / 32000)
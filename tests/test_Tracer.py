@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from steppermotor_precise import DRV8825, Tracer
+
+GPIOS = {"enable": 23, "step": 24, "direction": 25, "m0": 22, "m1": 17, "m2": 4}
+
+
+@pytest.mark.parametrize("engine", ["pwm", "wave"])
+def test_export_has_matching_pulse_events(sim, tmp_path, engine):
+    motor = DRV8825(GPIOS, 1000, engine=engine, gpio=sim)
+    tracer = Tracer(clock=sim.monotonic_ns)
+    motor.set_tracer(tracer)
+    motor.enable(wait=True)
+    for steps in (10, -20, 30):
+        motor.step(steps, frequency=2000)
+    filename = tmp_path / "trace.json"
+    tracer.export(str(filename), name="x")
+
+    with open(filename) as f:
+        events = json.load(f)["traceEvents"]
+    assert events[0]["args"]["name"] == "x"
+    pulses = [event for event in events if event["name"] == "pulse"]
+    assert [event["ph"] for event in pulses] == ["B", "E"] * 3
+    for begin, end in zip(pulses[::2], pulses[1::2]):
+        assert begin["ts"] <= end["ts"]
+        assert begin["args"]["pulses"] == end["args"]["output"]
+    assert [begin["args"]["pulses"] for begin in pulses[::2]] == [10, 20, 30]
+
+
+def test_ring_buffer_keeps_the_newest_events():
+    tracer = Tracer(size=4, clock=iter(range(10)).__next__)
+    for n in range(6):
+        tracer.record(Tracer.PULSE_END, n)
+    assert [a for _, _, a, _ in tracer.events()] == [2, 3, 4, 5]
+    assert tracer.chrome_trace()["traceEvents"][1]["ts"] == 2 / 1000
+
+
+def test_no_pulses_prints_only_with_verbosity(sim, capsys):
+    assert DRV8825(GPIOS, 1000, gpio=sim).pulse(0) == 0
+    assert capsys.readouterr().out == ""
+    assert DRV8825(GPIOS, 1000, verbosity=1, gpio=sim).pulse(0) == 0
+    assert "aborting" in capsys.readouterr().out
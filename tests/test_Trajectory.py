@@ -0,0 +1,40 @@
+import pytest
+
+from steppermotor_precise import Trajectory
+
+
+def test_read_csv_parses_fractions_and_skips_comments(tmp_path):
+    filename = tmp_path / "trajectory.csv"
+    filename.write_text("# steps,frequency,stepsize\n"
+                        "100,1000,1/32\n"
+                        "\n"
+                        "-2.5,500,\n"
+                        "10,2000\n"
+                        "  # indented comment\n"
+                        "1,250,0.5\n")
+
+    assert list(Trajectory.read_csv(str(filename))) == [
+        (100.0, 1000.0, 1/32),
+        (-2.5, 500.0, None),
+        (10.0, 2000.0, None),
+        (1.0, 250.0, 0.5),
+    ]
+
+
+def test_binary_round_trip(tmp_path):
+    filename = str(tmp_path / "trajectory.bin")
+    segments = [(100, 1000, 1/32), (-2.5, 500), (10, 2000, None)]
+    assert Trajectory.write_binary(filename, iter(segments)) == 3
+
+    assert list(Trajectory.read_binary(filename)) == [
+        (100.0, 1000.0, 1/32),
+        (-2.5, 500.0, None),
+        (10.0, 2000.0, None),
+    ]
+
+
+def test_read_binary_rejects_truncated_file(tmp_path):
+    filename = tmp_path / "trajectory.bin"
+    filename.write_bytes(Trajectory.SEGMENT.pack(1, 1000, 1) + b"\0")
+    with pytest.raises(Exception, match="Truncated"):
+        list(Trajectory.read_binary(str(filename)))